@@ -1,9 +1,14 @@
 from typing import List
+import re
+import asyncio
+import zipfile
 import uuid
 import os
 import logging
 import shutil
 from pathlib import Path
+from dataclasses import replace
+from urllib.parse import quote
 from fastapi import (
     APIRouter,
     UploadFile,
@@ -13,10 +18,49 @@ from fastapi import (
     Form,
     Request,
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from app.services.pdf_service import PDFService
-from app.services.image_service import ImageService
+from app.services.image_service import OUTPUT_FORMATS, ImageService
+from app.services.bulk_remove_bg_service import (
+    IMAGE_EXTENSIONS,
+    BulkRemoveBgError,
+    BulkRemoveBgService,
+    collect_images,
+)
+from app.services.font_service import FontService
+from app.services.pdf_page_service import (
+    PDFPageService,
+    PDF_INPUT_ERRORS,
+    parse_page_ranges,
+)
+from app.services.render_service import (
+    RenderService,
+    RENDER_FORMATS,
+    RENDER_MAX_DPI,
+    page_count,
+)
+from app.utils.streaming import stream_writer
+from app.utils.multipart_ingest import IngestError, IngestedForm, StreamingFormIngest
+from app.utils.tracing import span
+from app.services.compression_profiles import (
+    DEFAULT_COMPRESSION_PROFILE,
+    PROFILES,
+    get_profile,
+    profile_names,
+)
+from app.services.target_size_service import (
+    TargetSizeService,
+    TargetSizeError,
+    parse_size,
+)
+from app.services.preflight_service import PreflightService, PreflightError
+from app.services.result_store import ResultStore, RESULT_TTL_SECONDS
+from app.services.upload_session_service import (
+    UploadSessionService,
+    UploadSessionError,
+)
+from app.services.ocr_service import OCRService, OCRError, installed_languages, validate_lang
 from app.utils.security import (
     validate_file_size,
     validate_file_extension,
@@ -33,11 +77,14 @@ router = APIRouter()
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "outputs")
 
-ALLOWED_QUALITIES = ["low", "medium", "high"]
+ALLOWED_QUALITIES = profile_names()
 
 
 class QualityInput(BaseModel):
-    quality: str = Field(default="medium", pattern="^(low|medium|high)$")
+    quality: str = Field(
+        default=DEFAULT_COMPRESSION_PROFILE,
+        pattern=f"^({'|'.join(map(re.escape, ALLOWED_QUALITIES))})$",
+    )
 
 
 def remove_file(path: str):
@@ -59,66 +106,188 @@ def remove_directory(path: str):
         logger.error(f"Error removing directory {path}: {e}")
 
 
-@router.post("/compress")
-@limiter.limit("10/minute")
-async def compress_pdf(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
-    quality: str = Form("medium"),
-):
-    if quality not in ALLOWED_QUALITIES:
+DELIVERY_MODES = ("file", "link")
+
+
+def check_delivery(delivery: str):
+    if delivery not in DELIVERY_MODES:
         raise HTTPException(
             status_code=400,
-            detail=f"Quality must be one of: {', '.join(ALLOWED_QUALITIES)}",
+            detail=f"Delivery must be one of: {', '.join(DELIVERY_MODES)}",
         )
 
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="Filename is required")
 
-    if not validate_file_extension(file.filename):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+def resolve_ocr_lang(ocr_lang: str | None) -> str:
+    if installed_languages() is None:
+        raise HTTPException(status_code=503, detail="OCR is not available on this server")
+    try:
+        return validate_lang(ocr_lang)
+    except OCRError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def deliver_pdf(
+    request: Request,
+    path: str,
+    filename: str,
+    delivery: str,
+    headers: dict | None = None,
+):
+    """
+    Return a generated PDF in the response ("file"), or retain it for
+    RESULT_TTL_SECONDS and return a download link ("link") that supports
+    Range requests, so viewers can load linearized output incrementally.
+    """
+    if delivery == "link":
+        with span("deliver.keep"):
+            stored = await asyncio.to_thread(ResultStore.keep, path, filename, "application/pdf")
+        return JSONResponse(
+            {
+                "download_url": str(request.url_for("download_result", token=stored.token)),
+                "filename": stored.filename,
+                "size": stored.size,
+                "expires_in": RESULT_TTL_SECONDS,
+            },
+            headers=headers,
+        )
+
+    return FileResponse(
+        path=path,
+        filename=filename,
+        media_type="application/pdf",
+        headers=headers,
+    )
+
+
+@router.get("/download/{token}", name="download_result")
+async def download_result(token: str):
+    stored = ResultStore.get(token)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+
+    return FileResponse(
+        path=stored.path,
+        filename=stored.filename,
+        media_type=stored.media_type,
+        headers={"Cache-Control": "private, max-age=300"},
+    )
+
+
+COMPRESS_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "upload_id": {"type": "string"},
+                        "quality": {"type": "string", "default": DEFAULT_COMPRESSION_PROFILE},
+                        "target_size": {"type": "string", "example": "2MB"},
+                        "linearize": {"type": "boolean", "default": False},
+                        "delivery": {"type": "string", "enum": list(DELIVERY_MODES)},
+                        "ocr": {"type": "boolean", "default": False},
+                        "ocr_lang": {"type": "string"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+async def read_form_options(request: Request, destination, max_size: int) -> IngestedForm:
+    """
+    Multipart bodies are parsed straight from the request stream (file parts
+    go directly to their final path); url-encoded bodies carry options only.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        form = await request.form()
+        return IngestedForm(fields={key: str(value) for key, value in form.items()})
+
+    try:
+        return await StreamingFormIngest(
+            request, destination, max_size, signature=b"%PDF"
+        ).parse()
+    except IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
+
+@router.post("/compress", openapi_extra=COMPRESS_FORM_SCHEMA)
+@limiter.limit("10/minute")
+async def compress_pdf(request: Request, background_tasks: BackgroundTasks):
     file_id = str(uuid.uuid4())
-    sanitized_filename = sanitize_filename(file.filename)
     max_size = int(os.getenv("MAX_FILE_SIZE_MB", "500")) * 1024 * 1024
 
     try:
         input_path = get_safe_file_path(UPLOAD_DIR, f"{file_id}.pdf")
+        dedupe_path = get_safe_file_path(UPLOAD_DIR, f"{file_id}_dedup.pdf")
+        gray_path = get_safe_file_path(UPLOAD_DIR, f"{file_id}_gray.pdf")
+        ocr_path = get_safe_file_path(UPLOAD_DIR, f"{file_id}_ocr.pdf")
         output_path = get_safe_file_path(OUTPUT_DIR, f"compressed_{file_id}.pdf")
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid filename")
 
-    file_size = 0
-    try:
-        chunk_size = 4 * 1024 * 1024
-        first_chunk = await file.read(chunk_size)
+    def destination(field_name: str, filename: str) -> str:
+        if field_name != "file":
+            raise IngestError(f"Unexpected file field: {field_name}")
+        if not filename:
+            raise IngestError("Filename is required")
+        if not validate_file_extension(filename) or Path(filename).suffix.lower() != ".pdf":
+            raise IngestError("Only PDF files are allowed")
+        return input_path
 
-        if not first_chunk:
-            raise HTTPException(status_code=400, detail="Empty file uploaded")
+    with span("upload.receive"):
+        form = await read_form_options(request, destination, max_size)
 
-        if first_chunk[:4] != b"%PDF":
+    try:
+        quality = form.get("quality", DEFAULT_COMPRESSION_PROFILE)
+        if quality not in ALLOWED_QUALITIES:
             raise HTTPException(
                 status_code=400,
-                detail="Invalid file content. Only PDF files are allowed",
+                detail=f"Quality must be one of: {', '.join(ALLOWED_QUALITIES)}",
             )
+        delivery = form.get("delivery", "file")
+        check_delivery(delivery)
+        lang = resolve_ocr_lang(form.get("ocr_lang")) if form.get_bool("ocr") else None
+
+        profile = get_profile(quality)
+        if form.get_bool("linearize"):
+            profile = replace(profile, linearize=True)
+
+        target_bytes = None
+        if form.get("target_size"):
+            try:
+                target_bytes = parse_size(form.get("target_size"))
+            except TargetSizeError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        upload_id = form.get("upload_id")
+        if form.files:
+            filename = form.files[0].filename
+            file_size = form.files[0].size
+        elif upload_id:
+            # File sent beforehand through the resumable upload endpoints
+            try:
+                with span("upload.claim"):
+                    filename, file_size = await asyncio.to_thread(
+                        UploadSessionService.claim, upload_id, input_path
+                    )
+            except UploadSessionError as e:
+                raise HTTPException(status_code=e.status_code, detail=str(e))
 
-        file_size = len(first_chunk)
-
-        with open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
-            buffer.write(first_chunk)
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                file_size += len(chunk)
-                if file_size > max_size:
-                    buffer.close()
-                    remove_file(input_path)
+            with open(input_path, "rb") as f:
+                if f.read(4) != b"%PDF":
                     raise HTTPException(
-                        status_code=413, detail="File size exceeds maximum limit"
+                        status_code=400,
+                        detail="Invalid file content. Only PDF files are allowed",
                     )
-                buffer.write(chunk)
+        else:
+            raise HTTPException(status_code=400, detail="A file or upload_id is required")
+
+        sanitized_filename = sanitize_filename(filename)
 
         if not validate_file_size(file_size):
             remove_file(input_path)
@@ -129,13 +298,59 @@ async def compress_pdf(
                 remove_file(input_path)
                 raise HTTPException(status_code=400, detail="Invalid file content type")
 
-        success = await PDFService.compress_pdf(input_path, output_path, quality)
+        headers = {}
+        source_path = input_path
+        if lang:
+            # OCR the original scan; compression would only cost recognition accuracy
+            try:
+                ocr_stats = await OCRService.ocr_pdf(input_path, ocr_path, lang)
+            except Exception as e:
+                # Like the other pre-passes: the file is still compressed, just without OCR
+                logger.warning(f"OCR pre-pass skipped: {e}")
+                ocr_stats = None
+            if ocr_stats:
+                source_path = ocr_path
+                headers["X-OCR-Pages"] = str(ocr_stats.pages)
+
+        # Shared images are collapsed once, before any Ghostscript run
+        dedupe = await PDFService.dedupe_images(source_path, dedupe_path)
+        if dedupe and dedupe.total:
+            source_path = dedupe_path
+            headers["X-Dedup-Saved-Bytes"] = str(dedupe.bytes_saved)
+
+        # Gray-looking color scans become gray/bilevel images Ghostscript keeps as such
+        reduced = await PDFService.reduce_colors(source_path, gray_path, profile)
+        if reduced and reduced.total:
+            source_path = gray_path
+            headers["X-Color-Reduced-Images"] = str(reduced.total)
+
+        if target_bytes:
+            result = await TargetSizeService.compress_to_target(
+                source_path, output_path, target_bytes, profile
+            )
+            success = result is not None
+            if result:
+                headers.update(
+                    {
+                        "X-Target-Met": "true" if result.met else "false",
+                        "X-Compression-Profile": result.profile.name,
+                        "X-Compression-Trials": str(result.trials),
+                    }
+                )
+        else:
+            success = await PDFService.compress_pdf(source_path, output_path, profile=profile)
+        remove_file(dedupe_path)
+        remove_file(gray_path)
+        remove_file(ocr_path)
         if not success:
             remove_file(input_path)
             raise HTTPException(status_code=500, detail="Failed to compress PDF")
 
     except Exception as e:
         remove_file(input_path)
+        remove_file(dedupe_path)
+        remove_file(gray_path)
+        remove_file(ocr_path)
         if not isinstance(e, HTTPException):
             raise HTTPException(status_code=500, detail="Internal server error")
         raise e
@@ -143,18 +358,370 @@ async def compress_pdf(
     background_tasks.add_task(remove_file, input_path)
     background_tasks.add_task(remove_file, output_path)
 
-    return FileResponse(
-        path=output_path,
-        filename=f"compressed_{sanitized_filename}",
+    return await deliver_pdf(
+        request, output_path, f"compressed_{sanitized_filename}", delivery, headers
+    )
+
+
+@router.get("/compress/profiles")
+async def list_compression_profiles():
+    return {
+        "default": DEFAULT_COMPRESSION_PROFILE,
+        "profiles": [profile.to_dict() for profile in PROFILES.values()],
+    }
+
+
+class UploadSessionInput(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    sha256: str | None = Field(default=None, pattern="^[0-9a-fA-F]{64}$")
+
+
+def upload_session_call(func, *args):
+    try:
+        return func(*args)
+    except UploadSessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@router.post("/uploads")
+@limiter.limit("10/minute")
+async def create_upload_session(request: Request, body: UploadSessionInput):
+    """Start a resumable upload; the file is then sent with PUT /uploads/{id}/chunks/{index}"""
+    if Path(body.filename).suffix.lower() != ".pdf":
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+    max_size = int(os.getenv("MAX_FILE_SIZE_MB", "500")) * 1024 * 1024
+    if body.size > max_size:
+        raise HTTPException(status_code=413, detail="File size exceeds maximum limit")
+
+    return await asyncio.to_thread(
+        UploadSessionService.create, sanitize_filename(body.filename), body.size, body.sha256
+    )
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """Session state, including the chunks still missing (to resume an upload)"""
+    return await asyncio.to_thread(upload_session_call, UploadSessionService.status, upload_id)
+
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+@limiter.limit("600/minute")
+async def put_upload_chunk(request: Request, upload_id: str, index: int):
+    """Raw chunk body; optional X-Chunk-SHA256 header is verified before the chunk counts"""
+    try:
+        return await UploadSessionService.write_chunk(
+            upload_id, index, request.stream(), request.headers.get("x-chunk-sha256")
+        )
+    except UploadSessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(upload_id: str):
+    """Verify the upload; pass upload_id to /compress to process it"""
+    return await asyncio.to_thread(upload_session_call, UploadSessionService.complete, upload_id)
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    await asyncio.to_thread(upload_session_call, UploadSessionService.abort, upload_id)
+    return {"upload_id": upload_id, "aborted": True}
+
+
+def content_disposition(filename: str) -> str:
+    """Attachment header for streamed responses (same encoding as FileResponse)"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+async def save_pdf_upload(file: UploadFile, path: str, max_size: int) -> int:
+    """Stream an uploaded PDF to path, checking the %PDF header and size limit"""
+    chunk_size = 4 * 1024 * 1024
+    file_size = 0
+    try:
+        with span("upload.save"), open(path, "wb", buffering=8 * 1024 * 1024) as buffer:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if file_size == 0 and chunk[:4] != b"%PDF":
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Invalid file content. Only PDF files are allowed",
+                    )
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise HTTPException(
+                        status_code=413, detail="File size exceeds maximum limit"
+                    )
+                buffer.write(chunk)
+    except Exception:
+        remove_file(path)
+        raise
+
+    if not validate_file_size(file_size):
+        remove_file(path)
+        raise HTTPException(status_code=413, detail="File size validation failed")
+    return file_size
+
+
+@router.post("/merge")
+@limiter.limit("10/minute")
+async def merge_pdfs(
+    request: Request,
+    files: List[UploadFile] = File(...),
+):
+    """Gabungkan beberapa PDF (urutan sesuai upload) tanpa re-render"""
+    max_files = int(os.getenv("MERGE_MAX_FILES", "50"))
+    if len(files) < 2:
+        raise HTTPException(status_code=400, detail="At least two PDF files are required")
+    if len(files) > max_files:
+        raise HTTPException(
+            status_code=400, detail=f"At most {max_files} files can be merged"
+        )
+
+    max_size = int(os.getenv("MAX_FILE_SIZE_MB", "500")) * 1024 * 1024
+    input_paths = []
+    total_size = 0
+
+    try:
+        for file in files:
+            if not file.filename or not file.filename.lower().endswith(".pdf"):
+                raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+            input_path = get_safe_file_path(UPLOAD_DIR, f"{uuid.uuid4()}.pdf")
+            total_size += await save_pdf_upload(file, input_path, max_size - total_size)
+            input_paths.append(input_path)
+
+        job = await PDFPageService.prepare(PDFPageService.prepare_merge, input_paths)
+
+    except Exception as e:
+        for p in input_paths:
+            remove_file(p)
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, PDF_INPUT_ERRORS):
+            raise HTTPException(status_code=400, detail="Invalid or protected PDF file")
+        logger.error("Merge failed: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to merge PDFs")
+
+    def cleanup():
+        for p in input_paths:
+            remove_file(p)
+
+    return StreamingResponse(
+        PDFPageService.stream_pdf(job, cleanup),
         media_type="application/pdf",
+        headers={
+            "Content-Disposition": content_disposition("merged.pdf"),
+            "X-Dedup-Saved-Bytes": str(job.dedupe.bytes_saved),
+        },
+    )
+
+
+@router.post("/split")
+@limiter.limit("10/minute")
+async def split_pdf(
+    request: Request,
+    file: UploadFile = File(...),
+    ranges: str = Form(""),
+    every: int = Form(0),
+):
+    """
+    Pecah PDF menjadi beberapa file (ZIP).
+    ranges: "1-3,4-10" (satu file per range) atau every: jumlah halaman per file.
+    """
+    if not ranges and every < 1:
+        raise HTTPException(
+            status_code=400, detail="Either ranges or every must be provided"
+        )
+    if not file.filename or not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+    sanitized_filename = sanitize_filename(file.filename)
+    max_size = int(os.getenv("MAX_FILE_SIZE_MB", "500")) * 1024 * 1024
+
+    try:
+        input_path = get_safe_file_path(UPLOAD_DIR, f"{uuid.uuid4()}.pdf")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+
+    await save_pdf_upload(file, input_path, max_size)
+
+    try:
+        job = await PDFPageService.prepare(
+            PDFPageService.prepare_split, input_path, ranges or None, every or None
+        )
+    except Exception as e:
+        remove_file(input_path)
+        if isinstance(e, PDF_INPUT_ERRORS):
+            raise HTTPException(status_code=400, detail=str(e) or "Invalid PDF file")
+        logger.error("Split failed: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to split PDF")
+
+    return StreamingResponse(
+        PDFPageService.stream_split_zip(
+            job, sanitized_filename, lambda: remove_file(input_path)
+        ),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": content_disposition(
+                f"{Path(sanitized_filename).stem}_split.zip"
+            )
+        },
+    )
+
+
+@router.post("/extract-pages")
+@limiter.limit("10/minute")
+async def extract_pages(
+    request: Request,
+    file: UploadFile = File(...),
+    pages: str = Form(...),
+):
+    """Ambil halaman tertentu ("1,3,5-7") menjadi satu PDF baru"""
+    if not file.filename or not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+    sanitized_filename = sanitize_filename(file.filename)
+    max_size = int(os.getenv("MAX_FILE_SIZE_MB", "500")) * 1024 * 1024
+
+    try:
+        input_path = get_safe_file_path(UPLOAD_DIR, f"{uuid.uuid4()}.pdf")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+
+    await save_pdf_upload(file, input_path, max_size)
+
+    try:
+        job = await PDFPageService.prepare(
+            PDFPageService.prepare_extract, input_path, pages
+        )
+    except Exception as e:
+        remove_file(input_path)
+        if isinstance(e, PDF_INPUT_ERRORS):
+            raise HTTPException(status_code=400, detail=str(e) or "Invalid PDF file")
+        logger.error("Page extraction failed: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to extract pages")
+
+    return StreamingResponse(
+        PDFPageService.stream_pdf(job, lambda: remove_file(input_path)),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": content_disposition(
+                f"{Path(sanitized_filename).stem}_pages.pdf"
+            )
+        },
+    )
+
+
+@router.post("/render")
+@limiter.limit("30/minute")
+async def render_pdf_pages(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    pages: str = Form("1"),
+    dpi: int = Form(72),
+    format: str = Form("png"),
+):
+    """
+    Render halaman PDF menjadi gambar (preview/thumbnail).
+    Satu halaman -> file gambar, beberapa halaman -> ZIP.
+    """
+    if format not in RENDER_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format must be one of: {', '.join(RENDER_FORMATS)}",
+        )
+    if dpi < 10 or dpi > RENDER_MAX_DPI:
+        raise HTTPException(
+            status_code=400, detail=f"DPI must be between 10 and {RENDER_MAX_DPI}"
+        )
+    if not file.filename or not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+    sanitized_filename = sanitize_filename(file.filename)
+    max_size = int(os.getenv("MAX_FILE_SIZE_MB", "500")) * 1024 * 1024
+    max_pages = int(os.getenv("RENDER_MAX_PAGES", "500"))
+
+    try:
+        input_path = get_safe_file_path(UPLOAD_DIR, f"{uuid.uuid4()}.pdf")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+
+    await save_pdf_upload(file, input_path, max_size)
+
+    try:
+        total_pages = await asyncio.to_thread(page_count, input_path)
+        page_numbers = []
+        for start, end in parse_page_ranges(pages, total_pages):
+            page_numbers.extend(range(start, end + 1))
+        page_numbers = list(dict.fromkeys(page_numbers))
+        if len(page_numbers) > max_pages:
+            raise HTTPException(
+                status_code=400, detail=f"At most {max_pages} pages per request"
+            )
+
+        rendered, hits, serve_dir = await RenderService.render_pages(
+            input_path, page_numbers, dpi, format
+        )
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, PDF_INPUT_ERRORS):
+            raise HTTPException(status_code=400, detail=str(e) or "Invalid PDF file")
+        logger.error("Render failed: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to render pages")
+    finally:
+        remove_file(input_path)
+
+    if len(rendered) != len(page_numbers):
+        remove_directory(serve_dir)
+        raise HTTPException(status_code=500, detail="Failed to render pages")
+
+    _, ext, media_type = RENDER_FORMATS[format]
+    stem = Path(sanitized_filename).stem
+    headers = {"X-Render-Cache-Hits": str(hits)}
+
+    if len(page_numbers) == 1:
+        page = page_numbers[0]
+        # Yang dihapus hanya link per-request; render tetap di cache (content-addressed)
+        background_tasks.add_task(remove_directory, serve_dir)
+        return FileResponse(
+            path=rendered[page],
+            filename=f"{stem}_p{page}.{ext}",
+            media_type=media_type,
+            headers=headers,
+        )
+
+    def write_zip(stream):
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as archive:
+            for page in page_numbers:
+                archive.write(rendered[page], arcname=f"{stem}_p{page}.{ext}")
+
+    headers["Content-Disposition"] = content_disposition(f"{stem}_pages.zip")
+    return StreamingResponse(
+        stream_writer(write_zip, lambda: remove_directory(serve_dir)),
+        media_type="application/zip",
+        headers=headers,
     )
 
 
 @router.post("/convert-docx")
 @limiter.limit("5/minute")
 async def convert_docx_to_pdf_endpoint(
-    request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...)
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    linearize: bool = Form(False),
+    delivery: str = Form("file"),
 ):
+    check_delivery(delivery)
     if not file.filename or not file.filename.lower().endswith((".docx", ".doc")):
         raise HTTPException(
             status_code=400, detail="Only .docx and .doc files are allowed"
@@ -173,7 +740,7 @@ async def convert_docx_to_pdf_endpoint(
     file_size = 0
     try:
         chunk_size = 4 * 1024 * 1024
-        with open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
+        with span("upload.save"), open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
             while True:
                 chunk = await file.read(chunk_size)
                 if not chunk:
@@ -191,7 +758,17 @@ async def convert_docx_to_pdf_endpoint(
             remove_file(input_path)
             raise HTTPException(status_code=413, detail="File size validation failed")
 
-        pdf_path, user_profile_dir = await PDFService.convert_docx_to_pdf(input_path, OUTPUT_DIR)
+        try:
+            preflight = await PreflightService.analyze_async(input_path)
+            PreflightService.check_admission(preflight)
+        except PreflightError as e:
+            remove_file(input_path)
+            raise HTTPException(status_code=422, detail=str(e))
+
+        async with PreflightService.admission_slot(preflight).acquire():
+            pdf_path, user_profile_dir = await PDFService.convert_docx_to_pdf(
+                input_path, OUTPUT_DIR, preflight.work_estimate(file_size) if preflight else None
+            )
 
         if not pdf_path or not os.path.exists(pdf_path):
             remove_file(input_path)
@@ -204,10 +781,11 @@ async def convert_docx_to_pdf_endpoint(
         if user_profile_dir:
             background_tasks.add_task(remove_directory, user_profile_dir)
 
-        return FileResponse(
-            path=pdf_path,
-            filename=f"{Path(sanitized_name).stem}.pdf",
-            media_type="application/pdf",
+        if linearize:
+            await PDFService.linearize_pdf(pdf_path)
+
+        return await deliver_pdf(
+            request, pdf_path, f"{Path(sanitized_name).stem}.pdf", delivery
         )
 
     except Exception as e:
@@ -220,8 +798,13 @@ async def convert_docx_to_pdf_endpoint(
 @router.post("/convert-ppt")
 @limiter.limit("5/minute")
 async def convert_ppt_to_pdf_endpoint(
-    request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...)
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    linearize: bool = Form(False),
+    delivery: str = Form("file"),
 ):
+    check_delivery(delivery)
     if not file.filename or not file.filename.lower().endswith((".ppt", ".pptx")):
         raise HTTPException(
             status_code=400, detail="Only .ppt and .pptx files are allowed"
@@ -240,7 +823,7 @@ async def convert_ppt_to_pdf_endpoint(
     file_size = 0
     try:
         chunk_size = 4 * 1024 * 1024
-        with open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
+        with span("upload.save"), open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
             while True:
                 chunk = await file.read(chunk_size)
                 if not chunk:
@@ -258,7 +841,17 @@ async def convert_ppt_to_pdf_endpoint(
             remove_file(input_path)
             raise HTTPException(status_code=413, detail="File size validation failed")
 
-        pdf_path, user_profile_dir = await PDFService.convert_ppt_to_pdf(input_path, OUTPUT_DIR)
+        try:
+            preflight = await PreflightService.analyze_async(input_path)
+            PreflightService.check_admission(preflight)
+        except PreflightError as e:
+            remove_file(input_path)
+            raise HTTPException(status_code=422, detail=str(e))
+
+        async with PreflightService.admission_slot(preflight).acquire():
+            pdf_path, user_profile_dir = await PDFService.convert_ppt_to_pdf(
+                input_path, OUTPUT_DIR, preflight.work_estimate(file_size) if preflight else None
+            )
 
         if not pdf_path or not os.path.exists(pdf_path):
             remove_file(input_path)
@@ -271,10 +864,11 @@ async def convert_ppt_to_pdf_endpoint(
         if user_profile_dir:
             background_tasks.add_task(remove_directory, user_profile_dir)
 
-        return FileResponse(
-            path=pdf_path,
-            filename=f"{Path(sanitized_name).stem}.pdf",
-            media_type="application/pdf",
+        if linearize:
+            await PDFService.linearize_pdf(pdf_path)
+
+        return await deliver_pdf(
+            request, pdf_path, f"{Path(sanitized_name).stem}.pdf", delivery
         )
 
     except Exception as e:
@@ -284,15 +878,74 @@ async def convert_ppt_to_pdf_endpoint(
         raise e
 
 
+@router.post("/fonts/check")
+@limiter.limit("10/minute")
+async def check_document_fonts(request: Request, file: UploadFile = File(...)):
+    """List fonts a DOCX/PPTX references that are not installed, with the fontconfig substitute"""
+    if not file.filename or not file.filename.lower().endswith((".docx", ".pptx")):
+        raise HTTPException(
+            status_code=400, detail="Only .docx and .pptx files are allowed"
+        )
+
+    ext = Path(file.filename).suffix.lower()
+    max_size = int(os.getenv("MAX_DOCX_SIZE_MB", "100")) * 1024 * 1024
+
+    try:
+        input_path = get_safe_file_path(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+
+    try:
+        file_size = 0
+        chunk_size = 4 * 1024 * 1024
+        with span("upload.save"), open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise HTTPException(
+                        status_code=413, detail="File exceeds maximum limit"
+                    )
+                buffer.write(chunk)
+
+        try:
+            preflight = await PreflightService.analyze_async(input_path)
+        except PreflightError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        remove_file(input_path)
+
+    substitutes = await asyncio.to_thread(
+        lambda: {f: FontService.substitute_for(f) for f in preflight.fonts_missing}
+    )
+
+    return {
+        "fonts_referenced": list(preflight.fonts_referenced),
+        "fonts_missing": [
+            {"family": family, "substitute": substitutes.get(family)}
+            for family in preflight.fonts_missing
+        ],
+        "fontconfig_ready": FontService.status()["fontconfig"],
+    }
+
+
 @router.post("/convert-image")
 @limiter.limit("10/minute")
 async def convert_image_to_pdf_endpoint(
     request: Request,
     background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
+    linearize: bool = Form(False),
+    delivery: str = Form("file"),
+    ocr: bool = Form(False),
+    ocr_lang: str | None = Form(None),
 ):
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
+    check_delivery(delivery)
+    lang = resolve_ocr_lang(ocr_lang) if ocr else None
 
     file_id = str(uuid.uuid4())
     output_path = get_safe_file_path(OUTPUT_DIR, f"combined_{file_id}.pdf")
@@ -310,7 +963,7 @@ async def convert_image_to_pdf_endpoint(
             ext = Path(file.filename).suffix.lower()
             temp_path = get_safe_file_path(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
 
-            with open(temp_path, "wb") as buffer:
+            with span("upload.save"), open(temp_path, "wb") as buffer:
                 while True:
                     chunk = await file.read(4 * 1024 * 1024)
                     if not chunk:
@@ -348,10 +1001,25 @@ async def convert_image_to_pdf_endpoint(
             background_tasks.add_task(remove_file, p)
         background_tasks.add_task(remove_file, output_path)
 
-        return FileResponse(
-            path=output_path,
-            filename="converted_images.pdf",
-            media_type="application/pdf",
+        headers = {}
+        if lang:
+            ocr_path = f"{output_path}.ocr"
+            try:
+                ocr_stats = await OCRService.ocr_pdf(output_path, ocr_path, lang, only_missing_text=False)
+            except Exception as e:
+                # As in /compress: the PDF is still delivered, just without a text layer
+                logger.warning(f"OCR skipped for image conversion: {e}")
+                remove_file(ocr_path)
+                ocr_stats = None
+            if ocr_stats:
+                os.replace(ocr_path, output_path)
+                headers["X-OCR-Pages"] = str(ocr_stats.pages)
+
+        if linearize:
+            await PDFService.linearize_pdf(output_path)
+
+        return await deliver_pdf(
+            request, output_path, "converted_images.pdf", delivery, headers
         )
 
     except Exception as e:
@@ -362,13 +1030,26 @@ async def convert_image_to_pdf_endpoint(
         raise e
 
 
+def check_output_format(output: str):
+    if output not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"Output must be one of: {', '.join(OUTPUT_FORMATS)}"
+        )
+
+
 @router.post("/remove-bg")
 @limiter.limit("10/minute")
 async def remove_image_background(
     request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    output: str = Form("png"),
+    full_resolution: bool | None = Form(None),
 ):
+    """
+    output: png (default), webp (lebih kecil, tetap dengan alpha) atau mask (hanya alpha mask).
+    full_resolution: segmentasi di resolusi model lalu mask di-upsample ke resolusi asli.
+    """
     if not file.filename:
         raise HTTPException(status_code=400, detail="Filename is required")
 
@@ -377,6 +1058,8 @@ async def remove_image_background(
         raise HTTPException(
             status_code=400, detail="Only .jpg, .jpeg, .png, and .webp are allowed"
         )
+    check_output_format(output)
+    output_ext, media_type = OUTPUT_FORMATS[output]
 
     file_id = str(uuid.uuid4())
     max_size = int(os.getenv("MAX_IMAGE_SIZE_MB", "20")) * 1024 * 1024
@@ -384,7 +1067,7 @@ async def remove_image_background(
 
     try:
         input_path = get_safe_file_path(UPLOAD_DIR, f"{file_id}{ext}")
-        output_path = get_safe_file_path(OUTPUT_DIR, f"removed_bg_{file_id}.png")
+        output_path = get_safe_file_path(OUTPUT_DIR, f"removed_bg_{file_id}.{output_ext}")
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid filename")
 
@@ -392,7 +1075,7 @@ async def remove_image_background(
 
     try:
         chunk_size = 4 * 1024 * 1024
-        with open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
+        with span("upload.save"), open(input_path, "wb", buffering=8 * 1024 * 1024) as buffer:
             while True:
                 chunk = await file.read(chunk_size)
                 if not chunk:
@@ -415,7 +1098,9 @@ async def remove_image_background(
             raise HTTPException(status_code=400, detail="Invalid image content")
 
         with open(input_path, "rb") as image_file:
-            result_bytes = await ImageService.remove_background(image_file.read())
+            result_bytes, cache_status = await ImageService.remove_background(
+                image_file.read(), output, full_resolution
+            )
 
         with open(output_path, "wb") as out:
             out.write(result_bytes)
@@ -431,8 +1116,82 @@ async def remove_image_background(
     background_tasks.add_task(remove_file, input_path)
     background_tasks.add_task(remove_file, output_path)
 
+    suffix = "mask" if output == "mask" else "transparent"
     return FileResponse(
         path=output_path,
-        filename=f"{Path(sanitized_filename).stem}-transparent.png",
-        media_type="image/png",
-    )
\ No newline at end of file
+        filename=f"{Path(sanitized_filename).stem}-{suffix}.{output_ext}",
+        media_type=media_type,
+        headers={"X-Mask-Cache": cache_status},
+    )
+
+
+@router.post("/remove-bg/bulk")
+@limiter.limit("5/minute")
+async def remove_image_background_bulk(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    output: str = Form("png"),
+    full_resolution: bool | None = Form(None),
+):
+    """
+    Hapus background banyak gambar sekaligus (file gambar dan/atau ZIP berisi gambar).
+    Hasil berupa ZIP yang dikirim bertahap; manifest.json mencatat hasil/error per gambar.
+    """
+    check_output_format(output)
+    max_total = int(os.getenv("MAX_FILE_SIZE_MB", "500")) * 1024 * 1024
+    max_image = int(os.getenv("MAX_IMAGE_SIZE_MB", "20")) * 1024 * 1024
+    saved_paths = []
+    uploads = []
+    total_size = 0
+
+    try:
+        for file in files:
+            ext = Path(file.filename or "").suffix.lower()
+            if ext not in IMAGE_EXTENSIONS and ext != ".zip":
+                raise HTTPException(
+                    status_code=400,
+                    detail="Only .jpg, .jpeg, .png, .webp and .zip are allowed",
+                )
+            path = get_safe_file_path(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
+            saved_paths.append(path)
+            limit = max_total - total_size
+            if ext != ".zip":
+                limit = min(limit, max_image)
+            with span("upload.save"), open(path, "wb", buffering=8 * 1024 * 1024) as buffer:
+                size = 0
+                while chunk := await file.read(4 * 1024 * 1024):
+                    size += len(chunk)
+                    if size > limit:
+                        raise HTTPException(
+                            status_code=413, detail="Upload exceeds maximum size"
+                        )
+                    buffer.write(chunk)
+            total_size += size
+            uploads.append((sanitize_filename(file.filename), path))
+
+        images = await asyncio.to_thread(collect_images, uploads, max_image)
+
+    except Exception as e:
+        for p in saved_paths:
+            remove_file(p)
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, BulkRemoveBgError):
+            raise HTTPException(status_code=400, detail=str(e))
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid filename")
+        logger.error("Bulk remove background failed: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to remove background")
+
+    def cleanup():
+        for p in saved_paths:
+            remove_file(p)
+
+    return StreamingResponse(
+        BulkRemoveBgService.stream_zip(images, max_image, cleanup, output, full_resolution),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": content_disposition("removed_bg.zip"),
+            "X-Bulk-Images": str(len(images)),
+        },
+    )
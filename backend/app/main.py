@@ -6,9 +6,17 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.api.v1.endpoints import router as api_router
 from app.middleware.security import SecurityHeadersMiddleware
 from app.middleware.rate_limit import get_rate_limiter
+from app.middleware.tracing import TracingMiddleware
+from app.services.font_service import FontService
+from app.services.readiness_service import ReadinessService
+from app.services.result_store import ResultStore
+from app.utils.tracing import LOG_FORMAT
+from app.utils.worker_role import APP_ROLE, route_enabled
 from slowapi.errors import RateLimitExceeded
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -17,7 +25,7 @@ load_dotenv()
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    format=LOG_FORMAT
 )
 logger = logging.getLogger(__name__)
 
@@ -27,7 +35,24 @@ ENV = os.getenv("ENV", "development")
 DEFAULT_ORIGINS = "http://localhost:3000,http://127.0.0.1:3000,https://www.ultrapdf.my.id,https://ultrapdf.my.id"
 ALLOWED_ORIGINS = [origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", DEFAULT_ORIGINS).split(",")]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown hooks"""
+    # Warm fontconfig + LibreOffice profile template di background agar startup tidak tertahan
+    warmup_task = None
+    if os.getenv("FONT_WARMUP", "1").strip().lower() in ("1", "true", "yes", "on"):
+        warmup_task = asyncio.create_task(FontService.warm_up_async())
+    # First engine self-test for /ready, in the background
+    ReadinessService.refresh_in_background()
+    # Expired download links are removed even when no new result is stored
+    purge_task = asyncio.create_task(ResultStore.purge_periodically())
+    yield
+    purge_task.cancel()
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="UltraPDF Backend API",
     description="Secure PDF compression API",
     version="1.0.0",
@@ -57,12 +82,32 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS if ENV == "production" else ["*"],  # Strict di production
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],  # Tambahkan OPTIONS untuk preflight
-    allow_headers=["Content-Type", "Authorization", "X-Requested-With"],  # Tambahkan headers yang diperlukan
-    expose_headers=["Content-Disposition"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # Tambahkan OPTIONS untuk preflight
+    allow_headers=["Content-Type", "Authorization", "X-Requested-With", "Range", "X-Chunk-SHA256", "traceparent"],  # Tambahkan headers yang diperlukan
+    expose_headers=[
+        "Content-Disposition",
+        "Content-Range",
+        "Accept-Ranges",
+        "Content-Length",
+        "X-Dedup-Saved-Bytes",
+        "X-Color-Reduced-Images",
+        "X-Render-Cache-Hits",
+        "X-Mask-Cache",
+        "X-Bulk-Images",
+        "X-Target-Met",
+        "X-Compression-Profile",
+        "X-Compression-Trials",
+        "X-OCR-Pages",
+        "X-Job-Id",
+        "X-Engine-CPU-Seconds",
+        "X-Engine-Peak-Memory",
+    ],
     max_age=3600,  # Cache preflight untuk 1 jam
 )
 
+# Tracing paling luar agar span root mencakup upload, semua middleware dan pengiriman response
+app.add_middleware(TracingMiddleware)
+
 # Pastikan direktori penyimpanan ada
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "outputs")
@@ -129,6 +174,13 @@ async def general_exception_handler(request: Request, exc: Exception):
     
     return response
 
+# Role-based pools (APP_ROLE): routes of the other pool are not served, so their engines never load
+if APP_ROLE != "all":
+    api_router.routes = [
+        route for route in api_router.routes if route_enabled("/api/v1" + route.path)
+    ]
+    logger.info(f"Worker role {APP_ROLE}: serving {len(api_router.routes)} API routes")
+
 # Include router
 app.include_router(api_router, prefix="/api/v1")
 
@@ -148,3 +200,9 @@ async def health_check():
         "status": "healthy",
         "service": "ultrapdf-backend"
     }
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness + kapasitas untuk load balancer (503 jika worker tidak siap menerima job)"""
+    ready, summary = ReadinessService.summary()
+    return JSONResponse(status_code=200 if ready else 503, content=summary)
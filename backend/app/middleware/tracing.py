@@ -0,0 +1,118 @@
+"""
+Tracing middleware: opens the job trace for every HTTP request
+"""
+
+import logging
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.engine_governor import track_job_usage
+from app.utils.tracing import job_trace
+
+logger = logging.getLogger(__name__)
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI (not BaseHTTPMiddleware) so the root span also covers receiving
+    the upload and sending the response body: events mark the first and last
+    body chunk in each direction, which separates upload and download time
+    from processing time. Background tasks run before the span ends.
+
+    Engine usage (CPU seconds, peak memory of gs/soffice/tesseract runs) is
+    collected for the same job, returned as X-Engine-CPU-Seconds and
+    X-Engine-Peak-Memory and logged once the job is done.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        content_length = headers.get(b"content-length", b"").decode("latin-1")
+
+        with track_job_usage() as usage, job_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent=traceparent,
+            **{
+                "http.request.method": scope["method"],
+                "url.path": scope["path"],
+                "http.request.body.size": int(content_length) if content_length.isdigit() else None,
+            },
+        ) as root:
+            received = 0
+            sent = 0
+
+            async def traced_receive() -> Message:
+                nonlocal received
+                message = await receive()
+                if message["type"] == "http.request":
+                    if received == 0:
+                        root.event("request.body.start")
+                    received += len(message.get("body", b""))
+                    if not message.get("more_body", False):
+                        root.event("request.body.end", bytes=received)
+                return message
+
+            async def traced_send(message: Message):
+                nonlocal sent
+                if message["type"] == "http.response.start":
+                    root.set(**{"http.response.status_code": message["status"]})
+                    if message["status"] >= 500:
+                        root.fail(f"HTTP {message['status']}")
+                    response_headers = MutableHeaders(scope=message)
+                    response_headers["X-Job-Id"] = root.trace.trace_id
+                    if usage.processes:
+                        response_headers["X-Engine-CPU-Seconds"] = f"{usage.cpu_seconds:.3f}"
+                        response_headers["X-Engine-Peak-Memory"] = str(usage.peak_memory_bytes)
+                    root.event("response.start")
+                elif message["type"] == "http.response.body":
+                    sent += len(message.get("body", b""))
+                    if not message.get("more_body", False):
+                        root.event("response.body.end", bytes=sent)
+                await send(message)
+
+            try:
+                await self.app(scope, traced_receive, traced_send)
+            finally:
+                route = _route_template(scope)
+                if route:
+                    root.name = f"{scope['method']} {route}"
+                    root.set(**{"http.route": route})
+                if usage.processes:
+                    root.set(
+                        **{
+                            "engine.processes": usage.processes,
+                            "engine.cpu.seconds": round(usage.cpu_seconds, 3),
+                            "engine.memory.peak_bytes": usage.peak_memory_bytes,
+                        }
+                    )
+                    logger.info(
+                        f"Engine usage: {usage.processes} processes, {usage.cpu_seconds:.2f} CPU s, "
+                        f"peak {usage.peak_memory_bytes / (1024 * 1024):.0f} MB"
+                    )
+
+
+def _route_template(scope: Scope) -> str | None:
+    """
+    Matched route with its parameters unfilled ("/api/v1/download/{token}"),
+    so span names stay low-cardinality. Routes of an included router may not
+    carry the router prefix, which is recovered from the request path.
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if not path:
+        return None
+    try:
+        concrete = getattr(route, "path_format", path).format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return path
+    if concrete and scope["path"].endswith(concrete):
+        return scope["path"][: len(scope["path"]) - len(concrete)] + path
+    return path
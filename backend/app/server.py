@@ -0,0 +1,274 @@
+"""
+Production launcher: `python -m app.server`
+
+The master process imports the app (and optionally the rembg model) once,
+binds the listening socket, then forks WEB_WORKERS uvicorn workers that share
+both the socket and the preloaded memory copy-on-write. With
+WORKER_CPU_AFFINITY=1 each worker is pinned to its own CPU set. Off by
+default: the engines a worker spawns (gs, soffice, tesseract) inherit the
+pinning, so a worker's parallel render/OCR fan-out would share its one core.
+
+Signals sent to the master:
+- SIGTERM / SIGINT: graceful shutdown, workers drain in-flight requests
+- SIGHUP: rolling restart, one worker at a time (new worker first, then the
+  old one drains). Preloaded code is not re-imported; restart the master to
+  deploy new code.
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.utils.concurrency import available_cpus  # noqa: E402
+from app.utils.tracing import LOG_FORMAT  # noqa: E402 (reads env loaded above)
+
+logger = logging.getLogger("app.server")
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS") or available_cpus())
+PRELOAD_REMBG = os.getenv("PRELOAD_REMBG", "1").strip().lower() in ("1", "true", "yes", "on")
+IMPORT_REPORT = os.getenv("IMPORT_REPORT", "1").strip().lower() in ("1", "true", "yes", "on")
+WORKER_CPU_AFFINITY = os.getenv("WORKER_CPU_AFFINITY", "0").strip().lower() in ("1", "true", "yes", "on")
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+TIMEOUT_KEEP_ALIVE = int(os.getenv("TIMEOUT_KEEP_ALIVE", "300"))
+
+# Seconds a new worker gets to start before the one it replaces is stopped
+_ROLLING_START_DELAY = 2.0
+
+
+def _cpu_sets(workers: int) -> list[set[int]]:
+    """Split the CPUs available to this process into one set per worker."""
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+
+    cpus = sorted(os.sched_getaffinity(0))
+    if workers >= len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(workers)]
+
+    per_worker = len(cpus) // workers
+    sets = [set(cpus[i * per_worker:(i + 1) * per_worker]) for i in range(workers)]
+    # Leftover cores go to the last worker
+    sets[-1].update(cpus[workers * per_worker:])
+    return sets
+
+
+def _preload():
+    """Import the app and warm shared state before forking."""
+    from app.utils.import_report import import_report
+    from app.utils.worker_role import serves_images
+
+    # Workers of the pdf pool never load the model
+    preload_rembg = PRELOAD_REMBG and serves_images()
+    if preload_rembg:
+        # ONNX Runtime thread pools do not survive fork(). OMP_NUM_THREADS does
+        # not size ORT's own pools, so the preloaded session is built with one
+        # intra-op and one inter-op thread (no pool to lose); the workers'
+        # concurrency comes from running several of them.
+        os.environ.setdefault("OMP_NUM_THREADS", "1")
+        os.environ.setdefault("REMBG_INTRA_OP_THREADS", "1")
+        os.environ.setdefault("REMBG_INTER_OP_THREADS", "1")
+
+    if IMPORT_REPORT:
+        with import_report() as report:
+            from app.main import app
+        report.log()
+    else:
+        from app.main import app
+
+    if preload_rembg:
+        try:
+            from app.services.image_service import preload_session
+
+            started = time.perf_counter()
+            preload_session()
+            logger.info(f"rembg model preloaded in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.warning(f"rembg preload failed, workers will load lazily: {e}")
+
+    return app
+
+
+def _bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in HOST else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, cpus: set[int] | None):
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+
+    if cpus and WORKER_CPU_AFFINITY:
+        os.sched_setaffinity(0, cpus)
+
+    config = uvicorn.Config(
+        app,
+        timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        log_config=None,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.cpu_sets = _cpu_sets(workers)
+        self.pids: dict[int, int] = {}  # pid -> worker slot
+        self.shutting_down = False
+        self.reload_requested = False
+
+    def spawn(self, slot: int) -> int:
+        cpus = self.cpu_sets[slot] if self.cpu_sets else None
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(self.app, self.sock, cpus)
+            except Exception:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.pids[pid] = slot
+        logger.info(f"Worker {slot} started (pid {pid}, cpus {sorted(cpus) if cpus else 'all'})")
+        return pid
+
+    def reap(self) -> list[int]:
+        """Collect exited workers and return the slots they held."""
+        freed = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            slot = self.pids.pop(pid, None)
+            if slot is not None:
+                logger.info(f"Worker {slot} (pid {pid}) exited with status {status}")
+                freed.append(slot)
+        return freed
+
+    def stop_worker(self, pid: int, timeout: float):
+        """SIGTERM one worker and wait for it to drain, SIGKILL if it overruns."""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                self.pids.pop(pid, None)
+                return
+            time.sleep(0.1)
+
+        logger.warning(f"Worker pid {pid} did not drain in {timeout}s, killing")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        self.pids.pop(pid, None)
+
+    def rolling_restart(self):
+        logger.info("Rolling restart requested")
+        for old_pid, slot in list(self.pids.items()):
+            if self.shutting_down:
+                return
+            self.spawn(slot)
+            time.sleep(_ROLLING_START_DELAY)
+            self.stop_worker(old_pid, GRACEFUL_TIMEOUT + 5)
+
+    def shutdown(self):
+        logger.info("Shutting down workers")
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while self.pids and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in list(self.pids):
+            logger.warning(f"Killing worker pid {pid}")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.reap()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        while not self.shutting_down:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+
+            for slot in self.reap():
+                if not self.shutting_down and slot not in self.pids.values():
+                    logger.warning(f"Respawning worker {slot}")
+                    self.spawn(slot)
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def _handle_exit(self, signum, frame):
+        self.shutting_down = True
+
+    def _handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+    )
+
+    workers = max(1, WEB_WORKERS)
+    app = _preload()
+    sock = _bind_socket()
+    logger.info(f"Listening on {HOST}:{PORT} with {workers} workers")
+
+    Master(app, sock, workers).run()
+    sock.close()
+    logger.info("Master stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    code = main()
+    # Skip interpreter finalization: native extensions pulled in by the
+    # preload (pikepdf, onnxruntime) can block while being garbage-collected
+    logging.shutdown()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
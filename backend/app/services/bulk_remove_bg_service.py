@@ -0,0 +1,219 @@
+"""
+Bulk background removal: many images (or ZIPs of images) in, one ZIP out.
+
+Each image goes through the ImageService stages as its own task: read and
+decode, mask cache or inference, encode. Inference is bounded by the
+"rembg" slot (REMBG_SLOTS) while up to REMBG_BULK_PIPELINE_DEPTH images are
+in flight, so the next images are decoded and the previous ones encoded
+while the model runs. Results are written to the response ZIP in the order
+they finish; manifest.json at the end lists every input with its output
+name or the error that stopped it.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+from PIL import Image, UnidentifiedImageError
+
+from app.services.image_service import OUTPUT_FORMATS, REMBG_SLOTS, ImageService, RemoveBgSettings
+from app.utils.concurrency import get_slot
+from app.utils.streaming import ChunkBuffer
+from app.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+REMBG_BULK_MAX_IMAGES = int(os.getenv("REMBG_BULK_MAX_IMAGES", "500"))
+REMBG_BULK_PIPELINE_DEPTH = int(os.getenv("REMBG_BULK_PIPELINE_DEPTH", "4"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class BulkRemoveBgError(ValueError):
+    """Raised for a bulk upload that cannot be processed at all."""
+
+
+class _ImageTooLarge(ValueError):
+    pass
+
+
+@dataclass
+class BulkImage:
+    # Name as uploaded: file name, or member path inside an uploaded ZIP
+    name: str
+    path: str
+    member: str | None = None
+
+
+@dataclass
+class _Result:
+    index: int
+    image: BulkImage
+    data: bytes | None = None
+    cache: str | None = None
+    error: str | None = None
+    seconds: float = 0.0
+
+
+def _is_image_name(name: str) -> bool:
+    base = os.path.basename(name)
+    return (
+        Path(base).suffix.lower() in IMAGE_EXTENSIONS
+        and not base.startswith(".")
+        and not name.startswith("__MACOSX/")
+    )
+
+
+def collect_images(uploads: list[tuple[str, str]], max_image_bytes: int) -> list[BulkImage]:
+    """
+    Expand (original name, saved path) uploads into the images to process.
+    ZIP members are read in place later; only their listing is checked here.
+    """
+    images = []
+    for name, path in uploads:
+        if Path(name).suffix.lower() != ".zip":
+            images.append(BulkImage(name, path))
+            continue
+        try:
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not _is_image_name(info.filename):
+                        continue
+                    if info.file_size > max_image_bytes:
+                        raise BulkRemoveBgError(f"{info.filename} exceeds the image size limit")
+                    images.append(BulkImage(info.filename, path, info.filename))
+        except zipfile.BadZipFile:
+            raise BulkRemoveBgError(f"{name} is not a valid ZIP file")
+
+    if not images:
+        raise BulkRemoveBgError("No .jpg, .jpeg, .png or .webp images found")
+    if len(images) > REMBG_BULK_MAX_IMAGES:
+        raise BulkRemoveBgError(f"At most {REMBG_BULK_MAX_IMAGES} images per request")
+    return images
+
+
+def _read(image: BulkImage, max_image_bytes: int) -> bytes:
+    if image.member is None:
+        with open(image.path, "rb") as f:
+            return f.read()
+    with zipfile.ZipFile(image.path) as archive, archive.open(image.member) as member:
+        # The declared size was checked, but the stream is what counts
+        data = member.read(max_image_bytes + 1)
+    if len(data) > max_image_bytes:
+        raise _ImageTooLarge()
+    return data
+
+
+async def _process(
+    index: int,
+    image: BulkImage,
+    settings: RemoveBgSettings,
+    pipeline: asyncio.Semaphore,
+    max_image_bytes: int,
+    output_format: str,
+) -> _Result:
+    result = _Result(index, image)
+    async with pipeline:
+        started = time.perf_counter()
+        try:
+            with span("remove_bg.image", **{"image.index": index}):
+                data = await asyncio.to_thread(_read, image, max_image_bytes)
+                prepared = await asyncio.to_thread(ImageService.prepare, data, settings)
+                del data
+                cutout, result.cache = await asyncio.to_thread(
+                    ImageService.cached_cutout, prepared, settings
+                )
+                if cutout is None:
+                    async with get_slot("rembg", REMBG_SLOTS).acquire():
+                        cutout = await asyncio.to_thread(ImageService.infer, prepared, settings)
+                result.data = await asyncio.to_thread(ImageService.encode, cutout, output_format)
+        except _ImageTooLarge:
+            result.error = "Image exceeds maximum size"
+        except (UnidentifiedImageError, Image.DecompressionBombError, ValueError, OSError) as e:
+            logger.info(f"Bulk remove-bg skipped {image.name}: {e}")
+            result.error = "Invalid image content"
+        except Exception as e:
+            logger.error(f"Bulk remove-bg failed for {image.name}: {e}", exc_info=True)
+            result.error = "Failed to remove background"
+        result.seconds = time.perf_counter() - started
+    return result
+
+
+def _output_name(name: str, taken: set[str], ext: str) -> str:
+    stem = Path(os.path.basename(name)).stem or "image"
+    candidate = f"{stem}.{ext}"
+    counter = 2
+    while candidate in taken:
+        candidate = f"{stem}_{counter}.{ext}"
+        counter += 1
+    taken.add(candidate)
+    return candidate
+
+
+class BulkRemoveBgService:
+    @staticmethod
+    async def stream_zip(
+        images: list[BulkImage],
+        max_image_bytes: int,
+        on_close: Callable[[], None],
+        output_format: str = "png",
+        full_resolution: bool | None = None,
+    ) -> AsyncIterator[bytes]:
+        """ZIP of the cutouts, streamed as each image finishes, then manifest.json."""
+        settings = RemoveBgSettings.from_env(full_resolution)
+        ext, _ = OUTPUT_FORMATS[output_format]
+        pipeline = asyncio.Semaphore(max(1, REMBG_BULK_PIPELINE_DEPTH))
+        tasks = [
+            asyncio.create_task(
+                _process(index, image, settings, pipeline, max_image_bytes, output_format)
+            )
+            for index, image in enumerate(images)
+        ]
+        sink = ChunkBuffer()
+        archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+        taken = {"manifest.json"}
+        manifest: list[dict | None] = [None] * len(images)
+        started = time.perf_counter()
+
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                entry = {"input": result.image.name, "seconds": round(result.seconds, 3)}
+                if result.data is not None:
+                    entry["output"] = _output_name(result.image.name, taken, ext)
+                    entry["cache"] = result.cache
+                    archive.writestr(entry["output"], result.data)
+                else:
+                    entry["error"] = result.error
+                manifest[result.index] = entry
+                yield sink.drain()
+
+            failed = sum(1 for entry in manifest if "error" in entry)
+            archive.writestr(
+                "manifest.json",
+                json.dumps(
+                    {
+                        "images": manifest,
+                        "succeeded": len(images) - failed,
+                        "failed": failed,
+                    },
+                    indent=2,
+                ),
+            )
+            archive.close()
+            yield sink.drain()
+            logger.info(
+                f"Bulk remove-bg: {len(images) - failed}/{len(images)} images "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+        finally:
+            # Client gone or finished: stop images that have not started yet
+            for task in tasks:
+                task.cancel()
+            on_close()
@@ -0,0 +1,296 @@
+"""
+Store effectively grayscale or black-and-white images that way.
+
+Scanners and phone apps often save black-and-white pages as full-color
+JPEG. Ghostscript only resamples those, so three channels of (nearly)
+identical data survive compression. This pre-pass classifies each large
+image from a sample of its pixels with NumPy:
+
+- gray: almost no pixel has chroma (spread between its R, G and B values)
+  above JPEG noise level. Re-encoded as an 8-bit gray JPEG.
+- bilevel: gray, and the luminance histogram splits into a dark and a light
+  cluster with almost nothing in between (text scans, line art).
+  Thresholded at the Otsu level and stored as 1-bit CCITT G4.
+
+Ghostscript then keeps gray images gray and mono images as CCITT, and
+applies the mono resolution of the profile to them. A replacement is only
+kept when it is smaller than the original.
+"""
+
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pikepdf
+from PIL import Image, TiffImagePlugin
+
+logger = logging.getLogger(__name__)
+
+COLOR_REDUCTION_MODES = ("none", "gray", "bilevel")
+
+GRAY_MAX_CHROMA = int(os.getenv("GRAY_MAX_CHROMA", "24"))
+GRAY_MAX_COLOR_FRACTION = float(os.getenv("GRAY_MAX_COLOR_FRACTION", "0.005"))
+BILEVEL_MIN_CONTRAST = int(os.getenv("BILEVEL_MIN_CONTRAST", "96"))
+BILEVEL_MAX_MIDTONE_FRACTION = float(os.getenv("BILEVEL_MAX_MIDTONE_FRACTION", "0.04"))
+COLOR_REDUCTION_WORKERS = int(os.getenv("COLOR_REDUCTION_WORKERS", "4"))
+
+# Small images (icons, logos) are not worth a decode
+_MIN_PIXELS = 256 * 256
+_SAMPLE_PIXELS = 250_000
+_BATCH = 16
+_LUMA = np.array([299, 587, 114], dtype=np.int32)
+
+
+@dataclass
+class ColorReductionStats:
+    gray: int = 0
+    bilevel: int = 0
+    bytes_saved: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.gray + self.bilevel
+
+
+@dataclass
+class _Candidate:
+    objgen: tuple[int, int]
+    width: int
+    height: int
+    # Raw JPEG bytes, or decoded 8-bit pixel rows in mode
+    data: bytes
+    jpeg: bool
+    mode: str
+    original_size: int
+
+
+@dataclass
+class _Replacement:
+    objgen: tuple[int, int]
+    kind: str
+    data: bytes
+
+
+def _channels(colorspace) -> int | None:
+    if colorspace == pikepdf.Name.DeviceRGB:
+        return 3
+    if colorspace == pikepdf.Name.DeviceGray:
+        return 1
+    if isinstance(colorspace, pikepdf.Array) and len(colorspace) == 2 and colorspace[0] == pikepdf.Name.ICCBased:
+        n = int(colorspace[1].get("/N", 0))
+        return n if n in (1, 3) else None
+    return None
+
+
+def _candidate(stream: pikepdf.Stream) -> _Candidate | None:
+    """Images this pass can decode and re-encode losslessly in structure."""
+    if stream.get("/ImageMask") or stream.get("/Decode") is not None:
+        return None
+    if int(stream.get("/BitsPerComponent", 8)) != 8:
+        return None
+    width, height = int(stream.get("/Width", 0)), int(stream.get("/Height", 0))
+    if width * height < _MIN_PIXELS:
+        return None
+    channels = _channels(stream.get("/ColorSpace"))
+    if channels is None:
+        return None
+
+    filters = stream.get("/Filter")
+    if isinstance(filters, pikepdf.Array):
+        filters = filters[0] if len(filters) == 1 else None
+    mode = "RGB" if channels == 3 else "L"
+    raw_size = len(stream.read_raw_bytes())
+
+    if filters == pikepdf.Name.DCTDecode:
+        return _Candidate(stream.objgen, width, height, stream.read_raw_bytes(), True, mode, raw_size)
+    if filters in (None, pikepdf.Name.FlateDecode, pikepdf.Name.LZWDecode):
+        data = stream.read_bytes()
+        if len(data) != width * height * channels:
+            return None
+        return _Candidate(stream.objgen, width, height, data, False, mode, raw_size)
+    return None
+
+
+def _sample(candidate: _Candidate) -> np.ndarray:
+    """About _SAMPLE_PIXELS pixels of the image as an (n, channels) int32 array."""
+    step = max(1, int((candidate.width * candidate.height / _SAMPLE_PIXELS) ** 0.5))
+    if candidate.jpeg:
+        with Image.open(io.BytesIO(candidate.data)) as image:
+            # DCT scaling decodes at 1/2..1/8 size for a fraction of the cost
+            image.draft(image.mode, (candidate.width // step, candidate.height // step))
+            pixels = np.asarray(image.convert(candidate.mode))
+    else:
+        channels = 3 if candidate.mode == "RGB" else 1
+        pixels = np.frombuffer(candidate.data, dtype=np.uint8).reshape(
+            candidate.height, candidate.width, channels
+        )[::step, ::step]
+    return pixels.reshape(-1, 3 if candidate.mode == "RGB" else 1).astype(np.int32)
+
+
+def _otsu(luma: np.ndarray) -> int:
+    histogram = np.bincount(luma, minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_dark = np.cumsum(histogram)
+    weight_light = weight_dark[-1] - weight_dark
+    sum_dark = np.cumsum(histogram * levels)
+    mean_dark = sum_dark / np.maximum(weight_dark, 1)
+    mean_light = (sum_dark[-1] - sum_dark) / np.maximum(weight_light, 1)
+    between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    return int(np.argmax(between))
+
+
+def classify(pixels: np.ndarray) -> tuple[str, int]:
+    """("color" | "gray" | "bilevel", threshold) for an (n, 1 or 3) pixel sample."""
+    if pixels.shape[1] == 3:
+        chroma = pixels.max(axis=1) - pixels.min(axis=1)
+        if np.count_nonzero(chroma > GRAY_MAX_CHROMA) > GRAY_MAX_COLOR_FRACTION * len(chroma):
+            return "color", 0
+        luma = (pixels @ _LUMA) // 1000
+    else:
+        luma = pixels[:, 0]
+
+    threshold = _otsu(luma)
+    dark = luma <= threshold
+    if not dark.any() or dark.all():
+        # Blank page: still one cluster, as bilevel as it gets
+        return "bilevel", threshold
+    mean_dark = luma[dark].mean()
+    mean_light = luma[~dark].mean()
+    contrast = mean_light - mean_dark
+    if contrast < BILEVEL_MIN_CONTRAST:
+        return "gray", threshold
+
+    # Pixels far from both cluster centres are real midtones (photos, shading)
+    margin = contrast / 4
+    midtones = (luma > mean_dark + margin) & (luma < mean_light - margin)
+    if np.count_nonzero(midtones) > BILEVEL_MAX_MIDTONE_FRACTION * len(luma):
+        return "gray", threshold
+    return "bilevel", threshold
+
+
+def _full_gray(candidate: _Candidate) -> Image.Image:
+    if candidate.jpeg:
+        with Image.open(io.BytesIO(candidate.data)) as image:
+            return image.convert("L")
+    return Image.frombytes(candidate.mode, (candidate.width, candidate.height), candidate.data).convert("L")
+
+
+def _encode_g4(bitmap: Image.Image) -> bytes:
+    """
+    Raw CCITT G4 data of a mode "1" image (a single-strip TIFF's only strip).
+    The encoder codes 1 bits as black runs, so pass ink as 1 (an inverted bitmap).
+    """
+    buffer = io.BytesIO()
+    bitmap.save(buffer, "TIFF", compression="group4", strip_size=2**31 - 1)
+    with Image.open(io.BytesIO(buffer.getvalue())) as tiff:
+        offsets = tiff.tag_v2[TiffImagePlugin.STRIPOFFSETS]
+        counts = tiff.tag_v2[TiffImagePlugin.STRIPBYTECOUNTS]
+    if len(offsets) != 1:
+        raise ValueError("G4 encoder produced more than one strip")
+    return buffer.getvalue()[offsets[0] : offsets[0] + counts[0]]
+
+
+def _reduce(candidate: _Candidate, mode: str, jpeg_quality: int) -> _Replacement | None:
+    """Worker: classify and re-encode one image (no pikepdf objects are touched)."""
+    try:
+        kind, threshold = classify(_sample(candidate))
+        if kind == "color" or (kind == "gray" and candidate.mode == "L"):
+            return None
+        if kind == "bilevel" and mode != "bilevel":
+            kind = "gray"
+            if candidate.mode == "L":
+                return None
+
+        gray = _full_gray(candidate)
+        if kind == "bilevel":
+            # Ink as 1 bits: paper is coded as white runs and decodes white with BlackIs1 false
+            bitmap = gray.point(lambda value: 0 if value > threshold else 255).convert("1")
+            data = _encode_g4(bitmap)
+        else:
+            buffer = io.BytesIO()
+            gray.save(buffer, "JPEG", quality=jpeg_quality, optimize=True)
+            data = buffer.getvalue()
+    except Exception as e:
+        logger.debug(f"Color reduction skipped image {candidate.objgen}: {e}")
+        return None
+
+    if len(data) >= candidate.original_size * 0.9:
+        return None
+    return _Replacement(candidate.objgen, kind, data)
+
+
+def _apply(stream: pikepdf.Stream, replacement: _Replacement, width: int, height: int):
+    if replacement.kind == "bilevel":
+        stream.write(
+            replacement.data,
+            filter=pikepdf.Name.CCITTFaxDecode,
+            decode_parms=pikepdf.Dictionary(
+                K=-1, Columns=width, Rows=height, BlackIs1=False
+            ),
+        )
+        stream.BitsPerComponent = 1
+    else:
+        stream.write(replacement.data, filter=pikepdf.Name.DCTDecode)
+        stream.BitsPerComponent = 8
+    stream.ColorSpace = pikepdf.Name.DeviceGray
+
+
+def reduce_colors(pdf: pikepdf.Pdf, mode: str = "bilevel", jpeg_quality: int = 75) -> ColorReductionStats:
+    """Rewrite gray-looking images of pdf in place; mode "gray" never goes to 1 bit."""
+    stats = ColorReductionStats()
+    if mode == "none":
+        return stats
+
+    streams = {}
+    candidates = []
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == pikepdf.Name.Image:
+            try:
+                candidate = _candidate(obj)
+            except pikepdf.PdfError:
+                continue
+            if candidate:
+                streams[obj.objgen] = obj
+                candidates.append(candidate)
+
+    # Decode/encode in threads (Pillow and NumPy release the GIL); batches
+    # bound how many decoded pages are held at once
+    with ThreadPoolExecutor(max_workers=max(1, COLOR_REDUCTION_WORKERS)) as pool:
+        for start in range(0, len(candidates), _BATCH):
+            batch = candidates[start : start + _BATCH]
+            for candidate, replacement in zip(
+                batch, pool.map(lambda c: _reduce(c, mode, jpeg_quality), batch)
+            ):
+                if replacement is None:
+                    continue
+                _apply(streams[candidate.objgen], replacement, candidate.width, candidate.height)
+                stats.bytes_saved += candidate.original_size - len(replacement.data)
+                if replacement.kind == "bilevel":
+                    stats.bilevel += 1
+                else:
+                    stats.gray += 1
+
+    if stats.total:
+        logger.info(
+            f"Color reduction: {stats.gray} images to gray, {stats.bilevel} to bilevel, "
+            f"saving {stats.bytes_saved / 1024:.0f} KB"
+        )
+    return stats
+
+
+def reduce_colors_file(
+    input_path: str, output_path: str, mode: str = "bilevel", jpeg_quality: int = 75
+) -> ColorReductionStats:
+    """reduce_colors on a file; output_path is only written when an image changed."""
+    with pikepdf.open(input_path) as pdf:
+        stats = reduce_colors(pdf, mode, jpeg_quality)
+        if stats.total:
+            pdf.save(
+                output_path,
+                object_stream_mode=pikepdf.ObjectStreamMode.preserve,
+                recompress_flate=False,
+            )
+    return stats
@@ -0,0 +1,226 @@
+"""
+Compression profiles for /compress.
+
+A profile bundles everything that decides the size/quality trade-off of a
+Ghostscript pdfwrite pass (image resolution and downsampling threshold, JPEG
+quality, color conversion, font embedding), the pre-pass that re-encodes
+gray-looking scans as gray or bilevel images, and the qpdf post-pass that
+writes object and cross-reference streams and optionally linearizes.
+
+The built-in low/medium/high profiles can be overridden, and new profiles
+added, with a JSON file named by COMPRESSION_PROFILES_FILE:
+
+    {
+      "medium": {"color_dpi": 120},
+      "archive": {"extends": "high", "color_conversion": "gray", "linearize": true}
+    }
+"""
+
+import os
+import json
+import logging
+from dataclasses import dataclass, asdict, fields, replace
+
+from app.services.color_reduction import COLOR_REDUCTION_MODES
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_PROFILES_FILE = os.getenv("COMPRESSION_PROFILES_FILE", "")
+DEFAULT_COMPRESSION_PROFILE = os.getenv("DEFAULT_COMPRESSION_PROFILE", "medium")
+
+COLOR_CONVERSIONS = {
+    "none": [],
+    "rgb": ["-sColorConversionStrategy=RGB", "-sProcessColorModel=DeviceRGB"],
+    "gray": ["-sColorConversionStrategy=Gray", "-sProcessColorModel=DeviceGray"],
+}
+
+
+class ProfileError(ValueError):
+    """Raised for an unknown profile or an invalid profile definition."""
+
+
+@dataclass(frozen=True)
+class CompressionProfile:
+    name: str
+    description: str = ""
+    # Ghostscript base preset; the fields below override what it sets
+    pdfsettings: str = "/ebook"
+    color_dpi: int = 150
+    gray_dpi: int = 150
+    mono_dpi: int = 300
+    # Images are only downsampled when above dpi * threshold
+    downsample_threshold: float = 1.5
+    jpeg_quality: int = 75
+    color_conversion: str = "none"
+    # Pre-pass for color images that are really gray or black-and-white:
+    # "gray" stores them as 8-bit gray, "bilevel" also allows 1-bit CCITT
+    color_reduction: str = "none"
+    subset_fonts: bool = True
+    embed_fonts: bool = True
+    # qpdf post-pass: object + xref streams (PDF 1.5) and linearization
+    object_streams: bool = True
+    linearize: bool = False
+
+    def validate(self):
+        if not self.pdfsettings.startswith("/"):
+            raise ProfileError(f"{self.name}: pdfsettings must be a Ghostscript preset like /ebook")
+        for key in ("color_dpi", "gray_dpi", "mono_dpi"):
+            if not 10 <= getattr(self, key) <= 2400:
+                raise ProfileError(f"{self.name}: {key} must be between 10 and 2400")
+        if not 1.0 <= self.downsample_threshold <= 10.0:
+            raise ProfileError(f"{self.name}: downsample_threshold must be between 1.0 and 10.0")
+        if not 1 <= self.jpeg_quality <= 100:
+            raise ProfileError(f"{self.name}: jpeg_quality must be between 1 and 100")
+        if self.color_conversion not in COLOR_CONVERSIONS:
+            raise ProfileError(
+                f"{self.name}: color_conversion must be one of {', '.join(COLOR_CONVERSIONS)}"
+            )
+        if self.color_reduction not in COLOR_REDUCTION_MODES:
+            raise ProfileError(
+                f"{self.name}: color_reduction must be one of {', '.join(COLOR_REDUCTION_MODES)}"
+            )
+
+    @property
+    def compatibility_level(self) -> str:
+        # Object and xref streams need PDF 1.5
+        return "1.5" if self.object_streams else "1.4"
+
+    @property
+    def qfactor(self) -> float:
+        """Ghostscript DCT QFactor for jpeg_quality (libjpeg quality scaling)."""
+        q = self.jpeg_quality
+        scale = 5000 / q if q < 50 else 200 - 2 * q
+        return round(max(scale, 1) / 100, 3)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+BUILTIN_PROFILES = {
+    "low": CompressionProfile(
+        name="low",
+        description="Smallest file, for screen viewing",
+        pdfsettings="/screen",
+        color_dpi=96,
+        gray_dpi=96,
+        mono_dpi=200,
+        downsample_threshold=1.2,
+        jpeg_quality=55,
+        color_reduction="bilevel",
+    ),
+    "medium": CompressionProfile(
+        name="medium",
+        description="Balanced size and quality for e-books and sharing",
+        pdfsettings="/ebook",
+        color_dpi=150,
+        gray_dpi=150,
+        mono_dpi=300,
+        downsample_threshold=1.5,
+        jpeg_quality=75,
+        color_reduction="bilevel",
+    ),
+    "high": CompressionProfile(
+        name="high",
+        description="Print quality, only oversized images are reduced",
+        pdfsettings="/printer",
+        color_dpi=300,
+        gray_dpi=300,
+        mono_dpi=600,
+        downsample_threshold=1.5,
+        jpeg_quality=90,
+        color_reduction="gray",
+    ),
+}
+
+_FIELD_NAMES = {f.name for f in fields(CompressionProfile)}
+
+
+def _load_profiles(path: str) -> dict[str, CompressionProfile]:
+    profiles = dict(BUILTIN_PROFILES)
+    if not path:
+        return profiles
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Cannot read compression profiles from {path}, using built-ins: {e}")
+        return profiles
+
+    for name, spec in overrides.items():
+        try:
+            spec = dict(spec)
+            base = profiles.get(spec.pop("extends", name))
+            unknown = set(spec) - _FIELD_NAMES
+            if unknown:
+                raise ProfileError(f"{name}: unknown settings {', '.join(sorted(unknown))}")
+            spec["name"] = name
+            profile = replace(base, **spec) if base else CompressionProfile(**spec)
+            profile.validate()
+        except (ProfileError, TypeError, AttributeError) as e:
+            logger.error(f"Ignoring compression profile {name!r}: {e}")
+            continue
+        profiles[name] = profile
+
+    logger.info(f"Compression profiles loaded from {path}: {', '.join(profiles)}")
+    return profiles
+
+
+PROFILES = _load_profiles(COMPRESSION_PROFILES_FILE)
+
+if DEFAULT_COMPRESSION_PROFILE not in PROFILES:
+    logger.error(f"Default compression profile {DEFAULT_COMPRESSION_PROFILE!r} is not defined, using medium")
+    DEFAULT_COMPRESSION_PROFILE = "medium"
+
+
+def get_profile(name: str | None) -> CompressionProfile:
+    profile = PROFILES.get(name or DEFAULT_COMPRESSION_PROFILE)
+    if profile is None:
+        raise ProfileError(f"Unknown compression profile: {name}")
+    return profile
+
+
+def profile_names() -> list[str]:
+    return list(PROFILES)
+
+
+def gs_profile_args(profile: CompressionProfile) -> list[str]:
+    """pdfwrite switches for a profile (everything except input/output)."""
+    args = [
+        f"-dCompatibilityLevel={profile.compatibility_level}",
+        f"-dPDFSETTINGS={profile.pdfsettings}",
+        "-dDownsampleColorImages=true",
+        "-dDownsampleGrayImages=true",
+        "-dDownsampleMonoImages=true",
+        "-dColorImageDownsampleType=/Bicubic",
+        "-dGrayImageDownsampleType=/Bicubic",
+        "-dMonoImageDownsampleType=/Subsample",
+        f"-dColorImageResolution={profile.color_dpi}",
+        f"-dGrayImageResolution={profile.gray_dpi}",
+        f"-dMonoImageResolution={profile.mono_dpi}",
+        f"-dColorImageDownsampleThreshold={profile.downsample_threshold}",
+        f"-dGrayImageDownsampleThreshold={profile.downsample_threshold}",
+        f"-dMonoImageDownsampleThreshold={profile.downsample_threshold}",
+        f"-dSubsetFonts={'true' if profile.subset_fonts else 'false'}",
+        f"-dEmbedAllFonts={'true' if profile.embed_fonts else 'false'}",
+        "-dCompressFonts=true",
+        *COLOR_CONVERSIONS[profile.color_conversion],
+    ]
+    return args
+
+
+def gs_distiller_params(profile: CompressionProfile) -> list[str]:
+    """
+    PostScript fragment that pins the JPEG quality. pdfwrite still picks
+    JPEG or Flate per image (AutoFilter), but the JPEG it writes uses the
+    profile's QFactor instead of the preset's. Goes right before the input.
+    """
+    dct = (
+        f"<< /QFactor {profile.qfactor} /Blend 1 "
+        "/HSamples [2 1 1 2] /VSamples [2 1 1 2] >>"
+    )
+    return [
+        "-c",
+        f"<< /ColorACSImageDict {dct} /GrayACSImageDict {dct} >> setdistillerparams",
+        "-f",
+    ]
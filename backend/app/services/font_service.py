@@ -0,0 +1,190 @@
+import os
+import uuid
+import shutil
+import asyncio
+import logging
+import subprocess
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+LIBREOFFICE_PROFILE_TEMPLATE = os.getenv("LIBREOFFICE_PROFILE_TEMPLATE", "/tmp/libreoffice_template")
+FONT_WARMUP_TIMEOUT = int(os.getenv("FONT_WARMUP_TIMEOUT", "180"))
+
+# Written by LibreOffice once the profile (registry + font caches) is initialised
+_PROFILE_MARKER = os.path.join("user", "registrymodifications.xcu")
+
+_warm_status = {"fontconfig": False, "font_families": 0, "profile_template": False}
+
+
+@lru_cache(maxsize=1)
+def installed_font_families() -> frozenset[str] | None:
+    """
+    Lower-cased font family names known to fontconfig, or None when fc-list
+    is not available (font checks are then skipped).
+    """
+    if not shutil.which("fc-list"):
+        return None
+    try:
+        result = subprocess.run(
+            ["fc-list", ":", "family"],
+            capture_output=True,
+            text=True,
+            timeout=30,
+            check=True,
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"fc-list failed, skipping font checks: {e}")
+        return None
+
+    families = set()
+    for line in result.stdout.splitlines():
+        for family in line.split(","):
+            family = family.strip().lower()
+            if family:
+                families.add(family)
+    return frozenset(families)
+
+
+def _template_ready() -> bool:
+    return os.path.exists(os.path.join(LIBREOFFICE_PROFILE_TEMPLATE, _PROFILE_MARKER))
+
+
+def _build_fontconfig_cache() -> bool:
+    """Build stale fontconfig caches once and check fonts are actually visible."""
+    if not shutil.which("fc-cache"):
+        logger.warning("fc-cache not found, skipping fontconfig warm-up")
+        return False
+
+    try:
+        subprocess.run(["fc-cache"], capture_output=True, timeout=FONT_WARMUP_TIMEOUT, check=True)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"fc-cache failed: {e}")
+        return False
+
+    installed_font_families.cache_clear()
+    families = installed_font_families()
+    _warm_status["font_families"] = len(families or ())
+    if not families:
+        logger.warning("fontconfig cache built but no font families are installed")
+        return False
+
+    logger.info(f"fontconfig cache ready: {len(families)} font families")
+    return True
+
+
+def _build_profile_template() -> bool:
+    """
+    Initialise a LibreOffice user profile once (registry, font caches) so each
+    conversion can clone it instead of paying the first-start cost.
+    """
+    if _template_ready():
+        return True
+
+    binary = shutil.which("libreoffice") or shutil.which("soffice")
+    if not binary:
+        logger.warning("LibreOffice not found, skipping profile template")
+        return False
+
+    # Build next to the final location and rename, so concurrent workers
+    # never see a half-written template
+    staging_dir = f"{LIBREOFFICE_PROFILE_TEMPLATE}.{uuid.uuid4().hex}"
+    try:
+        subprocess.run(
+            [
+                binary,
+                f"-env:UserInstallation=file://{staging_dir}",
+                "--headless",
+                "--terminate_after_init",
+            ],
+            capture_output=True,
+            timeout=FONT_WARMUP_TIMEOUT,
+            check=False,
+        )
+        if not os.path.exists(os.path.join(staging_dir, _PROFILE_MARKER)):
+            logger.warning("LibreOffice did not initialise a profile, template not created")
+            return False
+
+        try:
+            os.rename(staging_dir, LIBREOFFICE_PROFILE_TEMPLATE)
+        except OSError:
+            # Another worker won the race
+            pass
+        logger.info(f"LibreOffice profile template ready: {LIBREOFFICE_PROFILE_TEMPLATE}")
+        return _template_ready()
+
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"LibreOffice profile warm-up failed: {e}")
+        return False
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+class FontService:
+    @staticmethod
+    def warm_up():
+        """Build the fontconfig cache and the LibreOffice profile template."""
+        _warm_status["fontconfig"] = _build_fontconfig_cache()
+        _warm_status["profile_template"] = _build_profile_template()
+
+    @staticmethod
+    async def warm_up_async():
+        try:
+            await asyncio.to_thread(FontService.warm_up)
+        except Exception as e:
+            logger.error(f"Font warm-up failed: {e}", exc_info=True)
+
+    @staticmethod
+    def status() -> dict:
+        return dict(_warm_status)
+
+    @staticmethod
+    async def create_user_profile() -> str:
+        """
+        Create an isolated LibreOffice user profile directory for one conversion.
+
+        When the template is ready it is cloned with `cp --reflink=auto`, which
+        is copy-on-write on filesystems that support it and a plain copy
+        elsewhere. Otherwise an empty directory is returned and LibreOffice
+        initialises the profile itself.
+        """
+        unique_user_dir = f"/tmp/libreoffice_{uuid.uuid4().hex}"
+
+        if _template_ready():
+            process = await asyncio.create_subprocess_exec(
+                "cp",
+                "-a",
+                "--reflink=auto",
+                LIBREOFFICE_PROFILE_TEMPLATE,
+                unique_user_dir,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await process.communicate()
+            if process.returncode == 0:
+                return unique_user_dir
+
+            logger.warning(
+                f"Cloning LibreOffice profile template failed: {stderr.decode(errors='replace')}"
+            )
+            shutil.rmtree(unique_user_dir, ignore_errors=True)
+
+        os.makedirs(unique_user_dir, exist_ok=True)
+        return unique_user_dir
+
+    @staticmethod
+    def substitute_for(family: str) -> str | None:
+        """The family fontconfig would render instead of a missing one."""
+        if not shutil.which("fc-match"):
+            return None
+        try:
+            result = subprocess.run(
+                ["fc-match", "-f", "%{family}", family],
+                capture_output=True,
+                text=True,
+                timeout=10,
+                check=True,
+            )
+        except (subprocess.SubprocessError, OSError):
+            return None
+        return result.stdout.split(",")[0].strip() or None
@@ -2,14 +2,78 @@ import asyncio
 import io
 import logging
 import os
+import time
+from dataclasses import MISSING, dataclass, fields
 from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from rembg import new_session, remove
-from PIL import Image
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.services import mask_cache
+from app.services.mask_refine import GuidedCoefficients, guided_coefficients
+from app.utils.concurrency import get_slot
+from app.utils.tiling import PngStripWriter, iter_strips
+from app.utils.tracing import span
+
+if TYPE_CHECKING:
+    import onnxruntime as ort
 
 logger = logging.getLogger(__name__)
 
 
+REMBG_FULL_RESOLUTION = os.getenv("REMBG_FULL_RESOLUTION", "0").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+REMBG_WEBP_QUALITY = int(os.getenv("REMBG_WEBP_QUALITY", "90"))
+# Concurrent inferences per worker ("rembg" slot), shared by single and bulk requests
+REMBG_SLOTS = int(os.getenv("REMBG_SLOTS", "1"))
+REMBG_MODEL_VARIANT = os.getenv("REMBG_MODEL_VARIANT", "fp32").strip().lower()
+
+# fp32 is the stock model; the others are converted copies next to it in
+# U2NET_HOME: <model>.int8.onnx, <model>.fp16.onnx (scripts/quantize_rembg_model.py)
+MODEL_VARIANTS = ("fp32", "int8", "fp16")
+# rembg session types that load a model file with the same pre/post-processing
+_CUSTOM_SESSIONS = {
+    "isnet-general-use": "dis_custom",
+    "isnet-anime": "dis_custom",
+    "u2net": "u2net_custom",
+    "u2netp": "u2net_custom",
+    "silueta": "u2net_custom",
+}
+# REMBG_GRAPH_OPTIMIZATION -> onnxruntime.GraphOptimizationLevel member
+_GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+# output form value -> (file extension, media type)
+OUTPUT_FORMATS = {
+    "png": ("png", "image/png"),
+    "webp": ("webp", "image/webp"),
+    "mask": ("png", "image/png"),
+}
+
+
+@lru_cache(maxsize=1)
+def _rembg():
+    """
+    rembg, imported on first use. With onnxruntime, pymatting, numba and
+    scipy it costs about a second and a hundred MB per process, which
+    workers that never remove a background should not pay.
+    """
+    started = time.perf_counter()
+    import rembg
+
+    logger.info("rembg imported in %.2fs", time.perf_counter() - started)
+    return rembg
+
+
 def _execution_providers() -> list[str]:
     """
     Default: CPU only — avoids native crashes / ERR_EMPTY_RESPONSE when CUDA
@@ -26,105 +90,412 @@ def _u2net_home() -> str:
     return os.getenv("U2NET_HOME", "/app/.u2net")
 
 
-def _model_filename(model_name: str) -> str:
-    return f"{model_name}.onnx"
+def _model_filename(model_name: str, variant: str = "fp32") -> str:
+    if variant == "fp32":
+        return f"{model_name}.onnx"
+    return f"{model_name}.{variant}.onnx"
+
+
+def _is_local_model_available(model_name: str, variant: str = "fp32") -> bool:
+    return os.path.exists(os.path.join(_u2net_home(), _model_filename(model_name, variant)))
+
+
+@lru_cache(maxsize=8)
+def _model_variant(model_name: str) -> str:
+    """REMBG_MODEL_VARIANT for model_name, or fp32 when that variant cannot be loaded."""
+    variant = REMBG_MODEL_VARIANT
+    if variant == "fp32":
+        return variant
+    if variant not in MODEL_VARIANTS:
+        logger.warning("Unknown REMBG_MODEL_VARIANT '%s', using fp32", variant)
+        return "fp32"
+    if model_name not in _CUSTOM_SESSIONS:
+        logger.warning("No %s variant support for model '%s', using fp32", variant, model_name)
+        return "fp32"
+    if not _is_local_model_available(model_name, variant):
+        logger.warning(
+            "%s not found in '%s', using fp32",
+            _model_filename(model_name, variant),
+            _u2net_home(),
+        )
+        return "fp32"
+    return variant
 
 
-def _is_local_model_available(model_name: str) -> bool:
-    return os.path.exists(os.path.join(_u2net_home(), _model_filename(model_name)))
+def session_options() -> "ort.SessionOptions":
+    """
+    ONNX Runtime options from the environment: graph optimization level
+    (REMBG_GRAPH_OPTIMIZATION), intra/inter-op thread counts (0 = runtime
+    default, one per core) and the CPU memory arena / memory pattern planner.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    level = os.getenv("REMBG_GRAPH_OPTIMIZATION", "all").strip().lower()
+    if level not in _GRAPH_OPTIMIZATION_LEVELS:
+        logger.warning("Unknown REMBG_GRAPH_OPTIMIZATION '%s', using all", level)
+        level = "all"
+    options.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel, _GRAPH_OPTIMIZATION_LEVELS[level]
+    )
+    options.intra_op_num_threads = int(os.getenv("REMBG_INTRA_OP_THREADS", "0"))
+    options.inter_op_num_threads = int(os.getenv("REMBG_INTER_OP_THREADS", "0"))
+    enabled = ("1", "true", "yes", "on")
+    options.enable_cpu_mem_arena = os.getenv("REMBG_CPU_MEM_ARENA", "1").strip().lower() in enabled
+    options.enable_mem_pattern = os.getenv("REMBG_MEM_PATTERN", "1").strip().lower() in enabled
+    return options
 
 
 @lru_cache(maxsize=4)
-def _get_session(model_name: str):
+def _get_session(model_name: str, variant: str = "fp32"):
     """
-    Create singleton rembg session by model.
+    Create singleton rembg session by model and variant.
     GPU only when REMBG_USE_CUDA=1 and onnxruntime-gpu is installed.
     """
     providers = _execution_providers()
 
     logger.info(
-        "Initializing rembg session with model=%s providers=%s",
+        "Initializing rembg session with model=%s variant=%s providers=%s",
         model_name,
+        variant,
         providers,
     )
-    return new_session(model_name=model_name, providers=providers)
+    rembg = _rembg()
+    if variant != "fp32":
+        return rembg.new_session(
+            _CUSTOM_SESSIONS[model_name],
+            sess_opts=session_options(),
+            providers=providers,
+            model_path=os.path.join(_u2net_home(), _model_filename(model_name, variant)),
+        )
+    return rembg.new_session(
+        model_name=model_name, sess_opts=session_options(), providers=providers
+    )
+
+
+def _select_session(preferred_model: str, variant: str = "fp32"):
+    """
+    Return the rembg session for preferred_model, preferring models already
+    present in U2NET_HOME over an online download. Variants are only ever
+    local (_model_variant checked the file).
+    """
+    if variant != "fp32":
+        return _get_session(preferred_model, variant)
+
+    # Prioritas: model lokal lebih dulu (cepat dan konsisten).
+    model_candidates = [preferred_model, "isnet-general-use"]
+    model_candidates = list(dict.fromkeys(model_candidates))
+
+    selected_model = next(
+        (m for m in model_candidates if _is_local_model_available(m)),
+        None,
+    )
+
+    if not selected_model:
+        logger.warning(
+            "No local rembg model found in '%s'. Trying online fetch for model '%s'.",
+            _u2net_home(),
+            preferred_model,
+        )
+        try:
+            return _get_session(preferred_model)
+        except Exception as exc:
+            raise RuntimeError(
+                "No local rembg model found and online model download failed. "
+                f"Place isnet-general-use.onnx in '{_u2net_home()}', "
+                "or ensure container DNS/internet works."
+            ) from exc
+    return _get_session(selected_model)
+
+
+def model_status() -> dict:
+    """Configured model and whether its session is loaded in this process (no loading)."""
+    model = _preferred_model()
+    return {
+        "model": model,
+        "variant": _model_variant(model),
+        "warm": _get_session.cache_info().currsize > 0,
+    }
+
+
+def _preferred_model() -> str:
+    # Lock to IS-Net family for consistent quality.
+    return os.getenv("REMBG_MODEL_NAME", "isnet-general-use")
+
+
+def _cutout_from_mask(img: Image.Image, mask: Image.Image, alpha_matting: bool) -> Image.Image:
+    """
+    Rebuild what rembg.remove returns from its final alpha mask. With alpha
+    matting the foreground colors are re-estimated (the expensive alpha
+    estimation and the inference itself are what the mask saves).
+    """
+    _rembg()
+    from rembg.bg import naive_cutout
+    from pymatting import estimate_foreground_ml, stack_images
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if not alpha_matting:
+        return naive_cutout(img, mask)
+    alpha = np.asarray(mask, dtype=np.float64) / 255.0
+    foreground = estimate_foreground_ml(np.asarray(img) / 255.0, alpha)
+    cutout = np.clip(stack_images(foreground, alpha) * 255, 0, 255).astype(np.uint8)
+    return Image.fromarray(cutout)
+
+
+def preload_session():
+    """
+    Load the rembg model ahead of the first request. The launcher calls this
+    before forking workers so the model weights are shared copy-on-write.
+    """
+    model = _preferred_model()
+    return _select_session(model, _model_variant(model))
+
+
+@dataclass(frozen=True)
+class RemoveBgSettings:
+    """Everything besides the image that shapes a cutout (also the mask cache key)."""
+
+    model: str
+    max_side: int
+    alpha_matting: bool
+    fg_threshold: int
+    bg_threshold: int
+    erosion_size: int
+    # Segment at max_side, then upsample the mask onto the untouched original
+    full_resolution: bool = False
+    model_variant: str = "fp32"
+
+    @classmethod
+    def from_env(cls, full_resolution: bool | None = None) -> "RemoveBgSettings":
+        if full_resolution is None:
+            full_resolution = REMBG_FULL_RESOLUTION
+        model = _preferred_model()
+        if full_resolution:
+            # Guided upsampling refines the edges; alpha matting would run at model size only
+            return cls(
+                model=model,
+                max_side=int(os.getenv("REMBG_MASK_SIDE", "1024")),
+                alpha_matting=False,
+                fg_threshold=0,
+                bg_threshold=0,
+                erosion_size=0,
+                full_resolution=True,
+                model_variant=_model_variant(model),
+            )
+        return cls(
+            model=model,
+            max_side=int(os.getenv("REMBG_MAX_SIDE", "1600")),
+            alpha_matting=os.getenv("REMBG_ALPHA_MATTING", "1").strip().lower()
+            in ("1", "true", "yes", "on"),
+            fg_threshold=int(os.getenv("REMBG_ALPHA_FOREGROUND_THRESHOLD", "240")),
+            bg_threshold=int(os.getenv("REMBG_ALPHA_BACKGROUND_THRESHOLD", "10")),
+            erosion_size=int(os.getenv("REMBG_ALPHA_EROSION_SIZE", "10")),
+            model_variant=_model_variant(model),
+        )
+
+    @property
+    def cache_key(self) -> str:
+        # Optional fields at their default are left out, so adding one keeps existing keys
+        settings = {
+            field.name: getattr(self, field.name)
+            for field in fields(self)
+            if field.default is MISSING or getattr(self, field.name) != field.default
+        }
+        return mask_cache.settings_key(**settings)
+
+
+@dataclass
+class PreparedImage:
+    # What the model sees: EXIF orientation applied, longest side <= max_side
+    image: Image.Image
+    digest: str
+    fingerprint: mask_cache.Fingerprint | None
+    # Full-resolution mode only: the oriented image at its own size
+    original: Image.Image | None = None
+
+
+@dataclass
+class FullResolutionCutout:
+    """
+    Full-resolution cutout that is never materialized as one RGBA frame:
+    encode() writes it strip by strip from the original and the guided
+    filter coefficients.
+    """
+
+    original: Image.Image
+    coefficients: GuidedCoefficients
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.original.size
+
+    def strips(self):
+        """(top, RGB rows, alpha rows) from top to bottom."""
+        width, height = self.original.size
+        for top, bottom in iter_strips(height):
+            region = self.original.crop((0, top, width, bottom))
+            alpha = self.coefficients.alpha_rows(region, top)
+            if region.mode != "RGB":
+                region = region.convert("RGB")
+            yield top, np.asarray(region), alpha
+
+    def to_image(self) -> Image.Image:
+        """Full RGBA frame, for encoders that need one (WebP)."""
+        cutout = Image.new("RGBA", self.size)
+        for top, rgb, alpha in self.strips():
+            cutout.paste(Image.fromarray(np.dstack((rgb, alpha)), mode="RGBA"), (0, top))
+        return cutout
 
 
 class ImageService:
+    """
+    Background removal in stages (prepare -> cached cutout or inference ->
+    encode), so bulk jobs can run them as a pipeline. All stages are
+    blocking and meant for worker threads.
+    """
+
     @staticmethod
-    async def remove_background(image_bytes: bytes) -> bytes:
+    def prepare(image_bytes: bytes, settings: RemoveBgSettings) -> PreparedImage:
         if not image_bytes:
             raise ValueError("Empty image bytes")
+        with span("remove_bg.prepare"):
+            # Not closed: that would free the decoded pixels (nothing else to release for BytesIO)
+            img = Image.open(io.BytesIO(image_bytes))
+            if not settings.full_resolution:
+                # JPEG: let the decoder scale down by 1/2..1/8 so the full frame is never decoded
+                scale = settings.max_side / float(max(img.size))
+                if scale < 1:
+                    img.draft("RGB", (int(img.width * scale) + 1, int(img.height * scale) + 1))
+            img.load()
+            # In place: no second full-frame copy when there is no orientation to apply
+            ImageOps.exif_transpose(img, in_place=True)
+        original = img if settings.full_resolution else None
+        # Resize gambar besar untuk menurunkan beban CPU/RAM saat inferensi.
+        width, height = img.size
+        longest_side = max(width, height)
+        if longest_side > settings.max_side:
+            ratio = settings.max_side / float(longest_side)
+            new_size = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+            img = img.resize(new_size, Image.LANCZOS)
+        if mask_cache.REMBG_CACHE_PERCEPTUAL:
+            image_fingerprint = mask_cache.fingerprint(img)
+        else:
+            image_fingerprint = None
+        return PreparedImage(
+            image=img,
+            digest=mask_cache.content_hash(image_bytes),
+            fingerprint=image_fingerprint,
+            original=original,
+        )
 
-        def _process() -> bytes:
-            # Lock to IS-Net family for consistent quality.
-            preferred_model = os.getenv("REMBG_MODEL_NAME", "isnet-general-use")
-            max_side = int(os.getenv("REMBG_MAX_SIDE", "1600"))
-            alpha_matting = os.getenv("REMBG_ALPHA_MATTING", "1").strip().lower() in (
-                "1",
-                "true",
-                "yes",
-                "on",
-            )
-            fg_threshold = int(os.getenv("REMBG_ALPHA_FOREGROUND_THRESHOLD", "240"))
-            bg_threshold = int(os.getenv("REMBG_ALPHA_BACKGROUND_THRESHOLD", "10"))
-            erosion_size = int(os.getenv("REMBG_ALPHA_EROSION_SIZE", "10"))
-            image_data = image_bytes
-
-            # Resize gambar besar untuk menurunkan beban CPU/RAM saat inferensi.
-            with Image.open(io.BytesIO(image_bytes)) as img:
-                width, height = img.size
-                longest_side = max(width, height)
-                if longest_side > max_side:
-                    ratio = max_side / float(longest_side)
-                    new_size = (max(1, int(width * ratio)), max(1, int(height * ratio)))
-                    resized = img.resize(new_size, Image.LANCZOS)
-                    buffer = io.BytesIO()
-                    # PNG menjaga detail untuk segmentasi foreground.
-                    resized.save(buffer, format="PNG")
-                    image_data = buffer.getvalue()
-
-            # Prioritas: model lokal lebih dulu (cepat dan konsisten).
-            model_candidates = [preferred_model, "isnet-general-use"]
-            model_candidates = list(dict.fromkeys(model_candidates))
-
-            selected_model = next(
-                (m for m in model_candidates if _is_local_model_available(m)),
-                None,
+    @staticmethod
+    def _full_resolution_cutout(prepared: PreparedImage, mask: Image.Image) -> FullResolutionCutout:
+        pixels = prepared.original.width * prepared.original.height
+        with span("remove_bg.upsample_mask", **{"image.pixels": pixels}):
+            coefficients = guided_coefficients(mask, prepared.original)
+        return FullResolutionCutout(prepared.original, coefficients)
+
+    @staticmethod
+    def cached_cutout(
+        prepared: PreparedImage, settings: RemoveBgSettings
+    ) -> tuple[Image.Image | FullResolutionCutout | None, str]:
+        """(cutout, "hit" | "similar") rebuilt from a cached mask, or (None, "miss")."""
+        with span("remove_bg.cache_lookup") as trace_span:
+            mask, status = mask_cache.lookup(
+                settings.cache_key, prepared.digest, prepared.image.size, prepared.fingerprint
             )
+            trace_span.set(**{"rembg.cache": status})
+        if mask is None:
+            return None, status
+        if settings.full_resolution:
+            return ImageService._full_resolution_cutout(prepared, mask), status
+        return _cutout_from_mask(prepared.image, mask, settings.alpha_matting), status
 
-            if not selected_model:
-                logger.warning(
-                    "No local rembg model found in '%s'. Trying online fetch for model '%s'.",
-                    _u2net_home(),
-                    preferred_model,
-                )
-                try:
-                    session = _get_session(preferred_model)
-                except Exception as exc:
-                    raise RuntimeError(
-                        "No local rembg model found and online model download failed. "
-                        f"Place isnet-general-use.onnx in '{_u2net_home()}', "
-                        "or ensure container DNS/internet works."
-                    ) from exc
-            else:
-                session = _get_session(selected_model)
+    @staticmethod
+    def infer(
+        prepared: PreparedImage, settings: RemoveBgSettings
+    ) -> Image.Image | FullResolutionCutout:
+        """Run the model (and alpha matting); the resulting mask is cached."""
+        with span(
+            "remove_bg.session",
+            **{"rembg.model": settings.model, "rembg.variant": settings.model_variant},
+        ):
+            session = _select_session(settings.model, settings.model_variant)
+
+        if settings.full_resolution:
+            with span("remove_bg.inference", **{"rembg.full_resolution": True}):
+                mask = _rembg().remove(prepared.image, session=session, only_mask=True)
+            if not isinstance(mask, Image.Image):
+                raise ValueError("Failed to process image")
+            mask_cache.store(settings.cache_key, prepared.digest, mask, prepared.fingerprint)
+            return ImageService._full_resolution_cutout(prepared, mask)
 
-            output = remove(
-                image_data,
+        with span("remove_bg.inference", **{"rembg.alpha_matting": settings.alpha_matting}):
+            cutout = _rembg().remove(
+                prepared.image,
                 session=session,
-                force_return_bytes=True,
-                alpha_matting=alpha_matting,
-                alpha_matting_foreground_threshold=fg_threshold,
-                alpha_matting_background_threshold=bg_threshold,
-                alpha_matting_erosion_size=erosion_size,
+                alpha_matting=settings.alpha_matting,
+                alpha_matting_foreground_threshold=settings.fg_threshold,
+                alpha_matting_background_threshold=settings.bg_threshold,
+                alpha_matting_erosion_size=settings.erosion_size,
             )
-            if isinstance(output, bytes):
-                return output
-            if hasattr(output, "read"):
-                return output.read()
-            if isinstance(output, io.BytesIO):
-                return output.getvalue()
+        if not isinstance(cutout, Image.Image):
             raise ValueError("Failed to process image")
 
-        return await asyncio.to_thread(_process)
+        if cutout.mode == "RGBA":
+            mask_cache.store(
+                settings.cache_key, prepared.digest, cutout.getchannel("A"), prepared.fingerprint
+            )
+        return cutout
+
+    @staticmethod
+    def encode(cutout: Image.Image | FullResolutionCutout, output_format: str = "png") -> bytes:
+        """Cutout as PNG, as WebP with alpha, or only its mask as grayscale PNG ("mask")."""
+        with span("remove_bg.encode", **{"rembg.output": output_format}):
+            buffer = io.BytesIO()
+            if isinstance(cutout, FullResolutionCutout):
+                if output_format == "webp":
+                    # libwebp encodes whole frames (and is capped at 16383 px per side anyway)
+                    cutout = cutout.to_image()
+                else:
+                    ImageService._encode_strips(cutout, output_format, buffer)
+                    return buffer.getvalue()
+            if output_format == "webp":
+                cutout.save(buffer, "WEBP", quality=REMBG_WEBP_QUALITY, method=4)
+            elif output_format == "mask":
+                cutout.getchannel("A").save(buffer, "PNG")
+            else:
+                cutout.save(buffer, "PNG")
+            return buffer.getvalue()
+
+    @staticmethod
+    def _encode_strips(cutout: FullResolutionCutout, output_format: str, out: io.BytesIO):
+        mode = "L" if output_format == "mask" else "RGBA"
+        writer = PngStripWriter(out, cutout.size, mode)
+        for _, rgb, alpha in cutout.strips():
+            writer.write(alpha if mode == "L" else np.dstack((rgb, alpha)))
+        writer.close()
+
+    @staticmethod
+    async def remove_background(
+        image_bytes: bytes, output_format: str = "png", full_resolution: bool | None = None
+    ) -> tuple[bytes, str]:
+        """
+        Cutout of image_bytes in output_format (see OUTPUT_FORMATS), and where
+        its mask came from: "hit" or "similar" (mask cache, no inference) or
+        "miss". full_resolution defaults to REMBG_FULL_RESOLUTION. Inference
+        takes the "rembg" slot, like bulk requests.
+        """
+        if not image_bytes:
+            raise ValueError("Empty image bytes")
+
+        settings = RemoveBgSettings.from_env(full_resolution)
+        prepared = await asyncio.to_thread(ImageService.prepare, image_bytes, settings)
+        cutout, status = await asyncio.to_thread(ImageService.cached_cutout, prepared, settings)
+        if cutout is not None:
+            logger.info(f"Background removal served from mask cache ({status})")
+        else:
+            async with get_slot("rembg", REMBG_SLOTS).acquire():
+                cutout = await asyncio.to_thread(ImageService.infer, prepared, settings)
+        return await asyncio.to_thread(ImageService.encode, cutout, output_format), status
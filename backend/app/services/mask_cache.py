@@ -0,0 +1,194 @@
+"""
+Cache of background-removal masks.
+
+/remove-bg is often repeated on the same photo (retries on a slow network,
+the same product shot uploaded again). A cutout is fully determined by the
+input image, the model and the matting settings, so the alpha mask produced
+for it is stored under (settings key, SHA-256 of the upload) and a repeat
+request rebuilds the cutout from the mask without running inference.
+
+Only the 8-bit alpha channel is kept (a few tens of KB as PNG, against
+megabytes for the RGBA cutout). Entries live on disk so every worker shares
+them, and the directory is pruned least recently used first to
+REMBG_CACHE_MAX_MB.
+
+With REMBG_CACHE_PERCEPTUAL=1, a re-encoded or rescaled copy of a cached
+photo also reuses its mask: candidates are found by difference hash and
+confirmed on a 32x32 thumbnail, like the perceptual image dedupe for PDFs.
+"""
+
+import os
+import io
+import json
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
+
+from PIL import Image
+
+from app.utils.disk_cache import prune_cache
+
+logger = logging.getLogger(__name__)
+
+REMBG_CACHE = os.getenv("REMBG_CACHE", "1").strip().lower() in ("1", "true", "yes", "on")
+REMBG_CACHE_DIR = os.getenv("REMBG_CACHE_DIR", "cache/rembg")
+REMBG_CACHE_MAX_MB = int(os.getenv("REMBG_CACHE_MAX_MB", "256"))
+REMBG_CACHE_PERCEPTUAL = os.getenv("REMBG_CACHE_PERCEPTUAL", "0").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+
+# Near-duplicate thresholds: dHash bit distance, mean thumbnail difference, aspect ratio
+_MAX_DISTANCE = 4
+_MAX_PIXEL_DIFF = 4.0
+_MAX_ASPECT_DIFF = 0.01
+_THUMB_SIZE = 32
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    dhash: int
+    thumb: bytes
+    aspect: float
+
+
+def settings_key(**settings) -> str:
+    """Short stable key for everything besides the image that shapes the mask."""
+    encoded = json.dumps(settings, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def fingerprint(image: Image.Image) -> Fingerprint:
+    gray = image.convert("L")
+    small = gray.resize((9, 8), Image.Resampling.BILINEAR).tobytes()
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = (dhash << 1) | (small[row * 9 + col] > small[row * 9 + col + 1])
+    thumb = gray.resize((_THUMB_SIZE, _THUMB_SIZE), Image.Resampling.BILINEAR).tobytes()
+    return Fingerprint(dhash, thumb, image.width / image.height)
+
+
+def _mask_path(settings: str, digest: str) -> str:
+    return os.path.join(REMBG_CACHE_DIR, settings, digest[:2], f"{digest}.png")
+
+
+def _index_dir(settings: str) -> str:
+    return os.path.join(REMBG_CACHE_DIR, settings, "similar")
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _load_mask(path: str) -> Image.Image | None:
+    try:
+        with Image.open(path) as mask:
+            mask.load()
+        os.utime(path)
+        return mask
+    except (OSError, ValueError):
+        return None
+
+
+def _find_similar(settings: str, image_fingerprint: Fingerprint) -> Image.Image | None:
+    """Cached mask of an image that looks the same, or None."""
+    try:
+        entries = list(os.scandir(_index_dir(settings)))
+    except FileNotFoundError:
+        return None
+
+    for entry in entries:
+        # <dhash>_<aspect>_<sha256>.thumb
+        try:
+            dhash, aspect, digest = entry.name.removesuffix(".thumb").split("_")
+            dhash, aspect = int(dhash, 16), float(aspect)
+        except ValueError:
+            continue
+        if bin(dhash ^ image_fingerprint.dhash).count("1") > _MAX_DISTANCE:
+            continue
+        if abs(aspect - image_fingerprint.aspect) > _MAX_ASPECT_DIFF * image_fingerprint.aspect:
+            continue
+        try:
+            with open(entry.path, "rb") as f:
+                thumb = f.read()
+        except FileNotFoundError:
+            continue
+        if len(thumb) != len(image_fingerprint.thumb):
+            continue
+        diff = sum(abs(a - b) for a, b in zip(thumb, image_fingerprint.thumb)) / len(thumb)
+        if diff > _MAX_PIXEL_DIFF:
+            continue
+        mask = _load_mask(_mask_path(settings, digest))
+        if mask is not None:
+            return mask
+        # The mask was pruned (or is unreadable): drop its index entry and keep looking
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    return None
+
+
+def lookup(
+    settings: str,
+    digest: str,
+    size: tuple[int, int],
+    image_fingerprint: Fingerprint | None = None,
+) -> tuple[Image.Image | None, str]:
+    """
+    (mask at size, "hit" | "similar") for a cached image, or (None, "miss").
+    image_fingerprint enables the near-duplicate lookup.
+    """
+    if not REMBG_CACHE:
+        return None, "miss"
+
+    mask = _load_mask(_mask_path(settings, digest))
+    if mask is not None and mask.size == size:
+        return mask, "hit"
+
+    if image_fingerprint is not None:
+        mask = _find_similar(settings, image_fingerprint)
+        if mask is not None:
+            if mask.size != size:
+                mask = mask.resize(size, Image.Resampling.BILINEAR)
+            return mask, "similar"
+    return None, "miss"
+
+
+def store(
+    settings: str,
+    digest: str,
+    mask: Image.Image,
+    image_fingerprint: Fingerprint | None = None,
+):
+    if not REMBG_CACHE:
+        return
+    try:
+        buffer = io.BytesIO()
+        mask.convert("L").save(buffer, "PNG", optimize=True)
+        _write_atomic(_mask_path(settings, digest), buffer.getvalue())
+        if image_fingerprint is not None:
+            name = f"{image_fingerprint.dhash:016x}_{image_fingerprint.aspect:.4f}_{digest}.thumb"
+            _write_atomic(os.path.join(_index_dir(settings), name), image_fingerprint.thumb)
+        prune_cache(REMBG_CACHE_MAX_MB * 1024 * 1024, REMBG_CACHE_DIR)
+    except OSError as e:
+        logger.warning(f"Background mask not cached: {e}")
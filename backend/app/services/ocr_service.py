@@ -0,0 +1,272 @@
+"""
+OCR stage: adds an invisible, searchable text layer to PDF pages.
+
+Pages without text are rasterized with Ghostscript, recognised with a local
+Tesseract, and the text-only PDF Tesseract produces for each page is placed
+over the original page, so what is visible does not change. Pages run in
+parallel up to OCR_CPU_BUDGET Tesseract processes (each limited to one
+thread), and results are cached by page image hash, so the same scan
+uploaded again (or a page repeated in a document) is recognised once.
+"""
+
+import os
+import re
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+import subprocess
+from dataclasses import dataclass
+from functools import lru_cache
+
+import pikepdf
+
+from app.services.pdf_service import PDFService
+from app.services.render_service import RENDER_WORKERS, page_runs, split_runs
+from app.services.timeout_policy import WorkEstimate
+from app.utils.concurrency import available_cpus, get_slot
+from app.utils.disk_cache import link_or_copy, prune_cache, publish
+from app.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+OCR_CPU_BUDGET = int(os.getenv("OCR_CPU_BUDGET") or max(1, available_cpus() // 2))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "cache/ocr")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+OCR_PAGE_TIMEOUT = int(os.getenv("OCR_PAGE_TIMEOUT", "120"))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "200"))
+
+_LANG_PATTERN = re.compile(r"^[A-Za-z_]{3,}(\+[A-Za-z_]{3,})*$")
+_TEXT_OPERATORS = {"Tj", "TJ", "'", '"'}
+
+
+class OCRError(ValueError):
+    """Raised for an OCR request that cannot be served (language, engine)."""
+
+
+@dataclass
+class OCRStats:
+    pages: int = 0
+    cached: int = 0
+    skipped: int = 0
+
+
+@lru_cache(maxsize=1)
+def installed_languages() -> frozenset[str] | None:
+    """Tesseract language packs, or None when Tesseract is not installed."""
+    if not shutil.which("tesseract"):
+        return None
+    try:
+        result = subprocess.run(
+            ["tesseract", "--list-langs"], capture_output=True, text=True, timeout=30, check=True
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"tesseract --list-langs failed: {e}")
+        return None
+    # First line is the "List of available languages ..." header
+    return frozenset(line.strip() for line in result.stdout.splitlines()[1:] if line.strip())
+
+
+def validate_lang(lang: str | None) -> str:
+    lang = (lang or OCR_LANG).strip()
+    if not _LANG_PATTERN.match(lang):
+        raise OCRError(f"Invalid OCR language: {lang}")
+
+    available = installed_languages()
+    if available is None:
+        raise OCRError("OCR engine is not available on this server")
+    missing = [code for code in lang.split("+") if code not in available]
+    if missing:
+        raise OCRError(f"OCR language not installed: {', '.join(missing)}")
+    return lang
+
+
+def _shows_text(content_owner, resources, depth: int = 0) -> bool:
+    """Whether a page (or form XObject) draws text, looking one form level deep."""
+    try:
+        instructions = pikepdf.parse_content_stream(content_owner)
+    except pikepdf.PdfError:
+        return True  # unreadable content: leave the page alone
+
+    operators = {str(instruction.operator) for instruction in instructions}
+    if operators & _TEXT_OPERATORS:
+        return True
+    if "Do" not in operators or depth > 1 or resources is None:
+        return False
+
+    xobjects = resources.get("/XObject") or {}
+    for name in xobjects.keys():
+        xobject = xobjects[name]
+        if isinstance(xobject, pikepdf.Stream) and xobject.get("/Subtype") == pikepdf.Name.Form:
+            if _shows_text(xobject, xobject.get("/Resources"), depth + 1):
+                return True
+    return False
+
+
+def pages_without_text(input_path: str) -> tuple[int, list[int]]:
+    """Page count and the 1-based numbers of pages that draw no text at all."""
+    with pikepdf.open(input_path) as pdf:
+        pages = [
+            number
+            for number, page in enumerate(pdf.pages, start=1)
+            if not _shows_text(page, page.obj.get("/Resources"))
+        ]
+        return len(pdf.pages), pages
+
+
+def _cache_path(digest: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, digest[:2], f"{digest}.pdf")
+
+
+def _apply_text_layers(input_path: str, output_path: str, layers: dict[int, str]):
+    """Place each page's text-only PDF over the page (scaled to its MediaBox)."""
+    with pikepdf.open(input_path) as pdf:
+        text_pdfs = []
+        try:
+            for number, layer_path in sorted(layers.items()):
+                text_pdf = pikepdf.open(layer_path)
+                text_pdfs.append(text_pdf)
+                page = pdf.pages[number - 1]
+                page.add_overlay(text_pdf.pages[0], pikepdf.Rectangle(*page.mediabox))
+            pdf.save(output_path)
+        finally:
+            for text_pdf in text_pdfs:
+                text_pdf.close()
+
+
+class OCRService:
+    @staticmethod
+    async def _rasterize(input_path: str, first: int, last: int, work_dir: str) -> bool:
+        command = [
+            "gs",
+            "-sDEVICE=pnggray",
+            f"-r{OCR_DPI}",
+            f"-dFirstPage={first}",
+            f"-dLastPage={last}",
+            "-dNOPAUSE",
+            "-dQUIET",
+            "-dBATCH",
+            "-dSAFER",
+            "-dTextAlphaBits=4",
+            "-dGraphicsAlphaBits=4",
+            f"-sOutputFile={os.path.join(work_dir, f'r{first}_%d.png')}",
+            input_path,
+        ]
+        async with get_slot("gs-render", RENDER_WORKERS).acquire():
+            return await PDFService._execute_command(
+                command,
+                f"OCR rasterize {first}-{last}",
+                work=WorkEstimate(kind="gs-raster", pages=last - first + 1, dpi=OCR_DPI),
+            )
+
+    @staticmethod
+    async def _recognise(image_path: str, lang: str) -> tuple[str | None, bool]:
+        """
+        Text-only PDF for one page image; returns (path, from_cache). The path
+        is next to image_path (a link to the cache entry), so a concurrent
+        cache prune cannot remove it before the layer is applied.
+        """
+        with open(image_path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256")
+        digest.update(f"|{lang}|{OCR_DPI}".encode())
+        cached = _cache_path(digest.hexdigest())
+        out_base = os.path.splitext(image_path)[0]
+        layer_path = f"{out_base}.pdf"
+        try:
+            link_or_copy(cached, layer_path)
+            os.utime(cached)
+            return layer_path, True
+        except FileNotFoundError:
+            pass
+
+        command = [
+            "tesseract",
+            image_path,
+            out_base,
+            "-l",
+            lang,
+            "--dpi",
+            str(OCR_DPI),
+            "-c",
+            "textonly_pdf=1",
+            "pdf",
+        ]
+        # One thread per process: parallelism comes from running pages side by side
+        async with get_slot("ocr", OCR_CPU_BUDGET).acquire():
+            ok = await PDFService._execute_command(
+                command,
+                f"OCR {os.path.basename(image_path)}",
+                env={"OMP_THREAD_LIMIT": "1"},
+                timeout=OCR_PAGE_TIMEOUT,
+            )
+        if not ok or not os.path.exists(layer_path):
+            return None, False
+
+        try:
+            publish(layer_path, cached)
+        except OSError as e:
+            logger.warning(f"OCR text layer not cached: {e}")
+        return layer_path, False
+
+    @staticmethod
+    async def ocr_pdf(
+        input_path: str, output_path: str, lang: str, only_missing_text: bool = True
+    ) -> OCRStats | None:
+        """
+        Write input_path with a text layer on its image-only pages to output_path.
+        Returns None when no page needed (or got) a text layer; output_path is
+        then not written.
+        """
+        with span("ocr.find_pages"):
+            total, pages = await asyncio.to_thread(pages_without_text, input_path)
+        if not only_missing_text:
+            pages = list(range(1, total + 1))
+
+        stats = OCRStats(skipped=total - len(pages))
+        if not pages:
+            return None
+        if len(pages) > OCR_MAX_PAGES:
+            logger.warning(f"OCR limited to the first {OCR_MAX_PAGES} of {len(pages)} pages")
+            pages = pages[:OCR_MAX_PAGES]
+            stats.skipped = total - len(pages)
+
+        work_dir = tempfile.mkdtemp(prefix="ocr_")
+        try:
+            chunks = split_runs(page_runs(pages), OCR_CPU_BUDGET)
+            await asyncio.gather(
+                *(OCRService._rasterize(input_path, first, last, work_dir) for first, last in chunks)
+            )
+
+            images = {}
+            for first, last in chunks:
+                for offset, page in enumerate(range(first, last + 1), start=1):
+                    image_path = os.path.join(work_dir, f"r{first}_{offset}.png")
+                    if os.path.exists(image_path):
+                        images[page] = image_path
+
+            results = await asyncio.gather(
+                *(OCRService._recognise(path, lang) for path in images.values())
+            )
+
+            layers = {}
+            for page, (layer_path, from_cache) in zip(images, results):
+                if layer_path:
+                    layers[page] = layer_path
+                    stats.cached += from_cache
+            if not layers:
+                return None
+
+            with span("ocr.apply_text_layers", **{"ocr.pages": len(layers), "ocr.cached": stats.cached}):
+                await asyncio.to_thread(_apply_text_layers, input_path, output_path, layers)
+            await asyncio.to_thread(prune_cache, OCR_CACHE_MAX_MB * 1024 * 1024, OCR_CACHE_DIR)
+            stats.pages = len(layers)
+            logger.info(
+                f"OCR added text to {stats.pages} pages ({stats.cached} from cache, "
+                f"{stats.skipped} already had text)"
+            )
+            return stats
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
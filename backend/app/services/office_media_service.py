@@ -0,0 +1,295 @@
+import io
+import os
+import asyncio
+import logging
+import posixpath
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree as ET
+
+from PIL import Image
+
+from app.utils.concurrency import available_cpus
+
+logger = logging.getLogger(__name__)
+
+OFFICE_MEDIA_TARGET_DPI = int(os.getenv("OFFICE_MEDIA_TARGET_DPI", "150"))
+OFFICE_MEDIA_JPEG_QUALITY = int(os.getenv("OFFICE_MEDIA_JPEG_QUALITY", "85"))
+OFFICE_MEDIA_WORKERS = int(os.getenv("OFFICE_MEDIA_WORKERS", str(available_cpus())))
+
+EMU_PER_INCH = 914400
+
+DML_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+MEDIA_PREFIXES = ("ppt/media/", "word/media/")
+RASTER_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+
+# Only rewrite an image when it shrinks by more than this factor
+_MIN_SCALE_GAIN = 0.9
+
+# EXIF orientations that swap width and height when displayed
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def _qname(ns: str, tag: str) -> str:
+    return f"{{{ns}}}{tag}"
+
+
+def _is_content_part(name: str) -> bool:
+    if not name.endswith(".xml") or "/_rels/" in name:
+        return False
+    if name.startswith("ppt/"):
+        return name.startswith(("ppt/slides/", "ppt/slideLayouts/", "ppt/slideMasters/"))
+    if name.startswith("word/"):
+        base = posixpath.basename(name)
+        return base == "document.xml" or base.startswith(("header", "footer"))
+    return False
+
+
+def _rels_path(part: str) -> str:
+    directory, base = posixpath.split(part)
+    return posixpath.join(directory, "_rels", f"{base}.rels")
+
+
+def _read_relationships(zf: zipfile.ZipFile, part: str, names: set[str]) -> dict[str, str]:
+    """Map relationship ids of a part to package paths of their (internal) targets."""
+    rels_name = _rels_path(part)
+    if rels_name not in names:
+        return {}
+
+    base_dir = posixpath.dirname(part)
+    targets = {}
+    with zf.open(rels_name) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == _qname(PKG_REL_NS, "Relationship") and elem.get("TargetMode") != "External":
+                target = elem.get("Target", "")
+                if target.startswith("/"):
+                    path = target.lstrip("/")
+                else:
+                    path = posixpath.normpath(posixpath.join(base_dir, target))
+                targets[elem.get("Id")] = path
+            elem.clear()
+    return targets
+
+
+def _pic_display_size(pic: ET.Element) -> tuple[str, float, float] | None:
+    """Return (relationship id, width_in, height_in) of the full image shown by a pic element."""
+    blip = pic.find(f".//{_qname(DML_NS, 'blip')}")
+    ext = pic.find(f".//{_qname(DML_NS, 'xfrm')}/{_qname(DML_NS, 'ext')}")
+    if blip is None or ext is None:
+        return None
+
+    rel_id = blip.get(_qname(REL_NS, "embed"))
+    cx, cy = ext.get("cx"), ext.get("cy")
+    if not rel_id or not cx or not cy:
+        return None
+
+    width_in = int(cx) / EMU_PER_INCH
+    height_in = int(cy) / EMU_PER_INCH
+
+    # A cropped picture only shows part of the image, so the full image
+    # needs proportionally more pixels (srcRect values are 1/1000 of a percent)
+    src_rect = pic.find(f".//{_qname(DML_NS, 'srcRect')}")
+    if src_rect is not None:
+        shown_w = 1 - (int(src_rect.get("l", 0)) + int(src_rect.get("r", 0))) / 100000
+        shown_h = 1 - (int(src_rect.get("t", 0)) + int(src_rect.get("b", 0))) / 100000
+        if shown_w > 0:
+            width_in /= shown_w
+        if shown_h > 0:
+            height_in /= shown_h
+
+    return rel_id, width_in, height_in
+
+
+def _source_part(rels_name: str) -> str:
+    """Part a relationships file belongs to (dir/_rels/name.rels -> dir/name)."""
+    directory, base = posixpath.split(rels_name)
+    return posixpath.join(posixpath.dirname(directory), base.removesuffix(".rels"))
+
+
+def _collect_display_sizes(zf: zipfile.ZipFile) -> dict[str, tuple[float, float]]:
+    """
+    Largest displayed size (inches) of every media part, across all slides,
+    layouts, masters, document bodies, headers and footers that place it.
+
+    Only media shown exclusively by pic elements of known size are included.
+    A part also used elsewhere (slide background, shape fill, VML image, or
+    any part outside those above: notes, charts, diagrams, themes) may be
+    shown larger than any pic, so it is left untouched.
+    """
+    names = set(zf.namelist())
+    sizes: dict[str, tuple[float, float]] = {}
+    unsized: set[str] = set()
+
+    for rels_name in names:
+        if not rels_name.endswith(".rels"):
+            continue
+        source = _source_part(rels_name)
+        if not _is_content_part(source):
+            unsized.update(
+                media
+                for media in _read_relationships(zf, source, names).values()
+                if media.startswith(MEDIA_PREFIXES)
+            )
+
+    for part in sorted(n for n in names if _is_content_part(n)):
+        rels = _read_relationships(zf, part, names)
+        if not rels:
+            continue
+
+        # Every reference to a media relationship, against those sized through a pic
+        references: dict[str, int] = {}
+        sized: dict[str, int] = {}
+        pic_depth = 0
+        with zf.open(part) as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                is_pic = elem.tag.endswith("}pic")
+                if event == "start":
+                    if is_pic:
+                        pic_depth += 1
+                    for key, value in elem.attrib.items():
+                        if key.startswith(f"{{{REL_NS}}}") and value in rels:
+                            references[value] = references.get(value, 0) + 1
+                    continue
+
+                if is_pic:
+                    pic_depth -= 1
+                    display = _pic_display_size(elem)
+                    if display:
+                        rel_id, width_in, height_in = display
+                        media = rels.get(rel_id)
+                        if media and media.startswith(MEDIA_PREFIXES):
+                            sized[rel_id] = sized.get(rel_id, 0) + 1
+                            prev_w, prev_h = sizes.get(media, (0.0, 0.0))
+                            sizes[media] = (max(prev_w, width_in), max(prev_h, height_in))
+
+                if pic_depth == 0:
+                    elem.clear()
+
+        for rel_id, count in references.items():
+            if count > sized.get(rel_id, 0):
+                unsized.add(rels[rel_id])
+
+    return {media: size for media, size in sizes.items() if media not in unsized}
+
+
+def _downsample_image(
+    package_path: str, name: str, display_in: tuple[float, float], dpi: int, quality: int
+) -> bytes | None:
+    """Re-encode one media part at the resolution it is displayed at. None if not worth it."""
+    fmt = RASTER_FORMATS.get(posixpath.splitext(name)[1].lower())
+    if not fmt:
+        return None
+
+    with zipfile.ZipFile(package_path) as zf:
+        original = zf.read(name)
+
+    with Image.open(io.BytesIO(original)) as img:
+        width, height = img.size
+        display_w, display_h = display_in
+        exif = img.getexif()
+        if exif.get(0x0112) in _ROTATED_ORIENTATIONS:
+            display_w, display_h = display_h, display_w
+
+        scale = max(display_w * dpi / width, display_h * dpi / height)
+        if scale >= _MIN_SCALE_GAIN:
+            return None
+
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if fmt == "JPEG":
+            # Let libjpeg decode at a reduced scale instead of full resolution
+            img.draft(img.mode, new_size)
+        resized = img.resize(new_size, Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        if fmt == "JPEG":
+            if resized.mode not in ("RGB", "L", "CMYK"):
+                resized = resized.convert("RGB")
+            resized.save(
+                buffer,
+                format="JPEG",
+                quality=quality,
+                optimize=True,
+                exif=img.info.get("exif", b""),
+                icc_profile=img.info.get("icc_profile"),
+            )
+        else:
+            resized.save(buffer, format="PNG", optimize=True, icc_profile=img.info.get("icc_profile"))
+
+    data = buffer.getvalue()
+    return data if len(data) < len(original) else None
+
+
+def _rewrite_package(input_path: str, output_path: str, replacements: dict[str, bytes]):
+    with zipfile.ZipFile(input_path) as zin, zipfile.ZipFile(output_path, "w") as zout:
+        for info in zin.infolist():
+            if info.filename in replacements:
+                zout.writestr(info, replacements[info.filename], compress_type=info.compress_type)
+                continue
+            with zin.open(info) as src, zout.open(info, "w") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+class OfficeMediaService:
+    @staticmethod
+    def downsample_package(
+        input_path: str,
+        output_path: str,
+        target_dpi: int = OFFICE_MEDIA_TARGET_DPI,
+        jpeg_quality: int = OFFICE_MEDIA_JPEG_QUALITY,
+    ) -> dict | None:
+        """
+        Write a copy of a DOCX/PPTX package whose ppt/media and word/media
+        images are downsampled to target_dpi at their displayed size.
+
+        Images are re-encoded in parallel on a thread pool (Pillow releases
+        the GIL while decoding, resizing and encoding). Returns stats, or
+        None when nothing was worth rewriting (output_path is not created).
+        """
+        with zipfile.ZipFile(input_path) as zf:
+            display_sizes = _collect_display_sizes(zf)
+            original_sizes = {i.filename: i.file_size for i in zf.infolist()}
+
+        if not display_sizes:
+            return None
+
+        replacements: dict[str, bytes] = {}
+        with ThreadPoolExecutor(max_workers=max(1, OFFICE_MEDIA_WORKERS)) as pool:
+            futures = {
+                pool.submit(_downsample_image, input_path, name, size, target_dpi, jpeg_quality): name
+                for name, size in display_sizes.items()
+            }
+            for future, name in futures.items():
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.warning(f"Skipping media {name}: {e}")
+                    continue
+                if data is not None:
+                    replacements[name] = data
+
+        if not replacements:
+            return None
+
+        _rewrite_package(input_path, output_path, replacements)
+
+        before = sum(original_sizes[n] for n in replacements)
+        after = sum(len(d) for d in replacements.values())
+        stats = {
+            "images_rewritten": len(replacements),
+            "images_considered": len(display_sizes),
+            "bytes_before": before,
+            "bytes_after": after,
+        }
+        logger.info(
+            f"Downsampled {len(replacements)}/{len(display_sizes)} media parts to {target_dpi} DPI: "
+            f"{before / (1024 * 1024):.1f} MB -> {after / (1024 * 1024):.1f} MB"
+        )
+        return stats
+
+    @staticmethod
+    async def downsample_package_async(input_path: str, output_path: str) -> dict | None:
+        return await asyncio.to_thread(OfficeMediaService.downsample_package, input_path, output_path)
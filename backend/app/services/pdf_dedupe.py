@@ -0,0 +1,302 @@
+"""
+Collapse byte-identical font programs and images in a PDF into one shared object.
+
+Used after merging documents (the same logo or embedded font arrives once per
+input) and before compression (the same image is often stored once per page).
+References are rewritten to the first copy; the duplicates become unreachable
+and are dropped when the PDF is saved.
+
+Optionally, images that are not byte-identical but look the same (the same
+logo re-encoded per page) are collapsed too, using a difference hash plus a
+color thumbnail comparison. That step is lossy by nature and off unless asked for.
+"""
+
+import hashlib
+import logging
+from dataclasses import dataclass, field
+
+import pikepdf
+from PIL import Image, ImageChops, ImageStat
+
+logger = logging.getLogger(__name__)
+
+FONT_FILE_KEYS = ("/FontFile", "/FontFile2", "/FontFile3")
+
+# Dictionary keys that describe how the data is encoded/decoded; two streams are
+# only interchangeable if these match as well as the raw bytes
+_SIGNATURE_KEYS = (
+    "/Subtype",
+    "/Filter",
+    "/DecodeParms",
+    "/Width",
+    "/Height",
+    "/ColorSpace",
+    "/BitsPerComponent",
+    "/Decode",
+    "/ImageMask",
+    "/Intent",
+    "/Length1",
+    "/Length2",
+    "/Length3",
+)
+
+
+@dataclass
+class DedupeStats:
+    images: int = 0
+    fonts: int = 0
+    bytes_saved: int = 0
+    # objgen of duplicate -> canonical object
+    replaced: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def total(self) -> int:
+        return self.images + self.fonts
+
+
+def _font_file_ids(pdf: pikepdf.Pdf) -> set[tuple[int, int]]:
+    ids = set()
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Dictionary) and obj.get("/Type") == pikepdf.Name.FontDescriptor:
+            for key in FONT_FILE_KEYS:
+                font_file = obj.get(key)
+                if font_file is not None and font_file.is_indirect:
+                    ids.add(font_file.objgen)
+    return ids
+
+
+def stream_signature(stream: pikepdf.Stream) -> str:
+    """Content hash of a stream: raw (still encoded) bytes plus its decoding parameters."""
+    digest = hashlib.sha256()
+    for key in _SIGNATURE_KEYS:
+        value = stream.get(key)
+        if value is not None:
+            digest.update(key.encode())
+            digest.update(repr(value).encode())
+    # Soft masks are separate streams; identical pixels with different masks differ
+    for key in ("/SMask", "/Mask"):
+        value = stream.get(key)
+        if isinstance(value, pikepdf.Stream):
+            digest.update(key.encode())
+            digest.update(stream_signature(value).encode())
+        elif value is not None:
+            digest.update(key.encode())
+            digest.update(repr(value).encode())
+    digest.update(b"\0")
+    digest.update(stream.read_raw_bytes())
+    return digest.hexdigest()
+
+
+def _remap(obj, replaced: dict):
+    """Point references to duplicates at their canonical object, recursing into direct containers."""
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        for key in list(obj.keys()):
+            value = obj.get(key)
+            if not isinstance(value, pikepdf.Object):
+                continue
+            if value.is_indirect:
+                canonical = replaced.get(value.objgen)
+                if canonical is not None:
+                    obj[key] = canonical
+            elif isinstance(value, (pikepdf.Dictionary, pikepdf.Array)):
+                _remap(value, replaced)
+    elif isinstance(obj, pikepdf.Array):
+        for i, value in enumerate(obj):
+            if not isinstance(value, pikepdf.Object):
+                continue
+            if value.is_indirect:
+                canonical = replaced.get(value.objgen)
+                if canonical is not None:
+                    obj[i] = canonical
+            elif isinstance(value, (pikepdf.Dictionary, pikepdf.Array)):
+                _remap(value, replaced)
+
+
+def rewrite_references(pdf: pikepdf.Pdf, replaced: dict):
+    """Rewrite every reference in the document according to replaced (objgen -> object)."""
+    if not replaced:
+        return
+    for obj in pdf.objects:
+        if obj.objgen in replaced:
+            continue
+        if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream, pikepdf.Array)):
+            _remap(obj, replaced)
+    _remap(pdf.trailer, replaced)
+
+
+def dedupe_streams(pdf: pikepdf.Pdf, images: bool = True, fonts: bool = True) -> DedupeStats:
+    """Merge byte-identical image XObjects and embedded font programs."""
+    stats = DedupeStats()
+    font_ids = _font_file_ids(pdf) if fonts else set()
+    canonical: dict[str, pikepdf.Object] = {}
+
+    for obj in pdf.objects:
+        if not isinstance(obj, pikepdf.Stream):
+            continue
+
+        is_image = images and obj.get("/Subtype") == pikepdf.Name.Image
+        is_font = obj.objgen in font_ids
+        if not (is_image or is_font):
+            continue
+
+        signature = ("I" if is_image else "F") + stream_signature(obj)
+        first = canonical.get(signature)
+        if first is None:
+            canonical[signature] = obj
+            continue
+
+        stats.replaced[obj.objgen] = first
+        stats.bytes_saved += int(obj.get("/Length", 0))
+        if is_image:
+            stats.images += 1
+        else:
+            stats.fonts += 1
+
+    rewrite_references(pdf, stats.replaced)
+
+    if stats.total:
+        logger.info(
+            f"Deduplicated {stats.images} images and {stats.fonts} font programs, "
+            f"saving {stats.bytes_saved / 1024:.0f} KB"
+        )
+    return stats
+
+
+# Thumbnail size for the perceptual comparison (dHash uses 9x8); large enough
+# that a changed label or digit still shows up in single thumbnail samples
+_THUMB_SIZE = 64
+
+
+def _image_fingerprint(stream: pikepdf.Stream) -> tuple[int, Image.Image] | None:
+    """(64-bit difference hash, gray or RGB thumbnail) of an image, or None if it cannot be decoded."""
+    try:
+        image = pikepdf.PdfImage(stream).as_pil_image()
+    except Exception:
+        return None
+
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    gray = image.convert("L")
+
+    small = gray.resize((9, 8), Image.Resampling.BILINEAR).tobytes()
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = (dhash << 1) | (small[row * 9 + col] > small[row * 9 + col + 1])
+
+    # Per channel: a recolored copy (same luminance, other hue) must not match
+    thumb = image.resize((_THUMB_SIZE, _THUMB_SIZE), Image.Resampling.BILINEAR)
+    return dhash, thumb
+
+
+def _thumb_diff(a: Image.Image, b: Image.Image) -> tuple[float, int]:
+    """(largest per-channel mean difference, largest single sample difference)."""
+    diff = ImageChops.difference(a, b)
+    extrema = diff.getextrema()
+    if diff.mode == "L":
+        extrema = (extrema,)
+    return max(ImageStat.Stat(diff).mean), max(high for _, high in extrema)
+
+
+def _mask_key(stream: pikepdf.Stream, key: str) -> str | None:
+    """Content hash of an image's soft mask / mask; masked copies only match with identical masks."""
+    value = stream.get(key)
+    if value is None:
+        return None
+    if isinstance(value, pikepdf.Stream):
+        return stream_signature(value)
+    return repr(value)
+
+
+def dedupe_similar_images(
+    pdf: pikepdf.Pdf,
+    max_distance: int = 2,
+    max_pixel_diff: float = 1.5,
+    max_sample_diff: int = 16,
+    exclude: set | None = None,
+) -> DedupeStats:
+    """
+    Merge images that decode to (nearly) the same picture.
+
+    Only images with the same dimensions, color space, bit depth and
+    byte-identical masks (SMask / Mask) are compared. Two images match when
+    their difference hashes are within max_distance bits, their 64x64 color
+    thumbnails differ by at most max_pixel_diff levels on average in every
+    channel, and no thumbnail sample differs by more than max_sample_diff
+    (a small local change such as another price on the same label). The
+    larger (higher quality) copy of a group is kept. Objects in exclude
+    (already replaced) are skipped.
+    """
+    stats = DedupeStats()
+    groups: dict[tuple, list] = {}
+
+    for obj in pdf.objects:
+        if not isinstance(obj, pikepdf.Stream) or obj.get("/Subtype") != pikepdf.Name.Image:
+            continue
+        if obj.get("/ImageMask") or (exclude and obj.objgen in exclude):
+            continue
+        key = (
+            int(obj.get("/Width", 0)),
+            int(obj.get("/Height", 0)),
+            repr(obj.get("/ColorSpace")),
+            int(obj.get("/BitsPerComponent", 8)),
+            _mask_key(obj, "/SMask"),
+            _mask_key(obj, "/Mask"),
+        )
+        groups.setdefault(key, []).append(obj)
+
+    for candidates in groups.values():
+        if len(candidates) < 2:
+            continue
+
+        # Largest first, so the kept copy is the least compressed one
+        candidates.sort(key=lambda o: int(o.get("/Length", 0)), reverse=True)
+        kept: list[tuple[pikepdf.Object, int, Image.Image]] = []
+        for obj in candidates:
+            fingerprint = _image_fingerprint(obj)
+            if fingerprint is None:
+                continue
+            dhash, thumb = fingerprint
+
+            for canonical, canonical_hash, canonical_thumb in kept:
+                if bin(dhash ^ canonical_hash).count("1") > max_distance:
+                    continue
+                mean_diff, sample_diff = _thumb_diff(thumb, canonical_thumb)
+                if mean_diff <= max_pixel_diff and sample_diff <= max_sample_diff:
+                    stats.replaced[obj.objgen] = canonical
+                    stats.bytes_saved += int(obj.get("/Length", 0))
+                    stats.images += 1
+                    break
+            else:
+                kept.append((obj, dhash, thumb))
+
+    rewrite_references(pdf, stats.replaced)
+
+    if stats.images:
+        logger.info(
+            f"Merged {stats.images} near-identical images, saving {stats.bytes_saved / 1024:.0f} KB"
+        )
+    return stats
+
+
+def dedupe_file(input_path: str, output_path: str, perceptual: bool = False) -> DedupeStats:
+    """
+    Deduplicate images (and font programs) of a PDF file into output_path.
+    output_path is only written when something was merged.
+    """
+    with pikepdf.open(input_path) as pdf:
+        stats = dedupe_streams(pdf)
+        if perceptual:
+            similar = dedupe_similar_images(pdf, exclude=set(stats.replaced))
+            stats.images += similar.images
+            stats.bytes_saved += similar.bytes_saved
+            stats.replaced.update(similar.replaced)
+
+        if stats.total:
+            pdf.save(
+                output_path,
+                object_stream_mode=pikepdf.ObjectStreamMode.preserve,
+                compress_streams=True,
+                recompress_flate=False,
+            )
+    return stats
@@ -0,0 +1,185 @@
+"""
+Object-level PDF page operations (merge, split, extract) built on pikepdf/qpdf.
+
+Pages and the resources they use are copied by reference between documents;
+nothing is re-rendered. Source documents are opened lazily (stream data stays
+on disk until written), and the output is streamed to the client as qpdf
+writes it through a bounded queue, so memory does not grow with page count.
+"""
+
+import asyncio
+import logging
+import zipfile
+from contextlib import ExitStack
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+import pikepdf
+
+from app.services.pdf_dedupe import DedupeStats, dedupe_streams
+from app.utils.streaming import stream_writer
+
+logger = logging.getLogger(__name__)
+
+class PageRangeError(ValueError):
+    """Raised for a page specification that does not fit the document."""
+
+
+def parse_page_ranges(spec: str, page_count: int) -> list[tuple[int, int]]:
+    """
+    Parse "1-3,5,8-" into 1-based inclusive (start, end) ranges.
+    An open end ("8-") runs to the last page.
+    """
+    if not spec or not spec.strip():
+        raise PageRangeError("Page range is required")
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                start_s, end_s = part.split("-", 1)
+                start = int(start_s) if start_s.strip() else 1
+                end = int(end_s) if end_s.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise PageRangeError(f"Invalid page range: {part}")
+
+        if start < 1 or end > page_count or start > end:
+            raise PageRangeError(f"Page range {part} is outside 1-{page_count}")
+        ranges.append((start, end))
+
+    if not ranges:
+        raise PageRangeError("Page range is required")
+    return ranges
+
+
+def fixed_size_ranges(page_count: int, every: int) -> list[tuple[int, int]]:
+    if every < 1:
+        raise PageRangeError("Split size must be at least 1")
+    return [(start, min(start + every - 1, page_count)) for start in range(1, page_count + 1, every)]
+
+
+class PageJob:
+    """Open source documents plus the output assembled from them; close() releases everything."""
+
+    def __init__(self):
+        self._stack = ExitStack()
+        self.sources: list[pikepdf.Pdf] = []
+        self.output: pikepdf.Pdf | None = None
+        self.ranges: list[tuple[int, int]] = []
+        self.dedupe = DedupeStats()
+
+    def open_source(self, path: str) -> pikepdf.Pdf:
+        pdf = self._stack.enter_context(pikepdf.open(path))
+        self.sources.append(pdf)
+        return pdf
+
+    def new_output(self) -> pikepdf.Pdf:
+        self.output = self._stack.enter_context(pikepdf.new())
+        return self.output
+
+    def close(self):
+        self._stack.close()
+
+
+def _save_options() -> dict:
+    return {
+        "object_stream_mode": pikepdf.ObjectStreamMode.generate,
+        "compress_streams": True,
+        "recompress_flate": False,
+    }
+
+
+class PDFPageService:
+    @staticmethod
+    def prepare_merge(input_paths: list[str]) -> PageJob:
+        """Append every page of every input, then share identical fonts/images across inputs."""
+        job = PageJob()
+        try:
+            output = job.new_output()
+            for path in input_paths:
+                source = job.open_source(path)
+                output.pages.extend(source.pages)
+            job.dedupe = dedupe_streams(output)
+            logger.info(f"Merged {len(input_paths)} PDFs into {len(output.pages)} pages")
+            return job
+        except Exception:
+            job.close()
+            raise
+
+    @staticmethod
+    def prepare_extract(input_path: str, page_spec: str) -> PageJob:
+        """Copy the selected pages (in the order given) into a new document."""
+        job = PageJob()
+        try:
+            source = job.open_source(input_path)
+            job.ranges = parse_page_ranges(page_spec, len(source.pages))
+            output = job.new_output()
+            for start, end in job.ranges:
+                for index in range(start - 1, end):
+                    output.pages.append(source.pages[index])
+            return job
+        except Exception:
+            job.close()
+            raise
+
+    @staticmethod
+    def prepare_split(input_path: str, page_spec: str | None, every: int | None) -> PageJob:
+        """Open the source and resolve the parts; pages are copied while streaming."""
+        job = PageJob()
+        try:
+            source = job.open_source(input_path)
+            page_count = len(source.pages)
+            if page_spec:
+                job.ranges = parse_page_ranges(page_spec, page_count)
+            else:
+                job.ranges = fixed_size_ranges(page_count, every or 1)
+            return job
+        except Exception:
+            job.close()
+            raise
+
+    @staticmethod
+    def stream_pdf(job: PageJob, on_close: Callable[[], None]) -> AsyncIterator[bytes]:
+        def write(stream):
+            job.output.save(stream, **_save_options())
+
+        def close():
+            job.close()
+            on_close()
+
+        return stream_writer(write, close)
+
+    @staticmethod
+    def stream_split_zip(job: PageJob, base_name: str, on_close: Callable[[], None]) -> AsyncIterator[bytes]:
+        """ZIP of one PDF per range, each part built and written one at a time."""
+        source = job.sources[0]
+        stem = Path(base_name).stem or "document"
+
+        def write(stream):
+            with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as archive:
+                for start, end in job.ranges:
+                    label = f"{start}" if start == end else f"{start}-{end}"
+                    with pikepdf.new() as part:
+                        for index in range(start - 1, end):
+                            part.pages.append(source.pages[index])
+                        with archive.open(f"{stem}_{label}.pdf", "w") as entry:
+                            part.save(entry, **_save_options())
+
+        def close():
+            job.close()
+            on_close()
+
+        return stream_writer(write, close)
+
+    @staticmethod
+    async def prepare(func, *args) -> PageJob:
+        return await asyncio.to_thread(func, *args)
+
+
+# Errors caused by the uploaded document or the requested pages (client errors)
+PDF_INPUT_ERRORS = (pikepdf.PdfError, pikepdf.PasswordError, PageRangeError)
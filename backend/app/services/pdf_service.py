@@ -1,28 +1,80 @@
 import os
+import time
 import logging
 import asyncio
-import uuid
 import shutil
 from pathlib import Path
-import img2pdf
+import pikepdf
+from app.services.compression_profiles import (
+    CompressionProfile,
+    ProfileError,
+    get_profile,
+    gs_distiller_params,
+    gs_profile_args,
+)
+from app.services.color_reduction import ColorReductionStats, reduce_colors_file
+from app.services.font_service import FontService
+from app.services.pdf_dedupe import DedupeStats, dedupe_file
+from app.services.office_media_service import OfficeMediaService
+from app.services.timeout_policy import (
+    ENGINE_RETRY,
+    WorkEstimate,
+    history,
+    pdf_work,
+    safer_command,
+    timeout_for,
+)
+from app.utils.engine_governor import EngineProcess
+from app.utils.ooxml import probe_pptx
+from app.utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
 PROCESS_TIMEOUT = int(os.getenv("PROCESS_TIMEOUT", "300"))
+COMPRESS_DEDUPE = os.getenv("COMPRESS_DEDUPE", "1").strip().lower() in ("1", "true", "yes", "on")
+COMPRESS_PERCEPTUAL_DEDUPE = os.getenv("COMPRESS_PERCEPTUAL_DEDUPE", "0").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+COMPRESS_COLOR_REDUCTION = os.getenv("COMPRESS_COLOR_REDUCTION", "1").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+OFFICE_MEDIA_DOWNSAMPLE = os.getenv("OFFICE_MEDIA_DOWNSAMPLE", "0").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
 
 
 class PDFService:
     @staticmethod
     def get_gs_settings(level: str):
-        settings = {
-            "low": "/screen",
-            "medium": "/ebook",
-            "high": "/printer",
-        }
-        return settings.get(level, "/ebook")
+        try:
+            return get_profile(level).pdfsettings
+        except ProfileError:
+            return "/ebook"
 
     @staticmethod
-    async def compress_pdf(input_path: str, output_path: str, quality: str = "medium"):
+    async def compress_pdf(
+        input_path: str,
+        output_path: str,
+        quality: str = "medium",
+        profile: CompressionProfile | None = None,
+        work: WorkEstimate | None = None,
+    ):
+        """
+        Compress with the named profile (see app.services.compression_profiles),
+        or with an explicit profile: a Ghostscript pdfwrite pass, then a qpdf
+        pass that writes object/xref streams and optionally linearizes.
+        work (see app.services.timeout_policy.pdf_work) sets the Ghostscript
+        timeout; it is measured from input_path when not given.
+        """
         if not os.path.exists(input_path):
             logger.error(f"Input file not found: {input_path}")
             return False
@@ -30,30 +82,164 @@ class PDFService:
         output_dir = os.path.dirname(output_path)
         os.makedirs(output_dir, exist_ok=True)
 
-        gs_setting = PDFService.get_gs_settings(quality)
+        if profile is None:
+            try:
+                profile = get_profile(quality)
+            except ProfileError as e:
+                logger.error(str(e))
+                return False
 
         gs_command = [
             "gs",
             "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            f"-dPDFSETTINGS={gs_setting}",
+            *gs_profile_args(profile),
             "-dNOPAUSE",
             "-dQUIET",
             "-dBATCH",
             "-dSAFER",
             "-dNOGC",
             "-dNOPLATFONTS",
-            "-dColorImageResolution=150",
-            "-dGrayImageResolution=150",
-            "-dMonoImageResolution=150",
             f"-sOutputFile={output_path}",
+            *gs_distiller_params(profile),
             input_path,
         ]
 
-        return await PDFService._execute_command(gs_command, "Compression")
+        if work is None:
+            work = await asyncio.to_thread(pdf_work, input_path)
+
+        with span("compress", **{"compression.profile": profile.name}):
+            if not await PDFService._execute_command(gs_command, "Compression", work=work):
+                return False
+
+            if profile.object_streams or profile.linearize:
+                with span("compress.rewrite_structure"):
+                    await asyncio.to_thread(PDFService._rewrite_structure, output_path, profile)
+        return True
+
+    @staticmethod
+    async def dedupe_images(input_path: str, output_path: str) -> DedupeStats | None:
+        """
+        Compression pre-pass: collapse repeated images (and font programs) into
+        one shared object so Ghostscript re-encodes each picture once.
+        output_path is written only when something was merged; returns None
+        when the pass is disabled or the file cannot be processed.
+        """
+        if not COMPRESS_DEDUPE:
+            return None
+        try:
+            with span("compress.dedupe_images") as trace_span:
+                stats = await asyncio.to_thread(
+                    dedupe_file, input_path, output_path, COMPRESS_PERCEPTUAL_DEDUPE
+                )
+                if stats:
+                    trace_span.set(**{"dedupe.bytes_saved": stats.bytes_saved})
+                return stats
+        except Exception as e:
+            logger.warning(f"Image dedupe pre-pass skipped: {e}")
+            return None
+
+    @staticmethod
+    async def reduce_colors(
+        input_path: str, output_path: str, profile: CompressionProfile
+    ) -> ColorReductionStats | None:
+        """
+        Compression pre-pass: store color images that are effectively gray or
+        black-and-white (typical scans) as 8-bit gray or 1-bit CCITT G4, as
+        far as profile.color_reduction allows. output_path is written only
+        when an image was replaced.
+        """
+        if not COMPRESS_COLOR_REDUCTION or profile.color_reduction == "none":
+            return None
+        try:
+            with span(
+                "compress.reduce_colors", **{"color_reduction.mode": profile.color_reduction}
+            ) as trace_span:
+                stats = await asyncio.to_thread(
+                    reduce_colors_file,
+                    input_path,
+                    output_path,
+                    profile.color_reduction,
+                    profile.jpeg_quality,
+                )
+                trace_span.set(
+                    **{
+                        "color_reduction.gray": stats.gray,
+                        "color_reduction.bilevel": stats.bilevel,
+                        "color_reduction.bytes_saved": stats.bytes_saved,
+                    }
+                )
+                return stats
+        except Exception as e:
+            logger.warning(f"Color reduction pre-pass skipped: {e}")
+            return None
+
+    @staticmethod
+    def _linearize(path: str) -> bool:
+        tmp_path = f"{path}.lin"
+        try:
+            with pikepdf.open(path) as pdf:
+                pdf.save(
+                    tmp_path,
+                    linearize=True,
+                    object_stream_mode=pikepdf.ObjectStreamMode.preserve,
+                    recompress_flate=False,
+                )
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.warning(f"Linearization failed, keeping original output: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    async def linearize_pdf(path: str) -> bool:
+        """
+        Rewrite a PDF in place for fast web view: first-page objects and a hint
+        table at the front, so a viewer fetching byte ranges can show page 1
+        before the rest of the file has arrived.
+        """
+        with span("linearize"):
+            return await asyncio.to_thread(PDFService._linearize, path)
+
+    @staticmethod
+    def _rewrite_structure(path: str, profile: CompressionProfile):
+        """
+        Rewrite the file with object and xref streams (and linearization) in place.
+        Ghostscript output is kept as is when qpdf cannot improve on it.
+        """
+        tmp_path = f"{path}.qpdf"
+        try:
+            with pikepdf.open(path) as pdf:
+                pdf.save(
+                    tmp_path,
+                    object_stream_mode=(
+                        pikepdf.ObjectStreamMode.generate
+                        if profile.object_streams
+                        else pikepdf.ObjectStreamMode.preserve
+                    ),
+                    compress_streams=True,
+                    recompress_flate=False,
+                    linearize=profile.linearize,
+                )
+
+            before, after = os.path.getsize(path), os.path.getsize(tmp_path)
+            if after < before or profile.linearize:
+                os.replace(tmp_path, path)
+                logger.info(
+                    f"Structure rewrite ({profile.name}): {before / 1024:.0f} KB -> {after / 1024:.0f} KB"
+                )
+        except Exception as e:
+            logger.warning(f"Structure rewrite failed, keeping Ghostscript output: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     @staticmethod
-    async def convert_docx_to_pdf(input_path: str, output_dir: str):
+    async def convert_docx_to_pdf(
+        input_path: str, output_dir: str, work: WorkEstimate | None = None
+    ):
         """
         Convert DOCX to PDF with isolated user profile to prevent race conditions.
         
@@ -67,10 +253,14 @@ class PDFService:
         os.makedirs(output_dir, exist_ok=True)
 
         # Create unique user profile directory for this conversion
-        unique_user_dir = f"/tmp/libreoffice_{uuid.uuid4().hex}"
-        os.makedirs(unique_user_dir, exist_ok=True)
+        # (cloned from the warmed-up template when available)
+        with span("office.user_profile"):
+            unique_user_dir = await FontService.create_user_profile()
 
         try:
+            with span("office.prepare_input"):
+                source_path = await PDFService._prepare_office_input(input_path, unique_user_dir)
+
             command = [
                 "libreoffice",
                 f"-env:UserInstallation=file://{unique_user_dir}",
@@ -79,10 +269,12 @@ class PDFService:
                 "pdf",
                 "--outdir",
                 output_dir,
-                input_path,
+                source_path,
             ]
 
-            success = await PDFService._execute_command(command, "DOCX Conversion")
+            success = await PDFService._execute_command(
+                command, "DOCX Conversion", work=work or PDFService._office_work(input_path)
+            )
 
             if success:
                 file_stem = Path(input_path).stem
@@ -98,60 +290,77 @@ class PDFService:
             logger.error(f"Error during DOCX conversion: {e}", exc_info=True)
             return None, unique_user_dir
 
+    @staticmethod
+    def _office_work(input_path: str) -> WorkEstimate:
+        # Without a preflight report (e.g. legacy .doc/.ppt) only the size is known
+        return WorkEstimate(kind="soffice", bytes=os.path.getsize(input_path))
+
+    @staticmethod
+    async def _prepare_office_input(input_path: str, work_dir: str) -> str:
+        """
+        Return the package LibreOffice should convert.
+
+        With OFFICE_MEDIA_DOWNSAMPLE enabled, DOCX/PPTX media are downsampled
+        into a copy under work_dir (same file name, so the output PDF name is
+        unchanged). Falls back to the original file on any failure.
+        """
+        if not OFFICE_MEDIA_DOWNSAMPLE or Path(input_path).suffix.lower() not in (".docx", ".pptx"):
+            return input_path
+
+        slim_dir = os.path.join(work_dir, "slim")
+        os.makedirs(slim_dir, exist_ok=True)
+        slim_path = os.path.join(slim_dir, Path(input_path).name)
+
+        try:
+            stats = await OfficeMediaService.downsample_package_async(input_path, slim_path)
+        except Exception as e:
+            logger.warning(f"Media downsampling failed, converting original package: {e}")
+            return input_path
+
+        return slim_path if stats else input_path
+
     @staticmethod
     def _detect_ppt_slide_size(input_path: str) -> tuple[float, float] | None:
         """
         Detect slide dimensions from PPT/PPTX file.
         Returns (width_pts, height_pts) in points (1 inch = 72 points), or None if detection fails.
+
+        Only ppt/presentation.xml is read (see app.utils.ooxml.probe_pptx), so
+        media-heavy decks are not loaded just to read the slide size.
         """
         try:
             file_ext = Path(input_path).suffix.lower()
-            
-            # For PPTX files, use python-pptx to detect dimensions
+
             if file_ext == ".pptx":
-                try:
-                    from pptx import Presentation
-                    
-                    prs = Presentation(input_path)
-                    if len(prs.slides) == 0:
-                        return None
-                    
-                    # Get slide dimensions from presentation
-                    # python-pptx uses EMU (English Metric Units)
-                    # Convert EMU to points using utility function
-                    slide_width_emu = prs.slide_width
-                    slide_height_emu = prs.slide_height
-                    
-                    # Convert EMU to inches, then to points
-                    # 1 inch = 914400 EMU, 1 point = 1/72 inch
-                    # So: points = (EMU / 914400) * 72 = EMU / 12700
-                    width_pts = slide_width_emu / 12700.0
-                    height_pts = slide_height_emu / 12700.0
-                    
-                    logger.info(f"Detected PPTX slide size: {width_pts:.2f} x {height_pts:.2f} points ({width_pts/72:.2f}\" x {height_pts/72:.2f}\")")
-                    return (width_pts, height_pts)
-                    
-                except ImportError:
-                    logger.warning("python-pptx not available, cannot detect slide dimensions")
+                probe = probe_pptx(input_path)
+                if not probe or probe.slide_count == 0 or not probe.slide_size:
                     return None
-                except Exception as e:
-                    logger.warning(f"Error detecting PPTX dimensions: {e}")
-                    return None
-            
+
+                width_pts, height_pts = probe.slide_size
+                logger.info(
+                    f"Detected PPTX slide size: {width_pts:.2f} x {height_pts:.2f} points "
+                    f"({width_pts/72:.2f}\" x {height_pts/72:.2f}\"), "
+                    f"{probe.slide_count} slides, {probe.media_count} media parts "
+                    f"({probe.media_bytes / (1024 * 1024):.1f} MB)"
+                )
+                return (width_pts, height_pts)
+
             # For old PPT files (.ppt), we can't easily detect dimensions
             # Return None to use default/auto-detect from LibreOffice output
             elif file_ext == ".ppt":
                 logger.info("Old PPT format detected, will use LibreOffice default dimensions")
                 return None
-            
+
             return None
-            
+
         except Exception as e:
             logger.warning(f"Error in slide size detection: {e}")
             return None
 
     @staticmethod
-    async def convert_ppt_to_pdf(input_path: str, output_dir: str):
+    async def convert_ppt_to_pdf(
+        input_path: str, output_dir: str, work: WorkEstimate | None = None
+    ):
         """
         Convert PPT/PPTX to PDF with high precision using:
         1. Isolated LibreOffice user profile (prevents race conditions)
@@ -168,17 +377,21 @@ class PDFService:
         os.makedirs(output_dir, exist_ok=True)
 
         # Detect slide dimensions before conversion
-        slide_dimensions = await asyncio.to_thread(PDFService._detect_ppt_slide_size, input_path)
+        with span("ppt.detect_slide_size"):
+            slide_dimensions = await asyncio.to_thread(PDFService._detect_ppt_slide_size, input_path)
         
         # Create unique user profile directory for this conversion
         # This prevents race conditions when multiple conversions run simultaneously
-        unique_user_dir = f"/tmp/libreoffice_{uuid.uuid4().hex}"
-        os.makedirs(unique_user_dir, exist_ok=True)
+        with span("office.user_profile"):
+            unique_user_dir = await FontService.create_user_profile()
 
         try:
             # Step 1: Convert PPT to PDF using LibreOffice with isolated profile
             # LibreOffice will preserve slide dimensions and text size automatically
             # Use default PDF export settings to maintain original appearance
+            with span("office.prepare_input"):
+                source_path = await PDFService._prepare_office_input(input_path, unique_user_dir)
+
             command = [
                 "libreoffice",
                 f"-env:UserInstallation=file://{unique_user_dir}",
@@ -187,10 +400,12 @@ class PDFService:
                 "pdf",
                 "--outdir",
                 output_dir,
-                input_path,
+                source_path,
             ]
 
-            success = await PDFService._execute_command(command, "PPT Conversion")
+            success = await PDFService._execute_command(
+                command, "PPT Conversion", work=work or PDFService._office_work(input_path)
+            )
 
             if not success:
                 logger.error("LibreOffice conversion failed")
@@ -235,10 +450,13 @@ class PDFService:
         try:
 
             def perform_conversion():
+                import img2pdf
+
                 with open(output_path, "wb") as f:
                     f.write(img2pdf.convert(input_paths))
 
-            await asyncio.to_thread(perform_conversion)
+            with span("image.img2pdf", **{"image.count": len(input_paths)}):
+                await asyncio.to_thread(perform_conversion)
 
             if os.path.exists(output_path):
                 logger.info(f"Image to PDF conversion success: {output_path}")
@@ -250,31 +468,100 @@ class PDFService:
             return False
 
     @staticmethod
-    async def _execute_command(command: list, task_name: str):
-        try:
-            process = await asyncio.create_subprocess_exec(
-                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-
-            try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(), timeout=PROCESS_TIMEOUT
-                )
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                logger.error(f"{task_name} timeout after {PROCESS_TIMEOUT}s")
-                return False
+    async def _execute_command(
+        command: list,
+        task_name: str,
+        env: dict | None = None,
+        timeout: int | None = None,
+        work: WorkEstimate | None = None,
+    ):
+        """
+        Run an engine command. Without an explicit timeout, one is derived from
+        work (see app.services.timeout_policy), else PROCESS_TIMEOUT applies.
+        A run that timed out or was stopped by a resource limit is retried
+        once with a safer variant of the command when there is one; an
+        ordinary error exit (bad input) would only fail again.
+        """
+        if not timeout:
+            timeout = timeout_for(work) if work else PROCESS_TIMEOUT
+
+        started = time.monotonic()
+        outcome = await PDFService._run_engine(command, task_name, env, timeout)
+        elapsed = time.monotonic() - started
+        if outcome == "ok":
+            if work:
+                history.record(work, elapsed)
+            return True
+        if outcome == "timeout" and work:
+            # Counted at no less than its timeout; leaving it out would let the
+            # learned rate shrink towards the runs that happened to be fast enough
+            history.record(work, max(elapsed, timeout))
 
-            if process.returncode != 0:
-                error_msg = stderr.decode() if stderr else "Unknown error"
-                logger.error(
-                    f"{task_name} failed (exit {process.returncode}): {error_msg}"
-                )
-                return False
+        retry_command = safer_command(command) if ENGINE_RETRY and outcome in ("timeout", "limit") else None
+        if not retry_command:
+            return False
+        logger.warning(f"Retrying {task_name} with safer flags")
+        outcome = await PDFService._run_engine(retry_command, f"{task_name} (retry)", env, timeout)
+        return outcome == "ok"
 
-            return True
+    @staticmethod
+    async def _run_engine(command: list, task_name: str, env: dict | None, timeout: int) -> str:
+        """Run once: "ok", "timeout", "limit" (resource limit or killed by a signal) or "failed"."""
+        with span(
+            f"exec {os.path.basename(command[0])}",
+            **{"process.executable.name": command[0], "process.task": task_name, "process.timeout_s": timeout},
+        ) as trace_span:
+            engine = EngineProcess(command, env)
+            try:
+                process = await engine.start()
+                trace_span.event("process.start", pid=process.pid)
 
-        except Exception as e:
-            logger.error(f"Unexpected error during {task_name}: {e}", exc_info=True)
-            return False
\ No newline at end of file
+                try:
+                    stdout, stderr = await asyncio.wait_for(
+                        process.communicate(), timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    engine.kill()
+                    await process.wait()
+                    logger.error(f"{task_name} timeout after {timeout}s")
+                    trace_span.fail(f"timeout after {timeout}s")
+                    return "timeout"
+
+                trace_span.event("process.exit", exit_code=process.returncode)
+                usage = engine.finish()
+                if usage:
+                    trace_span.set(
+                        **{
+                            "process.cpu.seconds": round(usage.cpu_seconds, 3),
+                            "process.memory.peak_bytes": usage.peak_memory_bytes,
+                            "process.limit_hit": usage.limit_hit,
+                        }
+                    )
+                trace_span.set(**{"process.exit.code": process.returncode})
+                if process.returncode != 0:
+                    error_msg = stderr.decode() if stderr else "Unknown error"
+                    logger.error(
+                        f"{task_name} failed (exit {process.returncode}): {error_msg}"
+                    )
+                    trace_span.fail(f"exit {process.returncode}")
+                    # The sandbox exits 128 + signal; its report keeps the raw (negative) status.
+                    # A signal is a governor limit, the kernel OOM killer or a crash.
+                    exit_code = usage.exit_code if usage else process.returncode
+                    # Ghostscript under an address-space limit fails its allocations and exits normally
+                    vm_error = (
+                        os.path.basename(command[0]) == "gs"
+                        and engine.limits.memory_mb > 0
+                        and "VMerror" in error_msg
+                    )
+                    if (usage and usage.limit_hit) or exit_code < 0 or vm_error:
+                        return "limit"
+                    return "failed"
+
+                return "ok"
+
+            except Exception as e:
+                logger.error(f"Unexpected error during {task_name}: {e}", exc_info=True)
+                trace_span.fail(str(e))
+                return "failed"
+            finally:
+                engine.finish()
@@ -0,0 +1,305 @@
+import os
+import re
+import asyncio
+import logging
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from xml.etree import ElementTree as ET
+
+from app.services.font_service import installed_font_families
+from app.services.timeout_policy import WorkEstimate
+from app.utils.concurrency import EngineSlot, get_slot
+from app.utils.ooxml import media_totals, read_presentation_part
+from app.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+WML_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DML_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+EXT_PROPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/extended-properties"
+
+# ZIP bomb guards, checked against the central directory before anything is inflated
+OOXML_MAX_ENTRIES = int(os.getenv("OOXML_MAX_ENTRIES", "10000"))
+OOXML_MAX_UNCOMPRESSED_MB = int(os.getenv("OOXML_MAX_UNCOMPRESSED_MB", "2048"))
+OOXML_MAX_COMPRESSION_RATIO = int(os.getenv("OOXML_MAX_COMPRESSION_RATIO", "100"))
+
+# Admission thresholds on the estimated LibreOffice runtime (seconds)
+OFFICE_HEAVY_COST_SECONDS = float(os.getenv("OFFICE_HEAVY_COST_SECONDS", "30"))
+OFFICE_MAX_COST_SECONDS = float(os.getenv("OFFICE_MAX_COST_SECONDS", "600"))
+# Concurrent LibreOffice conversions per worker on each admission slot
+OFFICE_LIGHT_SLOTS = int(os.getenv("OFFICE_LIGHT_SLOTS", "2"))
+OFFICE_HEAVY_SLOTS = int(os.getenv("OFFICE_HEAVY_SLOTS", "1"))
+
+# Rough per-feature costs used by the estimate, tuned on LibreOffice 7.x
+_BASE_COST = 2.0
+_COST_PER_PAGE = {"docx": 0.05, "pptx": 0.3}
+_COST_PER_MEDIA_MB = 0.15
+_COST_PER_OLE_OBJECT = 1.0
+_COST_PER_MISSING_FONT = 0.5
+
+# Without docProps/app.xml we guess pages from the size of the body part
+_DOCX_BYTES_PER_PAGE = 20000
+
+
+class PreflightError(ValueError):
+    """Raised when an Office package must not be handed to LibreOffice."""
+
+
+@dataclass(frozen=True)
+class OfficePreflight:
+    kind: str
+    pages: int
+    media_count: int
+    media_bytes: int
+    fonts_referenced: tuple[str, ...]
+    fonts_missing: tuple[str, ...]
+    ole_objects: int
+    uncompressed_bytes: int
+    slide_width_pts: float | None
+    slide_height_pts: float | None
+    estimated_seconds: float
+
+    @property
+    def heavy(self) -> bool:
+        return self.estimated_seconds >= OFFICE_HEAVY_COST_SECONDS
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "pages": self.pages,
+            "media_count": self.media_count,
+            "media_bytes": self.media_bytes,
+            "fonts_referenced": list(self.fonts_referenced),
+            "fonts_missing": list(self.fonts_missing),
+            "ole_objects": self.ole_objects,
+            "uncompressed_bytes": self.uncompressed_bytes,
+            "estimated_seconds": round(self.estimated_seconds, 2),
+            "heavy": self.heavy,
+        }
+
+    def work_estimate(self, file_size: int) -> WorkEstimate:
+        """LibreOffice work for the adaptive conversion timeout."""
+        return WorkEstimate(
+            kind="soffice",
+            bytes=file_size,
+            pages=self.pages if self.kind == "docx" else 0,
+            slides=self.pages if self.kind == "pptx" else 0,
+            images=self.media_count,
+        )
+
+
+def _qname(ns: str, tag: str) -> str:
+    return f"{{{ns}}}{tag}"
+
+
+def _check_package_limits(zf: zipfile.ZipFile) -> int:
+    """Reject ZIP bombs from central directory data. Returns total uncompressed bytes."""
+    infos = zf.infolist()
+    if len(infos) > OOXML_MAX_ENTRIES:
+        raise PreflightError(f"Package has too many entries ({len(infos)})")
+
+    total = 0
+    for info in infos:
+        total += info.file_size
+        if info.compress_size > 0 and info.file_size > 1024 * 1024:
+            ratio = info.file_size / info.compress_size
+            if ratio > OOXML_MAX_COMPRESSION_RATIO:
+                raise PreflightError(
+                    f"Suspicious compression ratio {ratio:.0f}:1 in {info.filename}"
+                )
+
+    if total > OOXML_MAX_UNCOMPRESSED_MB * 1024 * 1024:
+        raise PreflightError(
+            f"Package expands to {total / (1024 * 1024):.0f} MB, "
+            f"limit is {OOXML_MAX_UNCOMPRESSED_MB} MB"
+        )
+    return total
+
+
+def _iter_attr(zf: zipfile.ZipFile, part: str, tag: str, attr: str):
+    """Stream attribute values of every tag element in a package part."""
+    with zf.open(part) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == tag:
+                value = elem.get(attr)
+                if value:
+                    yield value
+            elem.clear()
+
+
+def _iter_text(zf: zipfile.ZipFile, part: str, tag: str):
+    with zf.open(part) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == tag and elem.text:
+                yield elem.text.strip()
+            elem.clear()
+
+
+def _theme_fonts(zf: zipfile.ZipFile, names: list[str]) -> set[str]:
+    fonts = set()
+    theme_re = re.compile(r"^(ppt|word)/theme/theme\d*\.xml$")
+    for name in names:
+        if not theme_re.match(name):
+            continue
+        for tag in ("latin", "ea", "cs"):
+            fonts.update(_iter_attr(zf, name, _qname(DML_NS, tag), "typeface"))
+    return fonts
+
+
+def _count_embeddings(names: list[str], prefix: str) -> int:
+    return sum(1 for n in names if n.startswith(prefix) and not n.endswith("/"))
+
+
+def _analyze_docx(zf: zipfile.ZipFile, names: list[str]) -> dict:
+    if "word/document.xml" not in names:
+        raise PreflightError("Not a valid DOCX package")
+
+    pages = 0
+    if "docProps/app.xml" in names:
+        for value in _iter_text(zf, "docProps/app.xml", _qname(EXT_PROPS_NS, "Pages")):
+            pages = int(value) if value.isdigit() else 0
+            break
+    if pages <= 0:
+        body_size = zf.getinfo("word/document.xml").file_size
+        pages = max(1, body_size // _DOCX_BYTES_PER_PAGE)
+
+    fonts = set()
+    if "word/fontTable.xml" in names:
+        fonts.update(
+            _iter_attr(zf, "word/fontTable.xml", _qname(WML_NS, "font"), _qname(WML_NS, "name"))
+        )
+    fonts.update(_theme_fonts(zf, names))
+
+    media_count, media_bytes = media_totals(zf, "word/media/")
+    return {
+        "kind": "docx",
+        "pages": pages,
+        "fonts": fonts,
+        "media_count": media_count,
+        "media_bytes": media_bytes,
+        "ole_objects": _count_embeddings(names, "word/embeddings/"),
+        "slide_size": None,
+    }
+
+
+def _analyze_pptx(zf: zipfile.ZipFile, names: list[str]) -> dict:
+    if "ppt/presentation.xml" not in names:
+        raise PreflightError("Not a valid PPTX package")
+
+    slide_size, slides = read_presentation_part(zf)
+
+    fonts = _theme_fonts(zf, names)
+    slide_re = re.compile(r"^ppt/slides/slide\d+\.xml$")
+    for name in names:
+        if slide_re.match(name):
+            fonts.update(_iter_attr(zf, name, _qname(DML_NS, "latin"), "typeface"))
+
+    media_count, media_bytes = media_totals(zf, "ppt/media/")
+    return {
+        "kind": "pptx",
+        "pages": slides,
+        "fonts": fonts,
+        "media_count": media_count,
+        "media_bytes": media_bytes,
+        "ole_objects": _count_embeddings(names, "ppt/embeddings/"),
+        "slide_size": slide_size,
+    }
+
+
+def estimate_cost(kind: str, pages: int, media_bytes: int, ole_objects: int, missing_fonts: int) -> float:
+    """Estimated LibreOffice conversion time in seconds."""
+    return (
+        _BASE_COST
+        + pages * _COST_PER_PAGE.get(kind, 0.1)
+        + (media_bytes / (1024 * 1024)) * _COST_PER_MEDIA_MB
+        + ole_objects * _COST_PER_OLE_OBJECT
+        + missing_fonts * _COST_PER_MISSING_FONT
+    )
+
+
+class PreflightService:
+    @staticmethod
+    def analyze(input_path: str) -> OfficePreflight | None:
+        """
+        Inspect a DOCX/PPTX package without rendering it.
+
+        Returns None for legacy binary formats (.doc/.ppt) which cannot be
+        inspected this way. Raises PreflightError for packages that are
+        malformed or look like ZIP bombs.
+        """
+        ext = Path(input_path).suffix.lower()
+        if ext not in (".docx", ".pptx"):
+            return None
+
+        try:
+            with zipfile.ZipFile(input_path) as zf:
+                uncompressed = _check_package_limits(zf)
+                names = zf.namelist()
+                info = _analyze_docx(zf, names) if ext == ".docx" else _analyze_pptx(zf, names)
+        except PreflightError:
+            raise
+        except zipfile.BadZipFile:
+            raise PreflightError("File is not a valid Office Open XML package")
+        except (ET.ParseError, KeyError, ValueError) as e:
+            raise PreflightError(f"Malformed Office package: {e}")
+
+        referenced = sorted(f for f in info["fonts"] if not f.startswith("+"))
+        installed = installed_font_families()
+        if installed is None:
+            missing = []
+        else:
+            missing = [f for f in referenced if f.lower() not in installed]
+
+        slide_size = info["slide_size"]
+        report = OfficePreflight(
+            kind=info["kind"],
+            pages=info["pages"],
+            media_count=info["media_count"],
+            media_bytes=info["media_bytes"],
+            fonts_referenced=tuple(referenced),
+            fonts_missing=tuple(missing),
+            ole_objects=info["ole_objects"],
+            uncompressed_bytes=uncompressed,
+            slide_width_pts=slide_size[0] if slide_size else None,
+            slide_height_pts=slide_size[1] if slide_size else None,
+            estimated_seconds=estimate_cost(
+                info["kind"], info["pages"], info["media_bytes"], info["ole_objects"], len(missing)
+            ),
+        )
+
+        logger.info(
+            f"Preflight {report.kind}: {report.pages} pages, {report.media_count} media "
+            f"({report.media_bytes / (1024 * 1024):.1f} MB), {report.ole_objects} OLE, "
+            f"{len(report.fonts_missing)}/{len(report.fonts_referenced)} fonts missing, "
+            f"est. {report.estimated_seconds:.1f}s ({'heavy' if report.heavy else 'light'})"
+        )
+        if report.fonts_missing:
+            logger.warning(
+                f"Fonts not installed, LibreOffice will substitute: {', '.join(report.fonts_missing)}"
+            )
+        return report
+
+    @staticmethod
+    async def analyze_async(input_path: str) -> OfficePreflight | None:
+        with span("preflight"):
+            return await asyncio.to_thread(PreflightService.analyze, input_path)
+
+    @staticmethod
+    def check_admission(report: OfficePreflight | None):
+        """Raise PreflightError if the estimated cost exceeds OFFICE_MAX_COST_SECONDS."""
+        if report and OFFICE_MAX_COST_SECONDS > 0 and report.estimated_seconds > OFFICE_MAX_COST_SECONDS:
+            raise PreflightError(
+                f"Document too complex to convert (estimated {report.estimated_seconds:.0f}s)"
+            )
+
+    @staticmethod
+    def admission_slot(report: OfficePreflight | None) -> EngineSlot:
+        """
+        Pick the LibreOffice slot for a job: expensive documents queue on the
+        dedicated heavy slot so they do not block cheap conversions.
+        Legacy formats without a report go to the light slot.
+        """
+        if report and report.heavy:
+            return get_slot("office-heavy", OFFICE_HEAVY_SLOTS)
+        return get_slot("office-light", OFFICE_LIGHT_SLOTS)
@@ -0,0 +1,217 @@
+"""
+Readiness and capacity summary for load balancers (GET /ready).
+
+/health only says the process is up. /ready tells an upstream balancer
+whether this worker can take work and how much:
+
+- engine slots: capacity, in use, free and waiting jobs per engine
+- free bytes on the upload, output and temp filesystems
+- whether the rembg model is loaded (first remove-bg request is slow otherwise)
+- the last self-test of each engine binary (gs, libreoffice, ...)
+- observed engine seconds per work unit (see timeout_policy)
+
+The self-test runs a tiny real job per engine. Its result is cached for
+READY_SELF_TEST_INTERVAL seconds and refreshed in the background when
+stale, so probes never wait on an engine. The worker is reported not ready
+(HTTP 503) when free disk is below READY_MIN_FREE_MB, when an engine in
+READY_ENGINES failed its last self-test, or when more than READY_MAX_QUEUE
+jobs are waiting for slots (0 = no limit).
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import logging
+import tempfile
+from dataclasses import asdict, dataclass
+
+from app.services.image_service import model_status
+from app.services.timeout_policy import history
+from app.utils.concurrency import get_slot, slots_snapshot
+from app.utils.worker_role import APP_ROLE, serves_images
+
+logger = logging.getLogger(__name__)
+
+READY_SELF_TEST_INTERVAL = int(os.getenv("READY_SELF_TEST_INTERVAL", "300"))
+READY_SELF_TEST_TIMEOUT = int(os.getenv("READY_SELF_TEST_TIMEOUT", "30"))
+READY_MIN_FREE_MB = int(os.getenv("READY_MIN_FREE_MB", "1024"))
+READY_MAX_QUEUE = int(os.getenv("READY_MAX_QUEUE", "0"))
+# Image workers do not run gs or LibreOffice, so a broken one must not take them out
+_DEFAULT_READY_ENGINES = "" if APP_ROLE == "image" else "gs,libreoffice"
+READY_ENGINES = [
+    e.strip() for e in os.getenv("READY_ENGINES", _DEFAULT_READY_ENGINES).split(",") if e.strip()
+]
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "outputs")
+
+
+@dataclass
+class SelfTestResult:
+    ok: bool
+    seconds: float
+    checked_at: float
+    error: str | None = None
+
+
+def _self_test_command(engine: str, work_dir: str) -> list[str]:
+    if engine == "gs":
+        # One empty page through pdfwrite: loads fonts, resources and the PDF writer
+        return [
+            "gs",
+            "-q",
+            "-dSAFER",
+            "-dBATCH",
+            "-dNOPAUSE",
+            "-sDEVICE=pdfwrite",
+            f"-sOutputFile={os.path.join(work_dir, 'self-test.pdf')}",
+            "-c",
+            "showpage",
+        ]
+    if engine in ("libreoffice", "soffice"):
+        # A real conversion costs seconds and a profile; --version still catches missing or broken installs
+        return [engine, f"-env:UserInstallation=file://{work_dir}/profile", "--headless", "--version"]
+    return [engine, "--version"]
+
+
+async def _run_self_test(engine: str) -> SelfTestResult:
+    started = time.perf_counter()
+    if not shutil.which(engine):
+        return SelfTestResult(False, 0.0, time.time(), "not installed")
+
+    work_dir = tempfile.mkdtemp(prefix="ready_")
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *_self_test_command(engine, work_dir),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=READY_SELF_TEST_TIMEOUT)
+        error = None
+        if process.returncode != 0:
+            # The last line usually names the problem (missing library, bad resource, ...)
+            lines = stderr.decode(errors="replace").strip().splitlines()
+            error = f"exit {process.returncode}" + (f": {lines[-1][:200]}" if lines else "")
+        elif engine == "gs" and not os.path.exists(os.path.join(work_dir, "self-test.pdf")):
+            error = "no output"
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        error = f"timeout after {READY_SELF_TEST_TIMEOUT}s"
+    except OSError as e:
+        error = str(e)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if error:
+        logger.warning(f"Self-test of {engine} failed: {error}")
+    return SelfTestResult(error is None, round(time.perf_counter() - started, 3), time.time(), error)
+
+
+_self_tests: dict[str, SelfTestResult] = {}
+_refresh_task: asyncio.Task | None = None
+
+
+async def _refresh_self_tests():
+    # One engine at a time: the self-test must not compete with real jobs for CPU
+    for engine in READY_ENGINES:
+        _self_tests[engine] = await _run_self_test(engine)
+
+
+def _self_tests_stale() -> bool:
+    if any(engine not in _self_tests for engine in READY_ENGINES):
+        return True
+    oldest = min(result.checked_at for result in _self_tests.values())
+    return time.time() - oldest > READY_SELF_TEST_INTERVAL
+
+
+def _register_known_slots():
+    """Create the engine slots up front so a fresh worker reports its full capacity."""
+    if APP_ROLE != "image":
+        from app.services.ocr_service import OCR_CPU_BUDGET
+        from app.services.preflight_service import OFFICE_HEAVY_SLOTS, OFFICE_LIGHT_SLOTS
+        from app.services.render_service import RENDER_WORKERS
+
+        get_slot("gs-render", RENDER_WORKERS)
+        get_slot("ocr", OCR_CPU_BUDGET)
+        get_slot("office-light", OFFICE_LIGHT_SLOTS)
+        get_slot("office-heavy", OFFICE_HEAVY_SLOTS)
+    if serves_images():
+        from app.services.image_service import REMBG_SLOTS
+
+        get_slot("rembg", REMBG_SLOTS)
+
+
+def _disk() -> dict[str, dict]:
+    """Free and total bytes per distinct filesystem among the working directories."""
+    disks, seen = {}, set()
+    directories = (("uploads", UPLOAD_DIR), ("outputs", OUTPUT_DIR), ("temp", tempfile.gettempdir()))
+    for name, path in directories:
+        try:
+            device = os.stat(path).st_dev
+            usage = shutil.disk_usage(path)
+        except OSError as e:
+            disks[name] = {"path": path, "error": str(e)}
+            continue
+        if device in seen:
+            continue
+        seen.add(device)
+        disks[name] = {"path": path, "free_bytes": usage.free, "total_bytes": usage.total}
+    return disks
+
+
+class ReadinessService:
+    @staticmethod
+    def refresh_in_background():
+        """Start a self-test run unless one is running or the cached results are fresh."""
+        global _refresh_task
+        if _refresh_task and not _refresh_task.done():
+            return
+        if not READY_ENGINES or not _self_tests_stale():
+            return
+        _refresh_task = asyncio.create_task(_refresh_self_tests())
+
+    @staticmethod
+    def summary() -> tuple[bool, dict]:
+        """(ready, capacity summary); cheap, reads only cached and in-memory state."""
+        ReadinessService.refresh_in_background()
+        _register_known_slots()
+
+        slots = slots_snapshot()
+        queue_depth = sum(slot["waiting"] for slot in slots.values())
+        disk = _disk()
+        engines = {
+            engine: asdict(_self_tests[engine]) if engine in _self_tests else None
+            for engine in READY_ENGINES
+        }
+
+        reasons = []
+        min_free = READY_MIN_FREE_MB * 1024 * 1024
+        for name, usage in disk.items():
+            if "error" in usage:
+                reasons.append(f"{name} directory unavailable")
+            elif usage["free_bytes"] < min_free:
+                reasons.append(f"low disk space on {name}")
+        for engine, result in engines.items():
+            # Before the first self-test finishes the engine is given the benefit of the doubt
+            if result is not None and not result["ok"]:
+                reasons.append(f"{engine} self-test failed")
+        if READY_MAX_QUEUE > 0 and queue_depth > READY_MAX_QUEUE:
+            reasons.append("queue full")
+
+        ready = not reasons
+        return ready, {
+            "status": "ready" if ready else "not_ready",
+            "reasons": reasons,
+            "role": APP_ROLE,
+            "pid": os.getpid(),
+            "slots": slots,
+            "free_slots": sum(slot["free"] for slot in slots.values()),
+            "queue_depth": queue_depth,
+            "disk": disk,
+            "model": model_status() if serves_images() else None,
+            "engines": engines,
+            "engine_runtime": history.snapshot(),
+        }
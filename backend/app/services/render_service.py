@@ -0,0 +1,188 @@
+import os
+import math
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+
+import pikepdf
+
+from app.services.pdf_service import PDFService
+from app.services.timeout_policy import WorkEstimate
+from app.utils.concurrency import available_cpus, get_slot
+from app.utils.disk_cache import link_or_copy, prune_cache, publish
+
+logger = logging.getLogger(__name__)
+
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "cache/render")
+RENDER_CACHE_MAX_MB = int(os.getenv("RENDER_CACHE_MAX_MB", "1024"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(available_cpus())))
+RENDER_MAX_DPI = int(os.getenv("RENDER_MAX_DPI", "300"))
+# Per-request hard links to the pages being served; outside the cache so pruning never touches them
+RENDER_SERVE_DIR = os.getenv("RENDER_SERVE_DIR", RENDER_CACHE_DIR.rstrip("/") + "-serving")
+
+RENDER_FORMATS = {
+    "png": ("png16m", "png", "image/png"),
+    "jpeg": ("jpeg", "jpg", "image/jpeg"),
+}
+
+
+def document_hash(input_path: str) -> str:
+    with open(input_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def page_count(input_path: str) -> int:
+    with pikepdf.open(input_path) as pdf:
+        return len(pdf.pages)
+
+
+def _cache_dir(doc_hash: str) -> str:
+    return os.path.join(RENDER_CACHE_DIR, doc_hash[:2], doc_hash)
+
+
+def _cache_path(doc_hash: str, page: int, dpi: int, ext: str) -> str:
+    return os.path.join(_cache_dir(doc_hash), f"p{page}_{dpi}.{ext}")
+
+
+def page_runs(pages: list[int]) -> list[tuple[int, int]]:
+    """Group sorted page numbers into contiguous (first, last) runs."""
+    runs = []
+    for page in sorted(set(pages)):
+        if runs and page == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+
+def split_runs(runs: list[tuple[int, int]], workers: int) -> list[tuple[int, int]]:
+    """Cut runs into roughly equal chunks so every rasterizer worker gets a page range."""
+    total = sum(last - first + 1 for first, last in runs)
+    chunk = max(1, math.ceil(total / max(1, workers)))
+    chunks = []
+    for first, last in runs:
+        start = first
+        while start <= last:
+            end = min(last, start + chunk - 1)
+            chunks.append((start, end))
+            start = end + 1
+    return chunks
+
+
+class RenderService:
+    @staticmethod
+    async def _render_chunk(
+        input_path: str, doc_hash: str, first: int, last: int, dpi: int, fmt: str, serve_dir: str
+    ) -> bool:
+        device, ext, _ = RENDER_FORMATS[fmt]
+        # Rendered inside the request's serve dir: a prune of the cache root never sees work in progress
+        work_dir = tempfile.mkdtemp(prefix="work_", dir=serve_dir)
+        try:
+            command = [
+                "gs",
+                f"-sDEVICE={device}",
+                f"-r{dpi}",
+                f"-dFirstPage={first}",
+                f"-dLastPage={last}",
+                "-dNOPAUSE",
+                "-dQUIET",
+                "-dBATCH",
+                "-dSAFER",
+                "-dTextAlphaBits=4",
+                "-dGraphicsAlphaBits=4",
+                f"-sOutputFile={os.path.join(work_dir, 'p%d.' + ext)}",
+                input_path,
+            ]
+            if fmt == "jpeg":
+                command.insert(3, "-dJPEGQ=85")
+
+            async with get_slot("gs-render", RENDER_WORKERS).acquire():
+                success = await PDFService._execute_command(
+                    command,
+                    f"Render pages {first}-{last}",
+                    work=WorkEstimate(kind="gs-raster", pages=last - first + 1, dpi=dpi),
+                )
+            if not success:
+                return False
+
+            # gs numbers output files from 1 regardless of -dFirstPage
+            for offset, page in enumerate(range(first, last + 1), start=1):
+                rendered = os.path.join(work_dir, f"p{offset}.{ext}")
+                if not os.path.exists(rendered):
+                    continue
+                # Kept for this request first; the cache entry is a link that may be pruned any time
+                served = os.path.join(serve_dir, f"p{page}.{ext}")
+                os.replace(rendered, served)
+                try:
+                    publish(served, _cache_path(doc_hash, page, dpi, ext))
+                except OSError as e:
+                    logger.warning(f"Rendered page {page} not cached: {e}")
+            return True
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    async def render_pages(
+        input_path: str, pages: list[int], dpi: int = 72, fmt: str = "png"
+    ) -> tuple[dict[int, str], int, str]:
+        """
+        Rasterize pages of a PDF, reusing cached renders.
+
+        Renders are cached content-addressed by (document hash, page, dpi,
+        format). Missing pages are split into page ranges rendered by
+        parallel Ghostscript processes (bounded by the gs-render slot).
+
+        The returned paths are links in a per-request directory, so a cache
+        prune (this request's or a concurrent one's) cannot remove a page
+        while it is being sent. Returns ({page: image_path}, cache_hits,
+        serve_dir); the caller removes serve_dir once the response is sent.
+        """
+        _, ext, _ = RENDER_FORMATS[fmt]
+        doc_hash = await asyncio.to_thread(document_hash, input_path)
+        os.makedirs(_cache_dir(doc_hash), exist_ok=True)
+        os.makedirs(RENDER_SERVE_DIR, exist_ok=True)
+        serve_dir = tempfile.mkdtemp(prefix="render_", dir=RENDER_SERVE_DIR)
+
+        try:
+            results: dict[int, str] = {}
+            missing = []
+            for page in pages:
+                path = _cache_path(doc_hash, page, dpi, ext)
+                served = os.path.join(serve_dir, f"p{page}.{ext}")
+                try:
+                    link_or_copy(path, served)
+                    os.utime(path)
+                    results[page] = served
+                except FileNotFoundError:
+                    missing.append(page)
+            hits = len(results)
+
+            if missing:
+                chunks = split_runs(page_runs(missing), RENDER_WORKERS)
+                await asyncio.gather(
+                    *(
+                        RenderService._render_chunk(
+                            input_path, doc_hash, first, last, dpi, fmt, serve_dir
+                        )
+                        for first, last in chunks
+                    )
+                )
+                for page in missing:
+                    served = os.path.join(serve_dir, f"p{page}.{ext}")
+                    if os.path.exists(served):
+                        results[page] = served
+
+                await asyncio.to_thread(
+                    prune_cache, RENDER_CACHE_MAX_MB * 1024 * 1024, RENDER_CACHE_DIR
+                )
+        except BaseException:
+            shutil.rmtree(serve_dir, ignore_errors=True)
+            raise
+
+        logger.info(
+            f"Rendered {len(missing)} pages at {dpi} DPI ({hits} from cache) "
+            f"for document {doc_hash[:12]}"
+        )
+        return results, hits, serve_dir
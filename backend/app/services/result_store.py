@@ -0,0 +1,158 @@
+"""
+Short-lived storage for generated files that are fetched by URL instead of
+in the response to the upload.
+
+A retained result can be requested any number of times until it expires,
+including with HTTP Range requests, which lets a browser viewer show the
+first page of a linearized PDF before the rest has arrived. Tokens are
+random and are the only handle to a result.
+
+Expired results are purged by a background task started with the app
+(purge_periodically) and, opportunistically, when a result is stored.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+RESULT_DIR = os.getenv("RESULT_DIR", "outputs/results")
+RESULT_TTL_SECONDS = int(os.getenv("RESULT_TTL_SECONDS", "900"))
+
+_TOKEN_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+_PURGE_INTERVAL = 60
+_last_purge = 0.0
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    token: str
+    path: str
+    filename: str
+    media_type: str
+    size: int
+    expires_at: float
+
+
+def _paths(token: str) -> tuple[str, str]:
+    return os.path.join(RESULT_DIR, token), os.path.join(RESULT_DIR, f"{token}.json")
+
+
+class ResultStore:
+    @staticmethod
+    def keep(path: str, filename: str, media_type: str) -> StoredResult:
+        """Move a finished file into the store and return its handle."""
+        ResultStore.purge_expired()
+        os.makedirs(RESULT_DIR, exist_ok=True)
+
+        token = uuid.uuid4().hex
+        data_path, meta_path = _paths(token)
+        shutil.move(path, data_path)
+
+        result = StoredResult(
+            token=token,
+            path=data_path,
+            filename=filename,
+            media_type=media_type,
+            size=os.path.getsize(data_path),
+            expires_at=time.time() + RESULT_TTL_SECONDS,
+        )
+        # Written next to the final name and renamed, so a purge running in
+        # another worker never reads a half-written file
+        tmp_meta_path = f"{meta_path}.tmp"
+        with open(tmp_meta_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "filename": result.filename,
+                    "media_type": result.media_type,
+                    "size": result.size,
+                    "expires_at": result.expires_at,
+                },
+                f,
+            )
+        os.replace(tmp_meta_path, meta_path)
+        return result
+
+    @staticmethod
+    def get(token: str) -> StoredResult | None:
+        if not _TOKEN_PATTERN.match(token or ""):
+            return None
+
+        data_path, meta_path = _paths(token)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if meta["expires_at"] < time.time() or not os.path.exists(data_path):
+            return None
+        return StoredResult(token=token, path=data_path, **meta)
+
+    @staticmethod
+    def purge_expired(force: bool = False):
+        """Delete expired results (at most once a minute unless forced)."""
+        global _last_purge
+        now = time.time()
+        if not force and now - _last_purge < _PURGE_INTERVAL:
+            return
+        _last_purge = now
+
+        if not os.path.isdir(RESULT_DIR):
+            return
+
+        removed = 0
+        names = set(os.listdir(RESULT_DIR))
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            token = name[:-5]
+            data_path, meta_path = _paths(token)
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    expired = json.load(f)["expires_at"] < now
+            except (OSError, json.JSONDecodeError, KeyError):
+                expired = True
+            if expired:
+                for path in (data_path, meta_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                removed += 1
+
+        # Data without meta (a worker died between moving the file and writing
+        # its meta) and stray .tmp files can never be fetched; drop them once
+        # they are older than any result could live
+        for name in names:
+            if name.endswith(".json") or (
+                not name.endswith(".tmp") and f"{name}.json" in names
+            ):
+                continue
+            path = os.path.join(RESULT_DIR, name)
+            try:
+                if os.path.getmtime(path) < now - RESULT_TTL_SECONDS:
+                    os.remove(path)
+                    removed += 1
+            except (FileNotFoundError, IsADirectoryError):
+                pass
+
+        if removed:
+            logger.info(f"Purged {removed} expired results")
+
+    @staticmethod
+    async def purge_periodically():
+        """Background task (started in the app lifespan): purge even when nothing new is stored."""
+        while True:
+            try:
+                await asyncio.to_thread(ResultStore.purge_expired, True)
+            except Exception as e:
+                logger.warning(f"Result purge failed: {e}")
+            await asyncio.sleep(_PURGE_INTERVAL)
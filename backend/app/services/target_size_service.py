@@ -0,0 +1,188 @@
+"""
+Target-size compression: find the gentlest settings whose output fits a byte budget.
+
+Candidates form a ladder from gentle (high DPI, high JPEG quality) to harsh,
+capped by the profile the user picked. Output size shrinks (roughly)
+monotonically down the ladder, so the ladder is searched k-ary: each round
+runs up to TARGET_SIZE_PARALLEL Ghostscript trials spread across the still
+undecided part of the ladder, and every result narrows it from both sides.
+The search stops as soon as a fitting candidate is within tolerance of the
+target, when the gentlest fitting rung is pinned down, or when the trial
+budget is spent.
+"""
+
+import os
+import re
+import asyncio
+import logging
+from dataclasses import dataclass, replace
+
+import pikepdf
+
+from app.services.compression_profiles import CompressionProfile
+from app.services.pdf_service import PDFService
+from app.services.timeout_policy import pdf_work
+
+logger = logging.getLogger(__name__)
+
+TARGET_SIZE_PARALLEL = int(os.getenv("TARGET_SIZE_PARALLEL", "2"))
+TARGET_SIZE_MAX_TRIALS = int(os.getenv("TARGET_SIZE_MAX_TRIALS", "8"))
+# A fitting trial at least this fraction of the target is accepted right away
+TARGET_SIZE_TOLERANCE = float(os.getenv("TARGET_SIZE_TOLERANCE", "0.85"))
+TARGET_SIZE_MIN_BYTES = 50 * 1024
+
+# (image DPI, JPEG quality) from gentle to harsh
+TARGET_LADDER = [
+    (300, 90),
+    (220, 85),
+    (150, 80),
+    (150, 70),
+    (120, 65),
+    (100, 55),
+    (85, 45),
+    (72, 35),
+]
+
+_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(b|kb|k|mb|m|gb|g)?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"b": 1, "k": 1024, "kb": 1024, "m": 1024**2, "mb": 1024**2, "g": 1024**3, "gb": 1024**3}
+
+
+class TargetSizeError(ValueError):
+    """Raised for a target size that cannot be parsed or is out of range."""
+
+
+def parse_size(value: str) -> int:
+    """Parse "2MB", "500 kb", "1.5m" or a plain byte count."""
+    match = _SIZE_PATTERN.match(value or "")
+    if not match:
+        raise TargetSizeError(f"Invalid target size: {value}")
+    number, unit = match.groups()
+    size = int(float(number) * _SIZE_UNITS[(unit or "b").lower()])
+    if size < TARGET_SIZE_MIN_BYTES:
+        raise TargetSizeError(f"Target size must be at least {TARGET_SIZE_MIN_BYTES // 1024} KB")
+    return size
+
+
+@dataclass
+class TargetSizeResult:
+    profile: CompressionProfile
+    output_bytes: int
+    met: bool
+    trials: int
+
+
+def image_stream_bytes(input_path: str) -> int:
+    """Bytes held by image XObjects, the only part DPI/JPEG quality can shrink."""
+    total = 0
+    with pikepdf.open(input_path) as pdf:
+        for obj in pdf.objects:
+            if isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == pikepdf.Name.Image:
+                total += int(obj.get("/Length", 0))
+    return total
+
+
+def build_ladder(base: CompressionProfile) -> list[CompressionProfile]:
+    """Candidates no gentler than the chosen profile, gentlest first."""
+    rungs = [
+        (dpi, quality)
+        for dpi, quality in TARGET_LADDER
+        if dpi <= base.color_dpi and quality <= base.jpeg_quality
+    ]
+    if not rungs or rungs[0] != (base.color_dpi, base.jpeg_quality):
+        rungs.insert(0, (base.color_dpi, base.jpeg_quality))
+
+    return [
+        replace(
+            base,
+            name=f"{base.name}@{dpi}dpi-q{quality}",
+            color_dpi=dpi,
+            gray_dpi=dpi,
+            jpeg_quality=quality,
+        )
+        for dpi, quality in rungs
+    ]
+
+
+def _spread(low: int, high: int, count: int) -> list[int]:
+    """Up to count indices evenly spread over the open interval (low, high)."""
+    span = high - low - 1
+    if span <= 0:
+        return []
+    count = min(count, span)
+    return sorted({low + round((i + 1) * (span + 1) / (count + 1)) for i in range(count)})
+
+
+class TargetSizeService:
+    @staticmethod
+    async def compress_to_target(
+        input_path: str, output_path: str, target_bytes: int, base: CompressionProfile
+    ) -> TargetSizeResult | None:
+        """
+        Write the gentlest candidate that fits target_bytes to output_path.
+        When none fits, the smallest output is written instead (met=False).
+        Returns None when every trial failed.
+        """
+        image_bytes = await asyncio.to_thread(image_stream_bytes, input_path)
+        ladder = build_ladder(base)
+        if image_bytes == 0:
+            # Without images every rung produces the same file
+            ladder = ladder[:1]
+
+        sizes: dict[int, int | None] = {}
+        paths = {index: f"{output_path}.try{index}" for index in range(len(ladder))}
+        work = await asyncio.to_thread(pdf_work, input_path)
+
+        async def trial(index: int):
+            ok = await PDFService.compress_pdf(
+                input_path, paths[index], profile=ladder[index], work=work
+            )
+            sizes[index] = os.path.getsize(paths[index]) if ok and os.path.exists(paths[index]) else None
+
+        # Largest index known too big / smallest index known to fit
+        too_big, fits = -1, len(ladder)
+        parallel = max(1, TARGET_SIZE_PARALLEL)
+        try:
+            # First round: the gentlest rung (often fits already) and the
+            # harshest (tells early whether the target is reachable at all)
+            pending = sorted({0, len(ladder) - 1}) if parallel > 1 else [0]
+
+            while pending and len(sizes) < TARGET_SIZE_MAX_TRIALS:
+                pending = pending[: TARGET_SIZE_MAX_TRIALS - len(sizes)]
+                await asyncio.gather(*(trial(index) for index in pending))
+
+                for index in pending:
+                    size = sizes[index]
+                    if size is None:
+                        continue
+                    if size <= target_bytes:
+                        fits = min(fits, index)
+                    else:
+                        too_big = max(too_big, index)
+
+                if too_big >= len(ladder) - 1:
+                    break  # even the harshest rung is too big
+                if fits < len(ladder) and sizes[fits] >= target_bytes * TARGET_SIZE_TOLERANCE:
+                    break  # close enough to the target, not worth more trials
+                pending = [index for index in _spread(too_big, fits, parallel) if index not in sizes]
+
+            done = {index: size for index, size in sizes.items() if size is not None}
+            if not done:
+                return None
+
+            fitting = [index for index, size in done.items() if size <= target_bytes]
+            if fitting:
+                chosen, met = min(fitting), True
+            else:
+                chosen, met = min(done, key=done.get), False
+
+            os.replace(paths[chosen], output_path)
+            logger.info(
+                f"Target {target_bytes / 1024:.0f} KB {'met' if met else 'not met'} with "
+                f"{ladder[chosen].name}: {done[chosen] / 1024:.0f} KB after {len(sizes)} trials "
+                f"(images {image_bytes / 1024:.0f} KB)"
+            )
+            return TargetSizeResult(ladder[chosen], done[chosen], met, len(sizes))
+        finally:
+            for path in paths.values():
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,137 @@
+"""
+Adaptive engine timeouts and the retry policy.
+
+Instead of one PROCESS_TIMEOUT for everything, an engine run gets a timeout
+predicted from its input (bytes, pages, slides, images, raster DPI) and from
+how fast runs of the same kind have actually been in this worker: the
+ENGINE_TIMEOUT_PERCENTILE of observed seconds per work unit, times
+ENGINE_TIMEOUT_MULTIPLIER headroom, clamped to [MIN, MAX]. Until enough runs
+have been seen, conservative built-in rates are used. A tiny PDF that hangs
+gives its slot back in seconds; a 1,500-page compression is not cut off at
+five minutes.
+
+A run that times out or is stopped by a resource limit is retried once
+(ENGINE_RETRY) when a safer variant of its command exists, e.g. Ghostscript
+without -dNOGC. Timed-out runs are recorded in the history too, at no less
+than their timeout.
+"""
+
+import os
+import logging
+from collections import deque
+from dataclasses import dataclass
+
+import pikepdf
+
+logger = logging.getLogger(__name__)
+
+ENGINE_TIMEOUT_MIN_SECONDS = int(os.getenv("ENGINE_TIMEOUT_MIN_SECONDS", "20"))
+ENGINE_TIMEOUT_MAX_SECONDS = int(os.getenv("ENGINE_TIMEOUT_MAX_SECONDS", "1800"))
+ENGINE_TIMEOUT_MULTIPLIER = float(os.getenv("ENGINE_TIMEOUT_MULTIPLIER", "3"))
+ENGINE_TIMEOUT_PERCENTILE = float(os.getenv("ENGINE_TIMEOUT_PERCENTILE", "95"))
+ENGINE_RUNTIME_HISTORY = int(os.getenv("ENGINE_RUNTIME_HISTORY", "200"))
+ENGINE_RETRY = os.getenv("ENGINE_RETRY", "1").strip().lower() in ("1", "true", "yes", "on")
+
+# Observed rates replace the defaults once this many runs were recorded
+_MIN_SAMPLES = 20
+_MB = 1024 * 1024
+
+# Fixed start-up cost and default seconds per work unit, per run kind
+_STARTUP_SECONDS = {"gs-pdfwrite": 1.0, "gs-raster": 0.5, "soffice": 6.0}
+_DEFAULT_SECONDS_PER_UNIT = {"gs-pdfwrite": 0.5, "gs-raster": 0.5, "soffice": 1.0}
+_FALLBACK_STARTUP_SECONDS = 2.0
+_FALLBACK_SECONDS_PER_UNIT = 1.0
+
+
+@dataclass(frozen=True)
+class WorkEstimate:
+    """What an engine run has to chew through; kind separates runtime histories."""
+
+    kind: str
+    bytes: int = 0
+    pages: int = 0
+    slides: int = 0
+    images: int = 0
+    dpi: int = 0
+
+    @property
+    def units(self) -> float:
+        # Raster output cost grows with the pixel count per page
+        page_weight = 0.25 * (self.dpi / 150) ** 2 if self.dpi else 0.25
+        return (
+            self.bytes / _MB
+            + self.pages * page_weight
+            + self.slides
+            + self.images * 0.5
+        )
+
+
+def pdf_work(input_path: str, kind: str = "gs-pdfwrite") -> WorkEstimate:
+    """Size, page count and distinct images of a PDF (pages' direct resources only)."""
+    size = os.path.getsize(input_path)
+    try:
+        with pikepdf.open(input_path) as pdf:
+            images = set()
+            for page in pdf.pages:
+                xobjects = (page.obj.get("/Resources") or {}).get("/XObject") or {}
+                for name in xobjects.keys():
+                    xobject = xobjects[name]
+                    if (
+                        isinstance(xobject, pikepdf.Stream)
+                        and xobject.get("/Subtype") == pikepdf.Name.Image
+                    ):
+                        images.add(xobject.objgen)
+            return WorkEstimate(kind=kind, bytes=size, pages=len(pdf.pages), images=len(images))
+    except Exception as e:
+        # Unreadable here does not mean Ghostscript cannot repair it
+        logger.debug(f"PDF work estimate from size only: {e}")
+        return WorkEstimate(kind=kind, bytes=size)
+
+
+class RuntimeHistory:
+    """Recent seconds-per-unit samples per run kind (per worker, in memory)."""
+
+    def __init__(self, size: int = ENGINE_RUNTIME_HISTORY):
+        self.size = size
+        self._samples: dict[str, deque[float]] = {}
+
+    def record(self, work: WorkEstimate, seconds: float):
+        startup = _STARTUP_SECONDS.get(work.kind, _FALLBACK_STARTUP_SECONDS)
+        rate = max(0.0, seconds - startup) / max(work.units, 0.1)
+        self._samples.setdefault(work.kind, deque(maxlen=self.size)).append(rate)
+
+    def rate(self, kind: str) -> float:
+        default = _DEFAULT_SECONDS_PER_UNIT.get(kind, _FALLBACK_SECONDS_PER_UNIT)
+        samples = self._samples.get(kind)
+        if not samples or len(samples) < _MIN_SAMPLES:
+            return default
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * ENGINE_TIMEOUT_PERCENTILE / 100))
+        return ordered[index]
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            kind: {"samples": len(samples), "seconds_per_unit": round(self.rate(kind), 4)}
+            for kind, samples in self._samples.items()
+        }
+
+
+history = RuntimeHistory()
+
+
+def timeout_for(work: WorkEstimate) -> int:
+    startup = _STARTUP_SECONDS.get(work.kind, _FALLBACK_STARTUP_SECONDS)
+    predicted = startup + work.units * history.rate(work.kind)
+    timeout = predicted * ENGINE_TIMEOUT_MULTIPLIER
+    return int(min(ENGINE_TIMEOUT_MAX_SECONDS, max(ENGINE_TIMEOUT_MIN_SECONDS, timeout)))
+
+
+def safer_command(command: list) -> list | None:
+    """
+    A more conservative variant of command for a single retry, or None.
+    Ghostscript: garbage collection back on (-dNOGC trades memory for speed
+    and is the usual culprit when large files exhaust memory).
+    """
+    if os.path.basename(command[0]) == "gs" and "-dNOGC" in command:
+        return [arg for arg in command if arg != "-dNOGC"]
+    return None
@@ -0,0 +1,279 @@
+"""
+Resumable uploads: large files arrive as numbered chunks that can be retried
+or resumed individually instead of re-sending the whole multipart body.
+
+A session is a directory under UPLOAD_SESSION_DIR holding the data file
+(pre-sized to the declared length, chunks are written at their offset) and
+a meta.json with the chunks received so far. Everything is on disk and
+updated under a file lock, so any worker can take any chunk. When the
+upload is complete the data file is moved (not copied) into the job's
+upload path.
+
+Chunk writers hold a shared lock on the data file while writing, and
+completion takes it exclusively, so the whole-file checksum never reads a
+chunk that is half rewritten and no chunk lands after completion. The meta
+lock is only held for the short metadata updates. All locks block, so the
+async callers run these calls in a thread.
+"""
+
+import os
+import re
+import json
+import asyncio
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(UPLOAD_DIR, "sessions"))
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", "86400"))
+UPLOAD_CHUNK_SIZE_MB = int(os.getenv("UPLOAD_CHUNK_SIZE_MB", "8"))
+
+_SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+_PURGE_INTERVAL = 300
+_last_purge = 0.0
+
+
+class UploadSessionError(ValueError):
+    """Raised for an unknown, expired or inconsistent upload session."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _session_dir(upload_id: str) -> str:
+    if not _SESSION_ID_PATTERN.match(upload_id or ""):
+        raise UploadSessionError("Upload session not found", 404)
+    return os.path.join(UPLOAD_SESSION_DIR, upload_id)
+
+
+def _open_locked_data(upload_id: str, mode: int) -> int:
+    """
+    Descriptor of the session's data file holding a lock (LOCK_SH to write
+    chunks, LOCK_EX to complete); closing it releases the lock.
+    """
+    data_path = os.path.join(_session_dir(upload_id), "data")
+    try:
+        fd = os.open(data_path, os.O_WRONLY if mode == fcntl.LOCK_SH else os.O_RDONLY)
+    except FileNotFoundError:
+        raise UploadSessionError("Upload session not found", 404)
+    try:
+        fcntl.flock(fd, mode)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+@contextmanager
+def _locked_meta(upload_id: str):
+    """Yield the session metadata under an exclusive lock; changes are saved on exit."""
+    session_dir = _session_dir(upload_id)
+    meta_path = os.path.join(session_dir, "meta.json")
+    try:
+        handle = open(meta_path, "r+", encoding="utf-8")
+    except FileNotFoundError:
+        raise UploadSessionError("Upload session not found", 404)
+
+    with handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        meta = json.load(handle)
+        if meta["expires_at"] < time.time():
+            raise UploadSessionError("Upload session expired", 410)
+
+        before = json.dumps(meta, sort_keys=True)
+        yield meta, os.path.join(session_dir, "data")
+        if json.dumps(meta, sort_keys=True) != before:
+            handle.seek(0)
+            json.dump(meta, handle)
+            handle.truncate()
+
+
+def _missing(meta: dict) -> list[int]:
+    received = meta["received"]
+    return [index for index in range(meta["total_chunks"]) if str(index) not in received]
+
+
+def _status(upload_id: str, meta: dict) -> dict:
+    missing = _missing(meta)
+    return {
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "chunk_size": meta["chunk_size"],
+        "total_chunks": meta["total_chunks"],
+        "received_chunks": meta["total_chunks"] - len(missing),
+        "missing_chunks": missing,
+        "complete": meta["complete"],
+        "expires_at": meta["expires_at"],
+    }
+
+
+class UploadSessionService:
+    @staticmethod
+    def create(filename: str, size: int, sha256: str | None = None) -> dict:
+        UploadSessionService.purge_expired()
+
+        upload_id = uuid.uuid4().hex
+        session_dir = os.path.join(UPLOAD_SESSION_DIR, upload_id)
+        os.makedirs(session_dir)
+
+        chunk_size = UPLOAD_CHUNK_SIZE_MB * 1024 * 1024
+        meta = {
+            "filename": filename,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "chunk_size": chunk_size,
+            "total_chunks": max(1, -(-size // chunk_size)),
+            "received": {},
+            "complete": False,
+            "expires_at": time.time() + UPLOAD_SESSION_TTL_SECONDS,
+        }
+
+        # Sparse file of the final size; chunks land at their own offset
+        with open(os.path.join(session_dir, "data"), "wb") as f:
+            f.truncate(size)
+        with open(os.path.join(session_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        logger.info(f"Upload session {upload_id} created: {size} bytes in {meta['total_chunks']} chunks")
+        return _status(upload_id, meta)
+
+    @staticmethod
+    def status(upload_id: str) -> dict:
+        with _locked_meta(upload_id) as (meta, _):
+            return _status(upload_id, meta)
+
+    @staticmethod
+    def chunk_range(upload_id: str, index: int) -> tuple[int, int]:
+        """(offset, length) a chunk must have."""
+        with _locked_meta(upload_id) as (meta, _):
+            if meta["complete"]:
+                raise UploadSessionError("Upload already completed", 409)
+            if not 0 <= index < meta["total_chunks"]:
+                raise UploadSessionError(f"Chunk index must be between 0 and {meta['total_chunks'] - 1}")
+            offset = index * meta["chunk_size"]
+            return offset, min(meta["chunk_size"], meta["size"] - offset)
+
+    @staticmethod
+    def _record_chunk(upload_id: str, index: int, chunk_sha256: str) -> dict:
+        with _locked_meta(upload_id) as (meta, _):
+            if meta["complete"]:
+                raise UploadSessionError("Upload already completed", 409)
+            meta["received"][str(index)] = chunk_sha256
+            return _status(upload_id, meta)
+
+    @staticmethod
+    async def write_chunk(
+        upload_id: str, index: int, body: AsyncIterator[bytes], expected_sha256: str | None
+    ) -> dict:
+        """
+        Stream a chunk body straight to its offset in the data file, hashing
+        as it goes. The chunk is only recorded once length and checksum match.
+        """
+        fd = await asyncio.to_thread(_open_locked_data, upload_id, fcntl.LOCK_SH)
+        try:
+            # Checked with the data lock held: completion cannot start until this chunk is done
+            offset, length = await asyncio.to_thread(UploadSessionService.chunk_range, upload_id, index)
+
+            digest = hashlib.sha256()
+            written = 0
+            async for part in body:
+                if not part:
+                    continue
+                if written + len(part) > length:
+                    raise UploadSessionError(f"Chunk {index} must be {length} bytes", 413)
+                os.pwrite(fd, part, offset + written)
+                digest.update(part)
+                written += len(part)
+
+            if written != length:
+                raise UploadSessionError(f"Chunk {index} must be {length} bytes, got {written}")
+            chunk_sha256 = digest.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != chunk_sha256:
+                raise UploadSessionError(f"Checksum mismatch for chunk {index}", 422)
+
+            return await asyncio.to_thread(
+                UploadSessionService._record_chunk, upload_id, index, chunk_sha256
+            )
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def complete(upload_id: str) -> dict:
+        """Check every chunk arrived (and the whole-file checksum, if one was declared)."""
+        with _locked_meta(upload_id) as (meta, _):
+            if meta["complete"]:
+                return _status(upload_id, meta)
+            missing = _missing(meta)
+            if missing:
+                raise UploadSessionError(f"{len(missing)} chunks are missing", 409)
+            declared_sha256 = meta["sha256"]
+
+        # Hashed outside the meta lock (status and other chunks stay responsive);
+        # the exclusive data lock waits for chunk writes in flight and holds off new ones
+        with os.fdopen(_open_locked_data(upload_id, fcntl.LOCK_EX), "rb") as f:
+            if declared_sha256:
+                file_sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+                if file_sha256 != declared_sha256:
+                    # Chunks were individually valid, so the declared checksum is for other data
+                    raise UploadSessionError("File checksum mismatch", 422)
+
+            with _locked_meta(upload_id) as (meta, _):
+                meta["complete"] = True
+                return _status(upload_id, meta)
+
+    @staticmethod
+    def claim(upload_id: str, destination: str) -> tuple[str, int]:
+        """
+        Move a completed upload to destination and end the session.
+        Returns (original filename, size).
+        """
+        with _locked_meta(upload_id) as (meta, data_path):
+            if not meta["complete"]:
+                raise UploadSessionError("Upload is not completed", 409)
+            os.replace(data_path, destination)
+            filename, size = meta["filename"], meta["size"]
+
+        shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+        return filename, size
+
+    @staticmethod
+    def abort(upload_id: str):
+        with _locked_meta(upload_id):
+            pass
+        shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+
+    @staticmethod
+    def purge_expired(force: bool = False):
+        """Remove expired sessions (at most every few minutes unless forced)."""
+        global _last_purge
+        now = time.time()
+        if not force and now - _last_purge < _PURGE_INTERVAL:
+            return
+        _last_purge = now
+
+        if not os.path.isdir(UPLOAD_SESSION_DIR):
+            return
+        for upload_id in os.listdir(UPLOAD_SESSION_DIR):
+            meta_path = os.path.join(UPLOAD_SESSION_DIR, upload_id, "meta.json")
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    expired = json.load(f)["expires_at"] < now
+            except (OSError, json.JSONDecodeError, KeyError):
+                # Half-created or broken session: drop it once it is old enough
+                try:
+                    expired = os.path.getmtime(os.path.join(UPLOAD_SESSION_DIR, upload_id)) < now - 3600
+                except OSError:
+                    expired = False
+            if expired:
+                shutil.rmtree(os.path.join(UPLOAD_SESSION_DIR, upload_id), ignore_errors=True)
+                logger.info(f"Upload session {upload_id} expired")
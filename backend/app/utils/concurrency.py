@@ -0,0 +1,78 @@
+"""
+Named concurrency slots for the processing engines (Ghostscript, LibreOffice, ...).
+
+Each slot is an asyncio semaphore that also tracks how many jobs are running
+and how many are waiting, so handlers can route work and health checks can
+report capacity without touching the engines themselves.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from app.utils.tracing import span
+
+
+class EngineSlot:
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.in_use = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(self.capacity)
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            # Queueing for an engine is a common source of tail latency
+            with span(f"wait {self.name}", **{"slot.queued": self.waiting - 1}):
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "free": max(0, self.capacity - self.in_use),
+            "waiting": self.waiting,
+        }
+
+
+_SLOTS: dict[str, EngineSlot] = {}
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (its affinity mask, e.g. a container's cpuset), at least 1."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def _env_name(name: str) -> str:
+    return name.upper().replace("-", "_") + "_SLOTS"
+
+
+def get_slot(name: str, default_capacity: int = 1) -> EngineSlot:
+    """
+    Return the process-wide slot for name, creating it on first use.
+    Capacity can be overridden with <NAME>_SLOTS, e.g. OFFICE_HEAVY_SLOTS=2.
+    """
+    slot = _SLOTS.get(name)
+    if slot is None:
+        capacity = int(os.getenv(_env_name(name), str(default_capacity)))
+        slot = EngineSlot(name, capacity)
+        _SLOTS[name] = slot
+    return slot
+
+
+def slots_snapshot() -> dict[str, dict]:
+    return {name: slot.snapshot() for name, slot in _SLOTS.items()}
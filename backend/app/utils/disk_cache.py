@@ -0,0 +1,68 @@
+"""
+Size-bounded on-disk caches (rendered pages, OCR text layers, background masks).
+
+Entries are plain files; readers touch them with os.utime on a hit, so the
+mtime is the last use and pruning drops the least recently used first.
+A file handed out of a cache is linked into the caller's own directory
+first (link_or_copy), so a concurrent prune cannot remove it mid-use.
+"""
+
+import os
+import uuid
+import shutil
+
+
+def link_or_copy(source: str, target: str):
+    """Hard link (same filesystem), else copy. A source pruned meanwhile raises FileNotFoundError."""
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def publish(source: str, target: str):
+    """
+    Add source to a cache as target (hard link when possible). Goes through a
+    temporary name, so readers never see a partial entry; source is untouched.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+    try:
+        link_or_copy(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def prune_cache(max_bytes: int, cache_dir: str):
+    """Drop least recently used files until the cache fits its byte budget."""
+    entries = []
+    total = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    if total <= max_bytes:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
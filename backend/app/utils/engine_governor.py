@@ -0,0 +1,238 @@
+"""
+Resource governance and accounting for engine processes (gs, soffice, tesseract).
+
+Every engine run goes through app/utils/engine_sandbox.py, which applies the
+configured limits (memory, CPU time, processes, output file size, nice,
+ionice) before exec'ing the engine and reports the CPU seconds and peak RSS
+it actually used. Usage is added to the current job (see track_job_usage),
+so a request's total engine cost can be logged, returned and billed.
+
+Limits are read per engine from <ENGINE>_<SETTING> with ENGINE_<SETTING> as
+the fallback, e.g. GS_MEMORY_LIMIT_MB=2048, ENGINE_NICE=5. The engine name
+is the executable's base name (soffice is configured as LIBREOFFICE).
+"""
+
+import os
+import sys
+import json
+import signal
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+ENGINE_SANDBOX = os.getenv("ENGINE_SANDBOX", "1").strip().lower() in ("1", "true", "yes", "on")
+ENGINE_CGROUP_DIR = os.getenv("ENGINE_CGROUP_DIR", "")
+
+_SANDBOX_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine_sandbox.py")
+_ENGINE_ALIASES = {"soffice": "libreoffice"}
+# Address-space caps are safe for gs and tesseract; LibreOffice reserves far
+# more virtual memory than it uses, so it is only capped through a cgroup
+_DEFAULT_MEMORY_LIMIT_MB = {"gs": 2048, "tesseract": 1024}
+_IONICE_CLASSES = ("", "best-effort", "idle")
+
+
+@dataclass(frozen=True)
+class EngineLimits:
+    memory_mb: int = 0
+    cpu_seconds: int = 0
+    max_processes: int = 0
+    file_size_mb: int = 0
+    nice: int = 0
+    ionice: str = ""
+
+    def to_sandbox(self) -> dict:
+        return {
+            "memory_bytes": self.memory_mb * 1024 * 1024,
+            "cpu_seconds": self.cpu_seconds,
+            "max_processes": self.max_processes,
+            "file_size_bytes": self.file_size_mb * 1024 * 1024,
+            "nice": self.nice,
+            "ionice": self.ionice,
+            "cgroup_dir": ENGINE_CGROUP_DIR,
+        }
+
+
+def _engine_name(executable: str) -> str:
+    name = os.path.basename(executable)
+    return _ENGINE_ALIASES.get(name, name)
+
+
+def _setting(engine: str, key: str, default: str) -> str:
+    prefix = engine.upper().replace("-", "_")
+    return os.getenv(f"{prefix}_{key}") or os.getenv(f"ENGINE_{key}") or default
+
+
+@lru_cache(maxsize=None)
+def engine_limits(executable: str) -> EngineLimits:
+    engine = _engine_name(executable)
+    ionice = _setting(engine, "IONICE_CLASS", "").strip().lower()
+    if ionice not in _IONICE_CLASSES:
+        logger.warning(f"Unknown ionice class {ionice!r} for {engine}, ignoring")
+        ionice = ""
+    return EngineLimits(
+        memory_mb=int(_setting(engine, "MEMORY_LIMIT_MB", str(_DEFAULT_MEMORY_LIMIT_MB.get(engine, 0)))),
+        cpu_seconds=int(_setting(engine, "CPU_LIMIT_SECONDS", "0")),
+        max_processes=int(_setting(engine, "MAX_PROCESSES", "0")),
+        file_size_mb=int(_setting(engine, "FILE_SIZE_LIMIT_MB", "0")),
+        nice=int(_setting(engine, "NICE", "0")),
+        ionice=ionice,
+    )
+
+
+@dataclass
+class ProcessUsage:
+    cpu_user: float
+    cpu_system: float
+    max_rss_bytes: int
+    exit_code: int
+    cgroup_cpu_seconds: float | None = None
+    cgroup_memory_peak_bytes: int | None = None
+    oom_killed: bool = False
+
+    @property
+    def cpu_seconds(self) -> float:
+        # The cgroup also counts helpers that were never reaped by the engine
+        if self.cgroup_cpu_seconds is not None:
+            return self.cgroup_cpu_seconds
+        return self.cpu_user + self.cpu_system
+
+    @property
+    def peak_memory_bytes(self) -> int:
+        return max(self.max_rss_bytes, self.cgroup_memory_peak_bytes or 0)
+
+    @property
+    def limit_hit(self) -> str | None:
+        if self.oom_killed:
+            return "memory"
+        if self.exit_code == -signal.SIGXCPU:
+            return "cpu"
+        if self.exit_code == -signal.SIGXFSZ:
+            return "file_size"
+        return None
+
+
+@dataclass
+class JobUsage:
+    processes: int = 0
+    cpu_seconds: float = 0.0
+    peak_memory_bytes: int = 0
+
+    def add(self, usage: ProcessUsage):
+        self.processes += 1
+        self.cpu_seconds += usage.cpu_seconds
+        self.peak_memory_bytes = max(self.peak_memory_bytes, usage.peak_memory_bytes)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+_job_usage: contextvars.ContextVar[JobUsage | None] = contextvars.ContextVar(
+    "job_usage", default=None
+)
+
+
+@contextmanager
+def track_job_usage():
+    """Collect the usage of every engine run started inside the block."""
+    usage = JobUsage()
+    token = _job_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _job_usage.reset(token)
+
+
+def current_job_usage() -> JobUsage | None:
+    return _job_usage.get()
+
+
+class EngineProcess:
+    """One governed engine run: start(), then kill() on timeout, then finish()."""
+
+    def __init__(self, command: list, env: dict | None = None):
+        self.command = command
+        self.env = env
+        self.limits = engine_limits(command[0])
+        self.process: asyncio.subprocess.Process | None = None
+        self._report_fd: int | None = None
+
+    async def start(self) -> asyncio.subprocess.Process:
+        command = self.command
+        pass_fds = ()
+        if ENGINE_SANDBOX:
+            self._report_fd, write_fd = os.pipe()
+            os.set_blocking(self._report_fd, False)
+            command = [
+                sys.executable,
+                "-I",
+                "-S",
+                _SANDBOX_SCRIPT,
+                json.dumps(self.limits.to_sandbox()),
+                str(write_fd),
+                "--",
+                *self.command,
+            ]
+            pass_fds = (write_fd,)
+
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env={**os.environ, **self.env} if self.env else None,
+                pass_fds=pass_fds,
+                # Own process group, so a timeout also kills helpers the engine spawned
+                start_new_session=True,
+            )
+        except BaseException:
+            self._close_report()
+            raise
+        finally:
+            if pass_fds:
+                os.close(pass_fds[0])
+        return self.process
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def finish(self) -> ProcessUsage | None:
+        """Read the sandbox report (after the process exited) and add it to the job."""
+        if self._report_fd is None:
+            return None
+        try:
+            raw = os.read(self._report_fd, 64 * 1024)
+        except BlockingIOError:
+            raw = b""
+        finally:
+            self._close_report()
+        if not raw:
+            return None
+
+        try:
+            usage = ProcessUsage(**json.loads(raw))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Unreadable engine usage report: {e}")
+            return None
+
+        job = _job_usage.get()
+        if job is not None:
+            job.add(usage)
+        if usage.limit_hit:
+            logger.warning(
+                f"{os.path.basename(self.command[0])} stopped by its {usage.limit_hit} limit "
+                f"({self.limits})"
+            )
+        return usage
+
+    def _close_report(self):
+        if self._report_fd is not None:
+            os.close(self._report_fd)
+            self._report_fd = None
@@ -0,0 +1,171 @@
+"""
+Engine sandbox: run one command under resource limits and report what it used.
+
+Executed as a standalone script by app.utils.engine_governor:
+
+    python -I -S engine_sandbox.py LIMITS_JSON REPORT_FD -- command [args...]
+
+Standard library only, so it starts in a few milliseconds. The engine is
+forked with the limits applied and reaped with wait4(), which returns the
+rusage (CPU time, peak RSS) that asyncio's child watcher throws away. A JSON
+report is written to REPORT_FD and the sandbox exits with the engine's
+status (128 + signal number when it was killed by a signal).
+
+With a delegated cgroup v2 directory in LIMITS_JSON["cgroup_dir"], each run
+gets its own child cgroup: memory.max caps real memory (not address space,
+which LibreOffice reserves generously) and memory.peak / cpu.stat also count
+helper processes the engine starts itself.
+"""
+
+import os
+import sys
+import json
+import signal
+import resource
+
+_IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+_IOPRIO_SET_SYSCALL = {"x86_64": 251, "aarch64": 30}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+
+def _set_ioprio(class_name: str, level: int):
+    number = _IOPRIO_SET_SYSCALL.get(os.uname().machine)
+    if number is None or class_name not in _IOPRIO_CLASSES:
+        return
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    value = (_IOPRIO_CLASSES[class_name] << _IOPRIO_CLASS_SHIFT) | level
+    libc.syscall(number, _IOPRIO_WHO_PROCESS, 0, value)
+
+
+def _apply_limits(limits: dict, in_cgroup: bool):
+    memory = limits.get("memory_bytes")
+    if memory and not in_cgroup:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    cpu = limits.get("cpu_seconds")
+    if cpu:
+        # SIGXCPU at the soft limit, SIGKILL a few seconds later if ignored
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+    processes = limits.get("max_processes")
+    if processes and not in_cgroup:
+        resource.setrlimit(resource.RLIMIT_NPROC, (processes, processes))
+    file_size = limits.get("file_size_bytes")
+    if file_size:
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+    if limits.get("nice"):
+        os.nice(limits["nice"])
+    if limits.get("ionice"):
+        _set_ioprio(limits["ionice"], 7 if limits["ionice"] == "best-effort" else 0)
+
+
+def _write(path: str, value: str):
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _cgroup_create(limits: dict) -> str | None:
+    root = limits.get("cgroup_dir")
+    if not root:
+        return None
+    path = os.path.join(root, f"engine-{os.getpid()}")
+    try:
+        os.mkdir(path)
+        if limits.get("memory_bytes"):
+            _write(os.path.join(path, "memory.max"), str(limits["memory_bytes"]))
+            _write(os.path.join(path, "memory.swap.max"), "0")
+        if limits.get("max_processes"):
+            _write(os.path.join(path, "pids.max"), str(limits["max_processes"]))
+        return path
+    except OSError as e:
+        os.write(2, f"engine_sandbox: cgroup unavailable, using rlimits: {e}\n".encode())
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+        return None
+
+
+def _cgroup_finish(path: str) -> dict:
+    stats = {}
+    peak = _read(os.path.join(path, "memory.peak"))
+    if peak and peak.strip().isdigit():
+        stats["cgroup_memory_peak_bytes"] = int(peak)
+    for line in (_read(os.path.join(path, "cpu.stat")) or "").splitlines():
+        key, _, value = line.partition(" ")
+        if key == "usage_usec":
+            stats["cgroup_cpu_seconds"] = int(value) / 1_000_000
+    for line in (_read(os.path.join(path, "memory.events")) or "").splitlines():
+        key, _, value = line.partition(" ")
+        if key == "oom_kill" and int(value) > 0:
+            stats["oom_killed"] = True
+
+    # Helpers the engine left behind would keep the cgroup busy
+    if _read(os.path.join(path, "cgroup.procs")):
+        try:
+            _write(os.path.join(path, "cgroup.kill"), "1")
+        except OSError:
+            pass
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+    return stats
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) < 5 or argv[3] != "--":
+        os.write(2, b"usage: engine_sandbox.py LIMITS_JSON REPORT_FD -- command [args...]\n")
+        return 2
+
+    limits = json.loads(argv[1])
+    report_fd = int(argv[2])
+    command = argv[4:]
+    os.set_inheritable(report_fd, False)
+
+    cgroup = _cgroup_create(limits)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            if cgroup:
+                _write(os.path.join(cgroup, "cgroup.procs"), "0")
+            _apply_limits(limits, cgroup is not None)
+            os.execvp(command[0], command)
+        except BaseException as e:
+            os.write(2, f"engine_sandbox: cannot start {command[0]}: {e}\n".encode())
+        os._exit(127)
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, lambda received, frame: os.kill(pid, received))
+
+    _, status, usage = os.wait4(pid, 0)
+    exit_code = os.waitstatus_to_exitcode(status)
+
+    report = {
+        "cpu_user": usage.ru_utime,
+        "cpu_system": usage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_bytes": usage.ru_maxrss * 1024,
+        "exit_code": exit_code,
+    }
+    if cgroup:
+        report.update(_cgroup_finish(cgroup))
+    try:
+        os.write(report_fd, json.dumps(report).encode())
+    except OSError:
+        pass
+
+    return 128 - exit_code if exit_code < 0 else exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,81 @@
+"""
+Import timing for startup: which third-party packages the app pulls in and
+what each one cost.
+
+    with import_report() as report:
+        from app.main import app
+    report.log()
+
+Times are inclusive and go to the first importer: a package imported as a
+dependency of another counts toward the outer one. Only top-level packages
+that were not loaded yet are timed, so the hook costs nothing measurable.
+"""
+
+import sys
+import time
+import logging
+import builtins
+import resource
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Heavy engines that load on first use; any of them loaded at startup is reported
+WATCHED_PACKAGES = ("rembg", "onnxruntime", "pymatting", "numba", "scipy", "img2pdf", "magic")
+# Other packages are listed from this many milliseconds
+_REPORT_MIN_MS = 20
+
+
+class ImportReport:
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        self.seconds = 0.0
+        self.rss_mb = 0.0
+
+    def log(self):
+        slowest = sorted(self.timings.items(), key=lambda item: item[1], reverse=True)
+        listed = [
+            f"{name} {seconds * 1000:.0f}ms"
+            for name, seconds in slowest
+            if seconds * 1000 >= _REPORT_MIN_MS
+        ]
+        logger.info(
+            f"App imported in {self.seconds:.2f}s, RSS {self.rss_mb:.0f} MB"
+            + (f": {', '.join(listed)}" if listed else "")
+        )
+        loaded = [name for name in WATCHED_PACKAGES if name in sys.modules]
+        if loaded:
+            logger.info(f"Loaded at startup: {', '.join(loaded)}")
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def import_report():
+    """Time top-level imports made inside the block."""
+    report = ImportReport()
+    original_import = builtins.__import__
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        top = name.partition(".")[0]
+        if level or top in sys.modules or top in report.timings:
+            return original_import(name, globals, locals, fromlist, level)
+        # Claimed before importing so nested imports of the same package are not timed twice
+        report.timings[top] = 0.0
+        started = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            report.timings[top] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    builtins.__import__ = timed_import
+    try:
+        yield report
+    finally:
+        builtins.__import__ = original_import
+        report.seconds = time.perf_counter() - started
+        report.rss_mb = _rss_mb()
@@ -0,0 +1,197 @@
+"""
+Streaming multipart/form-data ingest.
+
+FastAPI's File()/UploadFile parameters make Starlette parse the whole body
+into SpooledTemporaryFiles first; endpoints then copy those into UPLOAD_DIR,
+so every uploaded byte is written to disk twice. StreamingFormIngest parses
+the body as it arrives from the ASGI receive channel and writes file parts
+straight to their final path, checking the file signature and size limit
+on the fly. A bad upload is rejected at its first bytes instead of
+after the full body has been spooled.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Callable
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Non-file fields are small option values
+MAX_FIELD_BYTES = 64 * 1024
+MAX_FIELDS = 50
+
+
+class IngestError(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class IngestedFile:
+    field_name: str
+    filename: str
+    path: str
+    size: int = 0
+
+
+@dataclass
+class IngestedForm:
+    fields: dict[str, str] = field(default_factory=dict)
+    files: list[IngestedFile] = field(default_factory=list)
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        value = self.fields.get(name)
+        return value if value not in (None, "") else default
+
+    def get_bool(self, name: str) -> bool:
+        return (self.fields.get(name) or "").strip().lower() in ("1", "true", "yes", "on")
+
+    def remove_files(self):
+        for ingested in self.files:
+            try:
+                os.remove(ingested.path)
+            except FileNotFoundError:
+                pass
+
+
+class _Part:
+    def __init__(self):
+        self.headers: dict[bytes, bytes] = {}
+        self.name = ""
+        self.data = bytearray()
+        self.file: IngestedFile | None = None
+        self.handle = None
+        self.head = b""
+
+
+class StreamingFormIngest:
+    """
+    destination(field_name, filename) returns the path a file part is written
+    to (raise IngestError to refuse it). signature, when given, must prefix
+    every file; max_size applies per file.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        destination: Callable[[str, str], str],
+        max_size: int,
+        signature: bytes | None = None,
+        max_files: int = 1,
+    ):
+        self.request = request
+        self.destination = destination
+        self.max_size = max_size
+        self.signature = signature
+        self.max_files = max_files
+        self.form = IngestedForm()
+        self._part = _Part()
+        self._header_name = b""
+        self._header_value = b""
+
+    # Parser callbacks (synchronous, called from parser.write)
+
+    def _on_part_begin(self):
+        self._part = _Part()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._part.headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._part.headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise IngestError('Content-Disposition must include a field "name"')
+        self._part.name = options[b"name"].decode("utf-8", errors="replace")
+
+        if b"filename" not in options:
+            if len(self.form.fields) >= MAX_FIELDS:
+                raise IngestError("Too many form fields")
+            return
+
+        if len(self.form.files) >= self.max_files:
+            raise IngestError(f"At most {self.max_files} file(s) can be uploaded")
+
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        path = self.destination(self._part.name, filename)
+        ingested = IngestedFile(field_name=self._part.name, filename=filename, path=path)
+        self.form.files.append(ingested)
+        self._part.file = ingested
+        self._part.handle = open(path, "wb", buffering=8 * 1024 * 1024)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        chunk = data[start:end]
+        if part.file is None:
+            if len(part.data) + len(chunk) > MAX_FIELD_BYTES:
+                raise IngestError(f"Form field {part.name} is too large")
+            part.data.extend(chunk)
+            return
+
+        if self.signature and len(part.head) < len(self.signature):
+            part.head += chunk[: len(self.signature) - len(part.head)]
+            if not self.signature.startswith(part.head[: len(self.signature)]):
+                raise IngestError("Invalid file content")
+
+        part.file.size += len(chunk)
+        if part.file.size > self.max_size:
+            raise IngestError("File size exceeds maximum limit", 413)
+        part.handle.write(chunk)
+
+    def _on_part_end(self):
+        part = self._part
+        if part.file is None:
+            self.form.fields[part.name] = part.data.decode("utf-8", errors="replace")
+            return
+
+        part.handle.close()
+        part.handle = None
+        if part.file.size == 0:
+            raise IngestError("Empty file uploaded")
+        if self.signature and part.head != self.signature:
+            raise IngestError("Invalid file content")
+
+    async def parse(self) -> IngestedForm:
+        content_type = self.request.headers.get("content-type", "")
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not content_type.startswith("multipart/form-data") or not boundary:
+            raise IngestError("Expected a multipart/form-data body")
+
+        parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+        try:
+            async for chunk in self.request.stream():
+                parser.write(chunk)
+            parser.finalize()
+            if self._part.handle:
+                # Body ended without the part's closing boundary: a truncated upload
+                raise IngestError("Incomplete multipart body")
+        except Exception as e:
+            if self._part.handle:
+                self._part.handle.close()
+            self.form.remove_files()
+            if isinstance(e, IngestError):
+                raise
+            raise IngestError("Invalid multipart data") from e
+
+        return self.form
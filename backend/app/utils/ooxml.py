@@ -0,0 +1,104 @@
+"""
+Lightweight readers for Office Open XML (DOCX/PPTX) packages.
+
+These helpers read only the parts they need straight from the ZIP container
+with a streaming XML parser, so probing a deck never loads slide bodies or
+media into memory.
+"""
+
+import logging
+import zipfile
+from dataclasses import dataclass
+from xml.etree import ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+# 1 inch = 914400 EMU, 1 point = 1/72 inch -> 1 point = 12700 EMU
+EMU_PER_POINT = 12700.0
+
+PML_NS = "http://schemas.openxmlformats.org/presentationml/2006/main"
+
+PPTX_PRESENTATION_PART = "ppt/presentation.xml"
+PPTX_MEDIA_PREFIX = "ppt/media/"
+
+
+@dataclass(frozen=True)
+class PptxProbe:
+    """Summary of a PPTX package read without rendering any slide."""
+
+    slide_width_pts: float | None
+    slide_height_pts: float | None
+    slide_count: int
+    media_count: int
+    media_bytes: int
+
+    @property
+    def slide_size(self) -> tuple[float, float] | None:
+        if self.slide_width_pts is None or self.slide_height_pts is None:
+            return None
+        return (self.slide_width_pts, self.slide_height_pts)
+
+
+def _qname(ns: str, tag: str) -> str:
+    return f"{{{ns}}}{tag}"
+
+
+def media_totals(zf: zipfile.ZipFile, prefix: str) -> tuple[int, int]:
+    """Count media parts under prefix and sum their uncompressed sizes from the central directory."""
+    count = 0
+    total = 0
+    for info in zf.infolist():
+        if info.filename.startswith(prefix) and not info.is_dir():
+            count += 1
+            total += info.file_size
+    return count, total
+
+
+def read_presentation_part(zf: zipfile.ZipFile) -> tuple[tuple[float, float] | None, int]:
+    """
+    Stream ppt/presentation.xml and return ((width_pts, height_pts) or None, slide_count).
+
+    Parsing stops as soon as the slide size element is seen; it follows the
+    slide id list in the schema, so every slide has been counted by then.
+    """
+    sld_sz = _qname(PML_NS, "sldSz")
+    sld_id = _qname(PML_NS, "sldId")
+
+    slide_size = None
+    slide_count = 0
+    with zf.open(PPTX_PRESENTATION_PART) as part:
+        for _, elem in ET.iterparse(part, events=("start",)):
+            if elem.tag == sld_id:
+                slide_count += 1
+            elif elem.tag == sld_sz:
+                cx = elem.get("cx")
+                cy = elem.get("cy")
+                if cx and cy:
+                    slide_size = (int(cx) / EMU_PER_POINT, int(cy) / EMU_PER_POINT)
+                break
+    return slide_size, slide_count
+
+
+def probe_pptx(input_path: str) -> PptxProbe | None:
+    """
+    Read slide size, slide count and media totals from a PPTX package.
+
+    Only ppt/presentation.xml is parsed; media totals come from the ZIP
+    central directory. Returns None if the file is not a readable PPTX package.
+    """
+    try:
+        with zipfile.ZipFile(input_path) as zf:
+            media_count, media_bytes = media_totals(zf, PPTX_MEDIA_PREFIX)
+            slide_size, slide_count = read_presentation_part(zf)
+
+        return PptxProbe(
+            slide_width_pts=slide_size[0] if slide_size else None,
+            slide_height_pts=slide_size[1] if slide_size else None,
+            slide_count=slide_count,
+            media_count=media_count,
+            media_bytes=media_bytes,
+        )
+
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, ValueError) as e:
+        logger.warning(f"Cannot probe PPTX package {input_path}: {e}")
+        return None
@@ -0,0 +1,115 @@
+"""
+Stream output produced by writers (pikepdf, zipfile) as an async byte iterator.
+"""
+
+import io
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Writers block while the client is slow, so they get their own threads: on the
+# default executor enough concurrent downloads would starve every to_thread call
+STREAM_WRITER_THREADS = int(os.getenv("STREAM_WRITER_THREADS", "32"))
+# Chunks buffered between the writer thread and the response (bounds memory)
+_STREAM_QUEUE_CHUNKS = 8
+_END = object()
+
+_writers = ThreadPoolExecutor(max_workers=STREAM_WRITER_THREADS, thread_name_prefix="stream-writer")
+
+
+class _QueueWriter(io.RawIOBase):
+    """
+    Write-only stream that hands chunks to the response's asyncio queue.
+    A semaphore bounds the chunks in flight; only the writer thread waits on it.
+    """
+
+    def __init__(self, put: Callable[[object], None], slots: threading.Semaphore, cancelled: threading.Event):
+        self._put = put
+        self._slots = slots
+        self._cancelled = cancelled
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.send(bytes(data))
+        return len(data)
+
+    def send(self, item):
+        while not self._slots.acquire(timeout=1):
+            if self._cancelled.is_set():
+                raise BrokenPipeError("Client disconnected")
+        if self._cancelled.is_set():
+            raise BrokenPipeError("Client disconnected")
+        self._put(item)
+
+
+async def stream_writer(write: Callable[[io.BufferedIOBase], None], on_close: Callable[[], None]) -> AsyncIterator[bytes]:
+    """
+    Run write(stream) in a writer thread and yield what it writes.
+    on_close runs once the writer has finished, whether it succeeded, failed
+    or the client went away.
+    """
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(_STREAM_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    raw = _QueueWriter(lambda item: loop.call_soon_threadsafe(chunks.put_nowait, item), slots, cancelled)
+
+    def run():
+        try:
+            buffered = io.BufferedWriter(raw, STREAM_CHUNK_SIZE)
+            write(buffered)
+            buffered.flush()
+            raw.send(_END)
+        except Exception as e:
+            if not cancelled.is_set():
+                logger.error(f"Streaming output failed: {e}", exc_info=True)
+                try:
+                    raw.send(e)
+                except BrokenPipeError:
+                    pass
+        finally:
+            on_close()
+
+    worker = loop.run_in_executor(_writers, run)
+    try:
+        while True:
+            item = await chunks.get()
+            slots.release()
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        await worker
+
+
+class ChunkBuffer(io.RawIOBase):
+    """
+    Write-only stream collecting what a writer (e.g. zipfile) produces, for
+    async generators that yield the output piece by piece with drain().
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
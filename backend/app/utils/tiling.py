@@ -0,0 +1,131 @@
+"""
+Work on very large images one horizontal strip at a time.
+
+A 100 MP scan is 300 MB as 8-bit RGB, and every full-frame working copy
+(float arrays, an RGBA cutout, the encoder's own buffer) adds as much again.
+Strip-wise code keeps only the decoded source plus IMAGE_TILE_ROWS rows of
+working data, and PngStripWriter encodes those rows as they are produced,
+so peak memory grows with the strip, not with a second copy of the frame.
+"""
+
+import os
+import zlib
+import struct
+from typing import BinaryIO, Iterator
+
+import numpy as np
+
+IMAGE_TILE_ROWS = int(os.getenv("IMAGE_TILE_ROWS", "256"))
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG color type and channel count per Pillow mode
+_PNG_MODES = {"L": (0, 1), "RGB": (2, 3), "RGBA": (6, 4)}
+# zlib output is gathered into IDAT chunks of about this size
+_IDAT_CHUNK = 256 * 1024
+_FILTER_TYPES = (0, 1, 2, 4)
+# Rows filtered per numpy pass (bounds the int16 temporaries)
+_FILTER_ROWS = 32
+# abs() of a residual byte read as signed, the usual filter selection heuristic
+_SIGNED_COST = np.abs(np.arange(256, dtype=np.uint8).view(np.int8).astype(np.int16)).astype(np.uint8)
+
+
+def iter_strips(height: int, rows: int = IMAGE_TILE_ROWS) -> Iterator[tuple[int, int]]:
+    """(top, bottom) row ranges covering height, rows at a time."""
+    rows = max(1, rows)
+    for top in range(0, height, rows):
+        yield top, min(height, top + rows)
+
+
+def _filter_rows(raw: np.ndarray, previous: np.ndarray, channels: int) -> np.ndarray:
+    """
+    PNG-filtered rows (filter type byte first) for a block of rows; previous
+    is the row above the block. Like libpng, each row takes the filter
+    (None, Sub, Up, Paeth) with the smallest sum of absolute signed residuals.
+    """
+    up = np.vstack((previous[np.newaxis], raw[:-1]))
+    left = np.zeros_like(raw)
+    left[:, channels:] = raw[:, :-channels]
+    up_left = np.zeros_like(raw)
+    up_left[:, channels:] = up[:, :-channels]
+
+    estimate = left.astype(np.int16) + up - up_left
+    dist_left = np.abs(estimate - left)
+    dist_up = np.abs(estimate - up)
+    dist_up_left = np.abs(estimate - up_left)
+    del estimate
+    paeth = np.where(
+        (dist_left <= dist_up) & (dist_left <= dist_up_left),
+        left,
+        np.where(dist_up <= dist_up_left, up, up_left),
+    )
+    del dist_left, dist_up, dist_up_left
+
+    # uint8 arithmetic wraps around, which is exactly PNG's modulo-256 residual
+    candidates = (raw, raw - left, raw - up, raw - paeth)
+    cost = np.stack([_SIGNED_COST[c].sum(axis=1, dtype=np.uint32) for c in candidates])
+    choice = cost.argmin(axis=0)
+    filtered = np.empty((len(raw), raw.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = np.array(_FILTER_TYPES, dtype=np.uint8)[choice]
+    for index, candidate in enumerate(candidates):
+        selected = choice == index
+        filtered[selected, 1:] = candidate[selected]
+    return filtered
+
+
+class PngStripWriter:
+    """
+    8-bit PNG encoder fed top to bottom with blocks of rows (uint8 arrays of
+    shape (rows, width) for "L", (rows, width, channels) otherwise).
+    """
+
+    def __init__(self, out: BinaryIO, size: tuple[int, int], mode: str, compress_level: int = 6):
+        if mode not in _PNG_MODES:
+            raise ValueError(f"Unsupported PNG mode: {mode}")
+        self._out = out
+        self._width, self._height = size
+        color_type, self._channels = _PNG_MODES[mode]
+        # Z_FILTERED suits filtered rows (as in libpng)
+        self._compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 15, 8, zlib.Z_FILTERED)
+        self._previous = np.zeros(self._width * self._channels, dtype=np.uint8)
+        self._pending: list[bytes] = []
+        self._pending_size = 0
+        self._rows = 0
+
+        out.write(_PNG_SIGNATURE)
+        self._chunk(
+            b"IHDR", struct.pack(">IIBBBBB", self._width, self._height, 8, color_type, 0, 0, 0)
+        )
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self._out.write(struct.pack(">I", len(data)))
+        self._out.write(kind)
+        self._out.write(data)
+        self._out.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def _emit(self, data: bytes, final: bool = False):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending and (final or self._pending_size >= _IDAT_CHUNK):
+            self._chunk(b"IDAT", b"".join(self._pending))
+            self._pending, self._pending_size = [], 0
+
+    def write(self, rows: np.ndarray):
+        raw = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        if raw.shape[1] != self._width * self._channels:
+            raise ValueError("Row width does not match the PNG size")
+        if self._rows + len(raw) > self._height:
+            raise ValueError("More rows than the PNG height")
+
+        for start in range(0, len(raw), _FILTER_ROWS):
+            block = raw[start : start + _FILTER_ROWS]
+            filtered = _filter_rows(block, self._previous, self._channels)
+            self._previous = block[-1].copy()
+            self._emit(self._compressor.compress(filtered.tobytes()))
+        self._rows += len(raw)
+
+    def close(self):
+        if self._rows != self._height:
+            raise ValueError(f"PNG has {self._rows} of {self._height} rows")
+        self._emit(self._compressor.flush(), final=True)
+        self._chunk(b"IEND", b"")
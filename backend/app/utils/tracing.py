@@ -0,0 +1,317 @@
+"""
+Per-job tracing: timing spans for each request, exported as OTLP/JSON.
+
+Every request gets a job id (its trace id) in a context variable, so spans
+opened anywhere below the endpoint (services, asyncio.to_thread workers,
+subprocess runs) attach to the same trace without passing the id around.
+A sampled trace is exported when its request finishes, as one OTLP
+ExportTraceServiceRequest document per line in TRACE_FILE (the format the
+OpenTelemetry Collector's otlpjsonfile receiver reads) and/or POSTed to an
+OTLP/HTTP collector at TRACE_OTLP_ENDPOINT. Unsampled requests still carry
+a job id for the logs but record nothing.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "ultrapdf-backend")
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "1000"))
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(job_id)s] %(message)s"
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP enum values
+_KIND_INTERNAL = 1
+_KIND_SERVER = 2
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    sampled: bool
+    spans: list["Span"] = field(default_factory=list)
+    dropped: int = 0
+
+
+@dataclass
+class Span:
+    trace: Trace
+    name: str
+    span_id: str
+    parent_id: str | None = None
+    kind: int = _KIND_INTERNAL
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    events: list[tuple[int, str, dict]] = field(default_factory=list)
+    error: str | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def fail(self, message: str):
+        self.error = message
+
+
+class _NoopSpan:
+    """Stands in for a span when the job is not sampled."""
+
+    def set(self, **attributes):
+        pass
+
+    def event(self, name: str, **attributes):
+        pass
+
+    def fail(self, message: str):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "trace_span", default=None
+)
+
+
+def _new_id(n_bytes: int) -> str:
+    return random.getrandbits(n_bytes * 8).to_bytes(n_bytes, "big").hex()
+
+
+def current_job_id() -> str | None:
+    current = _current_span.get()
+    return current.trace.trace_id if current else None
+
+
+def current_span() -> Span | _NoopSpan:
+    current = _current_span.get()
+    return current if current and current.trace.sampled else _NOOP
+
+
+@contextmanager
+def job_trace(name: str, traceparent: str | None = None, **attributes):
+    """
+    Root span of one job. A valid W3C traceparent continues the caller's
+    trace and follows its sampling decision; otherwise TRACE_SAMPLE_RATE
+    decides.
+    """
+    match = _TRACEPARENT_PATTERN.match((traceparent or "").strip().lower())
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        trace = Trace(trace_id=trace_id, sampled=bool(int(flags, 16) & 1))
+    else:
+        parent_id = None
+        trace = Trace(trace_id=_new_id(16), sampled=random.random() < TRACE_SAMPLE_RATE)
+
+    root = Span(
+        trace=trace,
+        name=name,
+        span_id=_new_id(8),
+        parent_id=parent_id,
+        kind=_KIND_SERVER,
+        attributes=attributes,
+    )
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        root.end_ns = time.time_ns()
+        if trace.sampled:
+            trace.spans.append(root)
+            _exporter.submit(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current span; a no-op outside a sampled job."""
+    parent = _current_span.get()
+    if parent is None or not parent.trace.sampled:
+        yield _NOOP
+        return
+
+    child = Span(
+        trace=parent.trace,
+        name=name,
+        span_id=_new_id(8),
+        parent_id=parent.span_id,
+        attributes=attributes,
+    )
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end_ns = time.time_ns()
+        if len(parent.trace.spans) < TRACE_MAX_SPANS:
+            parent.trace.spans.append(child)
+        else:
+            parent.trace.dropped += 1
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+def _otlp_span(span_: Span) -> dict:
+    document = {
+        "traceId": span_.trace.trace_id,
+        "spanId": span_.span_id,
+        "name": span_.name,
+        "kind": span_.kind,
+        "startTimeUnixNano": str(span_.start_ns),
+        "endTimeUnixNano": str(span_.end_ns),
+        "attributes": _otlp_attributes(span_.attributes),
+        "events": [
+            {
+                "timeUnixNano": str(at),
+                "name": name,
+                "attributes": _otlp_attributes(attributes),
+            }
+            for at, name, attributes in span_.events
+        ],
+        "status": (
+            {"code": _STATUS_ERROR, "message": span_.error}
+            if span_.error
+            else {"code": _STATUS_OK}
+        ),
+    }
+    if span_.parent_id:
+        document["parentSpanId"] = span_.parent_id
+    return document
+
+
+def to_otlp(trace: Trace) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest for a finished trace."""
+    resource = {"service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid()}
+    if trace.dropped:
+        resource["ultrapdf.trace.dropped_spans"] = trace.dropped
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes(resource)},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "app.utils.tracing"},
+                        "spans": [_otlp_span(span_) for span_ in trace.spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class _Exporter:
+    """
+    Writes finished traces from a daemon thread, so a slow disk or collector
+    never adds to request latency. Started lazily, i.e. in each worker after
+    the launcher has forked.
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self._queue: queue.Queue[Trace] = queue.Queue(maxsize=max_pending)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace: Trace):
+        if not TRACE_FILE and not TRACE_OTLP_ENDPOINT:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="trace-exporter", daemon=True
+                )
+                self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning(f"Trace export queue full, dropping trace {trace.trace_id}")
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                self._export(json.dumps(to_otlp(trace), separators=(",", ":")))
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+
+    @staticmethod
+    def _export(document: str):
+        if TRACE_FILE:
+            directory = os.path.dirname(TRACE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # One write per line with O_APPEND, so workers sharing the file
+            # do not interleave their documents
+            fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, (document + "\n").encode())
+            finally:
+                os.close(fd)
+
+        if TRACE_OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT,
+                data=document.encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+
+_exporter = _Exporter()
+
+
+def _install_log_record_factory():
+    """Give every log record a job_id attribute (used by LOG_FORMAT)."""
+    previous = logging.getLogRecordFactory()
+
+    def factory(*args, **kwargs):
+        record = previous(*args, **kwargs)
+        record.job_id = current_job_id() or "-"
+        return record
+
+    logging.setLogRecordFactory(factory)
+
+
+_install_log_record_factory()
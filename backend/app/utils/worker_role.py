@@ -0,0 +1,34 @@
+"""
+Worker roles, for running PDF work and background removal as separate pools.
+
+APP_ROLE=all (default) serves every route. APP_ROLE=pdf drops the
+/remove-bg routes, so its workers never import rembg/ONNX Runtime or load a
+model. APP_ROLE=image serves only /remove-bg. Put a reverse proxy in front
+that sends /api/v1/remove-bg* to the image pool and everything else to the
+pdf pool; each pool then preloads and spends memory on its own engines only.
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("all", "pdf", "image")
+IMAGE_ROUTE_PREFIX = "/api/v1/remove-bg"
+
+APP_ROLE = os.getenv("APP_ROLE", "all").strip().lower()
+if APP_ROLE not in ROLES:
+    logger.error(f"Unknown APP_ROLE {APP_ROLE!r}, serving all routes")
+    APP_ROLE = "all"
+
+
+def serves_images() -> bool:
+    return APP_ROLE in ("all", "image")
+
+
+def route_enabled(path: str) -> bool:
+    """Whether this role serves path; routes outside /api (health checks) are always served."""
+    if APP_ROLE == "all" or not path.startswith("/api/"):
+        return True
+    is_image_route = path.startswith(IMAGE_ROUTE_PREFIX)
+    return is_image_route if APP_ROLE == "image" else not is_image_route
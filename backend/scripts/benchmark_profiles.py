@@ -0,0 +1,119 @@
+"""
+Measure output size and run time of each compression profile on a PDF corpus.
+
+    cd backend
+    python scripts/benchmark_profiles.py path/to/corpus --profiles low,medium --json results.json
+
+Profiles come from app.services.compression_profiles, so COMPRESSION_PROFILES_FILE
+can point at a candidate profile file to compare it against the built-ins.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.compression_profiles import profile_names  # noqa: E402
+from app.services.pdf_service import PDFService  # noqa: E402
+
+
+def _corpus(path: str) -> list[Path]:
+    root = Path(path)
+    if root.is_file():
+        return [root]
+    return sorted(p for p in root.rglob("*") if p.suffix.lower() == ".pdf")
+
+
+async def _run(files: list[Path], profiles: list[str], repeat: int) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="profile_bench_") as work_dir:
+        for pdf in files:
+            original = pdf.stat().st_size
+            for profile in profiles:
+                output = os.path.join(work_dir, f"{profile}.pdf")
+                timings = []
+                ok = True
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    ok = await PDFService.compress_pdf(str(pdf), output, profile)
+                    timings.append(time.perf_counter() - started)
+                    if not ok:
+                        break
+
+                size = os.path.getsize(output) if ok and os.path.exists(output) else None
+                results.append(
+                    {
+                        "file": str(pdf),
+                        "profile": profile,
+                        "ok": ok,
+                        "original_bytes": original,
+                        "output_bytes": size,
+                        "ratio": round(size / original, 4) if size and original else None,
+                        "seconds": round(statistics.median(timings), 3),
+                    }
+                )
+                print(
+                    f"{pdf.name[:40]:40} {profile:>10} "
+                    + (
+                        f"{original / 1024:>9.0f} KB -> {size / 1024:>9.0f} KB "
+                        f"({size / original:6.1%}) {statistics.median(timings):7.2f}s"
+                        if size
+                        else "FAILED"
+                    ),
+                    flush=True,
+                )
+                if os.path.exists(output):
+                    os.remove(output)
+    return results
+
+
+def _summary(results: list[dict], profiles: list[str]):
+    print()
+    print(f"{'profile':>10} {'files':>6} {'total in':>12} {'total out':>12} {'ratio':>7} {'median s':>9}")
+    for profile in profiles:
+        rows = [r for r in results if r["profile"] == profile and r["ok"] and r["output_bytes"]]
+        if not rows:
+            print(f"{profile:>10} {0:>6}")
+            continue
+        total_in = sum(r["original_bytes"] for r in rows)
+        total_out = sum(r["output_bytes"] for r in rows)
+        print(
+            f"{profile:>10} {len(rows):>6} {total_in / 1048576:>9.1f} MB {total_out / 1048576:>9.1f} MB "
+            f"{total_out / total_in:>7.1%} {statistics.median(r['seconds'] for r in rows):>9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="PDF file or directory of PDFs (searched recursively)")
+    parser.add_argument("--profiles", default=",".join(profile_names()), help="comma separated profile names")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per file/profile, median time is reported")
+    parser.add_argument("--json", dest="json_path", help="write per-file results to this file")
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = set(profiles) - set(profile_names())
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(sorted(unknown))}")
+
+    files = _corpus(args.corpus)
+    if not files:
+        parser.error(f"no PDF files found in {args.corpus}")
+
+    results = asyncio.run(_run(files, profiles, max(1, args.repeat)))
+    _summary(results, profiles)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
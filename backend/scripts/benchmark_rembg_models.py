@@ -0,0 +1,129 @@
+"""
+Compare rembg model variants (fp32, int8, fp16) on a folder of photos.
+
+    cd backend
+    python scripts/benchmark_rembg_models.py path/to/photos --variants fp32,int8
+    python scripts/benchmark_rembg_models.py photos --model isnet-general-use --json variants.json
+
+Each variant runs with the same session options as the API (REMBG_GRAPH_OPTIMIZATION,
+REMBG_INTRA_OP_THREADS, ...). Reported per variant: median inference time, images
+per second, speed-up against fp32, and how close its masks are to the fp32 masks
+(mean IoU of the thresholded masks and mean absolute alpha difference).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from app.services.image_service import (  # noqa: E402
+    MODEL_VARIANTS,
+    _get_session,
+    _is_local_model_available,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _corpus(path: str) -> list[Path]:
+    p = Path(path)
+    if p.is_file():
+        return [p]
+    return sorted(f for f in p.rglob("*") if f.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def _masks(session, images: list[Image.Image], repeat: int) -> tuple[list[np.ndarray], list[float]]:
+    masks, seconds = [], []
+    # Warm-up: first run includes graph optimization and allocation
+    session.predict(images[0])
+    for img in images:
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            mask = session.predict(img)[0]
+            runs.append(time.perf_counter() - started)
+        masks.append(np.asarray(mask.convert("L"), dtype=np.float32) / 255.0)
+        seconds.append(statistics.median(runs))
+    return masks, seconds
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    a, b = a >= 0.5, b >= 0.5
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="image file or directory of images (searched recursively)")
+    parser.add_argument("--model", default=os.getenv("REMBG_MODEL_NAME", "isnet-general-use"))
+    parser.add_argument("--variants", default="fp32,int8", help="comma separated: fp32,int8,fp16")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per image, median time is reported")
+    parser.add_argument("--json", dest="json_path", help="write the summary to this file")
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = set(variants) - set(MODEL_VARIANTS)
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(sorted(unknown))}")
+    if "fp32" not in variants:
+        variants.insert(0, "fp32")
+    missing = [v for v in variants if not _is_local_model_available(args.model, v)]
+    if missing:
+        parser.error(
+            f"{args.model} has no local {', '.join(missing)} model, "
+            "see scripts/quantize_rembg_model.py"
+        )
+
+    files = _corpus(args.corpus)
+    if not files:
+        parser.error(f"no images found in {args.corpus}")
+    images = []
+    for f in files:
+        with Image.open(f) as img:
+            images.append(img.convert("RGB"))
+
+    results = {}
+    for variant in variants:
+        session = _get_session(args.model, variant)
+        masks, seconds = _masks(session, images, max(1, args.repeat))
+        results[variant] = {"masks": masks, "seconds": seconds}
+
+    reference = results["fp32"]
+    baseline = statistics.median(reference["seconds"])
+    summary = []
+    print(f"{args.model}, {len(images)} images")
+    print(f"{'variant':>8} {'median ms':>10} {'img/s':>7} {'speed-up':>9} {'IoU':>7} {'abs diff':>9}")
+    for variant in variants:
+        seconds = results[variant]["seconds"]
+        median = statistics.median(seconds)
+        pairs = list(zip(results[variant]["masks"], reference["masks"]))
+        row = {
+            "variant": variant,
+            "median_ms": round(median * 1000, 1),
+            "images_per_second": round(len(seconds) / sum(seconds), 2),
+            "speedup": round(baseline / median, 2),
+            "mean_iou": round(statistics.mean(_iou(a, b) for a, b in pairs), 4),
+            "mean_abs_diff": round(statistics.mean(float(np.abs(a - b).mean()) for a, b in pairs), 4),
+        }
+        summary.append(row)
+        print(
+            f"{variant:>8} {row['median_ms']:>10.1f} {row['images_per_second']:>7.2f} "
+            f"{row['speedup']:>8.2f}x {row['mean_iou']:>7.4f} {row['mean_abs_diff']:>9.4f}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "images": len(images), "variants": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
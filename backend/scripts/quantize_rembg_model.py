@@ -0,0 +1,119 @@
+"""
+Create INT8 and FP16 variants of a rembg model for REMBG_MODEL_VARIANT.
+
+    cd backend
+    pip install onnx onnxconverter-common   # conversion tools, not needed at runtime
+    python scripts/quantize_rembg_model.py --model isnet-general-use --variants int8,fp16
+    python scripts/quantize_rembg_model.py --variants int8 --calibration path/to/photos
+
+Variants are written next to the FP32 model in U2NET_HOME as
+<model>.int8.onnx and <model>.fp16.onnx.
+
+- int8: static QDQ quantization calibrated on --calibration images (best CPU
+  speed-up, convolutions run as INT8). Without calibration images, dynamic
+  quantization is used, which only stores weights as INT8.
+- fp16: weights and activations in half precision, inputs/outputs kept FP32
+  so the rembg pre/post-processing is unchanged. Mostly useful on GPUs.
+
+Compare a variant against FP32 with scripts/benchmark_rembg_models.py before
+switching production to it.
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.image_service import MODEL_VARIANTS, _model_filename, _u2net_home  # noqa: E402
+
+# IS-Net / U2-Net input: 1024x1024 RGB scaled to [0, 1], minus 0.5 (see rembg's DisSession)
+_INPUT_SIZE = 1024
+_CALIBRATION_IMAGES = 32
+
+
+def _calibration_reader(model_path: str, image_dir: str):
+    import numpy as np
+    import onnxruntime as ort
+    from PIL import Image
+    from onnxruntime.quantization import CalibrationDataReader
+
+    input_name = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    images = sorted(
+        p for p in Path(image_dir).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")
+    )[:_CALIBRATION_IMAGES]
+    if not images:
+        raise SystemExit(f"No calibration images found in {image_dir}")
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._images = iter(images)
+
+        def get_next(self):
+            path = next(self._images, None)
+            if path is None:
+                return None
+            with Image.open(path) as img:
+                rgb = img.convert("RGB").resize((_INPUT_SIZE, _INPUT_SIZE), Image.Resampling.LANCZOS)
+            pixels = np.asarray(rgb, dtype=np.float32) / 255.0 - 0.5
+            return {input_name: pixels.transpose(2, 0, 1)[np.newaxis]}
+
+    print(f"Calibrating on {len(images)} images", flush=True)
+    return Reader()
+
+
+def quantize_int8(source: str, target: str, calibration: str | None):
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    if calibration:
+        quantize_static(
+            source,
+            target,
+            _calibration_reader(source, calibration),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    else:
+        quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+
+
+def convert_fp16(source: str, target: str):
+    import onnx
+    from onnxconverter_common import float16
+
+    model = onnx.load(source)
+    onnx.save(float16.convert_float_to_float16(model, keep_io_types=True), target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("REMBG_MODEL_NAME", "isnet-general-use"))
+    parser.add_argument("--variants", default="int8", help="comma separated: int8,fp16")
+    parser.add_argument("--calibration", help="folder of representative photos for static INT8 quantization")
+    parser.add_argument("--model-dir", default=_u2net_home(), help="default: U2NET_HOME")
+    args = parser.parse_args()
+
+    source = os.path.join(args.model_dir, _model_filename(args.model))
+    if not os.path.exists(source):
+        raise SystemExit(f"FP32 model not found: {source}")
+
+    for variant in [v.strip() for v in args.variants.split(",") if v.strip()]:
+        if variant not in MODEL_VARIANTS or variant == "fp32":
+            raise SystemExit(f"Unknown variant {variant!r}, expected int8 or fp16")
+        target = os.path.join(args.model_dir, _model_filename(args.model, variant))
+        print(f"{args.model}: writing {variant} variant to {target}", flush=True)
+        if variant == "int8":
+            quantize_int8(source, target, args.calibration)
+        else:
+            convert_fp16(source, target)
+        print(
+            f"  {os.path.getsize(source) / 1e6:.1f} MB -> {os.path.getsize(target) / 1e6:.1f} MB",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()